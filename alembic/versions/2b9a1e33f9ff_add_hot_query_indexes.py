@@ -0,0 +1,59 @@
+"""add hot query indexes, drop redundant primary key indexes
+
+Revision ID: 2b9a1e33f9ff
+Revises: e7fe0007d4ea
+Create Date: 2025-09-20 10:00:00.000000
+
+The ``(crime_id, vote_type)`` indexes on votes/anonymous_votes cover the
+``crime_id`` lookup and let the per-crime tally in ``get_votes`` be answered
+from the index alone.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b9a1e33f9ff'
+down_revision: Union[str, None] = 'e7fe0007d4ea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Primary keys are already indexed by the database
+    op.drop_index('ix_users_user_id', table_name='users')
+    op.drop_index('ix_crimes_crime_id', table_name='crimes')
+    op.drop_index('ix_votes_vote_id', table_name='votes')
+    op.drop_index('ix_subscriptions_id', table_name='subscriptions')
+    op.drop_index('ix_flagged_crimes_id', table_name='flagged_crimes')
+    op.drop_index('ix_sos_alerts_id', table_name='sos_alerts')
+
+    op.create_index('ix_users_username', 'users', ['username'], unique=False)
+    op.create_index('ix_crimes_created_at', 'crimes', ['created_at'], unique=False)
+    op.create_index('ix_crimes_crime_type_created_at', 'crimes', ['crime_type', 'created_at'], unique=False)
+    op.create_index('ix_votes_crime_id_vote_type', 'votes', ['crime_id', 'vote_type'], unique=False)
+    op.create_index('ix_anonymous_votes_crime_id_vote_type', 'anonymous_votes', ['crime_id', 'vote_type'], unique=False)
+    op.create_index('ix_subscriptions_user_id', 'subscriptions', ['user_id'], unique=False)
+    op.create_index('ix_flagged_crimes_crime_id', 'flagged_crimes', ['crime_id'], unique=False)
+    op.create_index('ix_sos_alerts_created_at', 'sos_alerts', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sos_alerts_created_at', table_name='sos_alerts')
+    op.drop_index('ix_flagged_crimes_crime_id', table_name='flagged_crimes')
+    op.drop_index('ix_subscriptions_user_id', table_name='subscriptions')
+    op.drop_index('ix_anonymous_votes_crime_id_vote_type', table_name='anonymous_votes')
+    op.drop_index('ix_votes_crime_id_vote_type', table_name='votes')
+    op.drop_index('ix_crimes_crime_type_created_at', table_name='crimes')
+    op.drop_index('ix_crimes_created_at', table_name='crimes')
+    op.drop_index('ix_users_username', table_name='users')
+
+    op.create_index('ix_sos_alerts_id', 'sos_alerts', ['id'], unique=False)
+    op.create_index('ix_flagged_crimes_id', 'flagged_crimes', ['id'], unique=False)
+    op.create_index('ix_subscriptions_id', 'subscriptions', ['id'], unique=True)
+    op.create_index('ix_votes_vote_id', 'votes', ['vote_id'], unique=True)
+    op.create_index('ix_crimes_crime_id', 'crimes', ['crime_id'], unique=True)
+    op.create_index('ix_users_user_id', 'users', ['user_id'], unique=True)
@@ -0,0 +1,34 @@
+"""add crimes.canonical_id for duplicate reports
+
+Revision ID: 3c3871ca4253
+Revises: c77baf40af46
+Create Date: 2025-09-27 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c3871ca4253'
+down_revision: Union[str, None] = 'c77baf40af46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.add_column(sa.Column('canonical_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_crimes_canonical_id_crimes', 'crimes', ['canonical_id'], ['crime_id'], ondelete='SET NULL'
+        )
+        batch_op.create_index('ix_crimes_canonical_id', ['canonical_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.drop_index('ix_crimes_canonical_id')
+        batch_op.drop_constraint('fk_crimes_canonical_id_crimes', type_='foreignkey')
+        batch_op.drop_column('canonical_id')
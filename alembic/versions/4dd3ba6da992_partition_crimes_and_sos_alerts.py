@@ -0,0 +1,47 @@
+"""partition crimes and sos_alerts by month (PostgreSQL with PARTITION_BY_MONTH)
+
+Drops the foreign keys that point at crimes (a partitioned table cannot be
+their target) and cannot be downgraded; see app/partitions.py.
+
+Revision ID: 4dd3ba6da992
+Revises: b8ce5c00a4f3
+Create Date: 2025-10-09 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app import partitions
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4dd3ba6da992'
+down_revision: Union[str, None] = 'b8ce5c00a4f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if not partitions.enabled(conn):
+        return
+    tables = [t for t in partitions.PARTITIONED_TABLES if not partitions.is_partitioned(conn, t)]
+    cutover = partitions.cutover_month()
+
+    # batched fill, validation and concurrent index builds, outside the migration transaction
+    with op.get_context().autocommit_block():
+        for table in tables:
+            partitions.prepare(conn, table, cutover)
+    for table in tables:
+        partitions.swap(conn, table, cutover)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    partitioned = [t for t in partitions.PARTITIONED_TABLES if partitions.is_partitioned(conn, t)]
+    if partitioned:
+        raise NotImplementedError(
+            f"{', '.join(partitioned)} are partitioned and the foreign keys into crimes were dropped; "
+            "restore a dump taken before this revision instead of downgrading"
+        )
@@ -0,0 +1,30 @@
+"""add crimes.thumbnail_url
+
+Revision ID: 58ce1a758d91
+Revises: 4dd3ba6da992
+Create Date: 2025-10-10 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '58ce1a758d91'
+down_revision: Union[str, None] = '4dd3ba6da992'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('crimes', 'crimes_archive'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('thumbnail_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    for table in ('crimes_archive', 'crimes'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('thumbnail_url')
@@ -0,0 +1,46 @@
+"""add flag status and hidden crimes for the moderation queue
+
+Revision ID: 5e8de23db815
+Revises: 6732f7eda7e9
+Create Date: 2025-10-06 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8de23db815'
+down_revision: Union[str, None] = '6732f7eda7e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.add_column(sa.Column('is_hidden', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index('ix_crimes_is_hidden', ['is_hidden'], unique=False)
+
+    with op.batch_alter_table('flagged_crimes') as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(), server_default='open', nullable=False))
+        batch_op.add_column(sa.Column('resolved_by', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('resolved_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_flagged_crimes_resolved_by_users', 'users', ['resolved_by'], ['user_id']
+        )
+        batch_op.create_index('ix_flagged_crimes_status_crime_id', ['status', 'crime_id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('flagged_crimes') as batch_op:
+        batch_op.drop_index('ix_flagged_crimes_status_crime_id')
+        batch_op.drop_constraint('fk_flagged_crimes_resolved_by_users', type_='foreignkey')
+        batch_op.drop_column('resolved_at')
+        batch_op.drop_column('resolved_by')
+        batch_op.drop_column('status')
+
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.drop_index('ix_crimes_is_hidden')
+        batch_op.drop_column('is_hidden')
@@ -0,0 +1,33 @@
+"""add crimes.trust_rank for time-decayed trust scores
+
+Existing votes and flags are not scored by this migration; run
+POST /admin/scores/recompute once after upgrading.
+
+Revision ID: 602cdc728739
+Revises: 3c3871ca4253
+Create Date: 2025-10-02 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '602cdc728739'
+down_revision: Union[str, None] = '3c3871ca4253'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.add_column(sa.Column('trust_rank', sa.Float(), server_default='0', nullable=False))
+        batch_op.create_index('ix_crimes_trust_rank', ['trust_rank'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.drop_index('ix_crimes_trust_rank')
+        batch_op.drop_column('trust_rank')
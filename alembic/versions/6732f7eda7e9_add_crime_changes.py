@@ -0,0 +1,35 @@
+"""add crime_changes log for the sync feed
+
+Revision ID: 6732f7eda7e9
+Revises: 602cdc728739
+Create Date: 2025-10-04 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6732f7eda7e9'
+down_revision: Union[str, None] = '602cdc728739'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'crime_changes',
+        sa.Column('change_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('change_id'),
+    )
+    op.create_index('ix_crime_changes_changed_at', 'crime_changes', ['changed_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_crime_changes_changed_at', table_name='crime_changes')
+    op.drop_table('crime_changes')
@@ -0,0 +1,99 @@
+"""add crimes.deleted_at and the archive tier tables
+
+Revision ID: b8ce5c00a4f3
+Revises: 5e8de23db815
+Create Date: 2025-10-08 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8ce5c00a4f3'
+down_revision: Union[str, None] = '5e8de23db815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_crimes_deleted_at', ['deleted_at'], unique=False)
+
+    op.create_table(
+        'crimes_archive',
+        sa.Column('crime_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('crime_type', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('media_url', sa.String(), nullable=True),
+        sa.Column('canonical_id', sa.Integer(), nullable=True),
+        sa.Column('trust_rank', sa.Float(), nullable=False),
+        sa.Column('is_hidden', sa.Boolean(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('crime_id'),
+    )
+    op.create_index('ix_crimes_archive_created_at', 'crimes_archive', ['created_at'], unique=False)
+
+    op.create_table(
+        'votes_archive',
+        sa.Column('vote_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('vote_type', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('vote_id'),
+    )
+    op.create_index('ix_votes_archive_crime_id', 'votes_archive', ['crime_id'], unique=False)
+
+    op.create_table(
+        'anonymous_votes_archive',
+        sa.Column('vote_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('ip_address', sa.String(), nullable=False),
+        sa.Column('vote_type', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('vote_id'),
+    )
+    op.create_index('ix_anonymous_votes_archive_crime_id', 'anonymous_votes_archive', ['crime_id'], unique=False)
+
+    op.create_table(
+        'flagged_crimes_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('flagged_by', sa.Integer(), nullable=True),
+        sa.Column('reason', sa.String(), nullable=True),
+        sa.Column('is_flagged', sa.Boolean(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('resolved_by', sa.Integer(), nullable=True),
+        sa.Column('resolved_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_flagged_crimes_archive_crime_id', 'flagged_crimes_archive', ['crime_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_flagged_crimes_archive_crime_id', table_name='flagged_crimes_archive')
+    op.drop_table('flagged_crimes_archive')
+    op.drop_index('ix_anonymous_votes_archive_crime_id', table_name='anonymous_votes_archive')
+    op.drop_table('anonymous_votes_archive')
+    op.drop_index('ix_votes_archive_crime_id', table_name='votes_archive')
+    op.drop_table('votes_archive')
+    op.drop_index('ix_crimes_archive_created_at', table_name='crimes_archive')
+    op.drop_table('crimes_archive')
+
+    with op.batch_alter_table('crimes') as batch_op:
+        batch_op.drop_index('ix_crimes_deleted_at')
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,41 @@
+"""add auth_sessions for refresh tokens and revocation
+
+Revision ID: c77baf40af46
+Revises: 2b9a1e33f9ff
+Create Date: 2025-09-24 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c77baf40af46'
+down_revision: Union[str, None] = '2b9a1e33f9ff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'auth_sessions',
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('refresh_token_hash', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('session_id'),
+    )
+    op.create_index('ix_auth_sessions_user_id', 'auth_sessions', ['user_id'], unique=False)
+    op.create_index('ix_auth_sessions_revoked_at', 'auth_sessions', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_auth_sessions_revoked_at', table_name='auth_sessions')
+    op.drop_index('ix_auth_sessions_user_id', table_name='auth_sessions')
+    op.drop_table('auth_sessions')
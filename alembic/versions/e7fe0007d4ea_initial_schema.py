@@ -0,0 +1,137 @@
+"""initial schema
+
+Revision ID: e7fe0007d4ea
+Revises:
+Create Date: 2025-09-16 10:00:00.000000
+
+Mirrors the tables that ``create_db_and_tables`` has been creating so far.
+Existing databases can be marked with ``alembic stamp e7fe0007d4ea``.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7fe0007d4ea'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('fullname', sa.String(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_index('ix_users_user_id', 'users', ['user_id'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.create_table(
+        'crimes',
+        sa.Column('crime_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('crime_type', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('media_url', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('crime_id'),
+    )
+    op.create_index('ix_crimes_crime_id', 'crimes', ['crime_id'], unique=True)
+
+    op.create_table(
+        'sos_alerts',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('message', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sos_alerts_id', 'sos_alerts', ['id'], unique=False)
+
+    op.create_table(
+        'subscriptions',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('radius', sa.Float(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_subscriptions_id', 'subscriptions', ['id'], unique=True)
+
+    op.create_table(
+        'anonymous_votes',
+        sa.Column('vote_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('ip_address', sa.String(), nullable=False),
+        sa.Column('vote_type', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['crime_id'], ['crimes.crime_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('vote_id'),
+        sa.UniqueConstraint('crime_id', 'ip_address', name='unique_anon_vote'),
+    )
+
+    op.create_table(
+        'flagged_crimes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('flagged_by', sa.Integer(), nullable=True),
+        sa.Column('reason', sa.String(), nullable=True),
+        sa.Column('is_flagged', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['crime_id'], ['crimes.crime_id']),
+        sa.ForeignKeyConstraint(['flagged_by'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_flagged_crimes_id', 'flagged_crimes', ['id'], unique=False)
+
+    op.create_table(
+        'votes',
+        sa.Column('vote_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('crime_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('vote_type', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['crime_id'], ['crimes.crime_id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('vote_id'),
+        sa.UniqueConstraint('crime_id', 'user_id', name='unique_user_vote'),
+    )
+    op.create_index('ix_votes_vote_id', 'votes', ['vote_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_votes_vote_id', table_name='votes')
+    op.drop_table('votes')
+    op.drop_index('ix_flagged_crimes_id', table_name='flagged_crimes')
+    op.drop_table('flagged_crimes')
+    op.drop_table('anonymous_votes')
+    op.drop_index('ix_subscriptions_id', table_name='subscriptions')
+    op.drop_table('subscriptions')
+    op.drop_index('ix_sos_alerts_id', table_name='sos_alerts')
+    op.drop_table('sos_alerts')
+    op.drop_index('ix_crimes_crime_id', table_name='crimes')
+    op.drop_table('crimes')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_user_id', table_name='users')
+    op.drop_table('users')
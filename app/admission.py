@@ -0,0 +1,191 @@
+"""
+Admission control and load shedding.
+
+Every request takes one of `limit` concurrency slots on this worker for
+as long as it runs, except reads that join another's flight
+(app/single_flight.py): they wait on the leader, which holds the one
+slot. When all slots are busy, requests queue by priority class:
+
+    sos > auth > writes > reads > admin
+
+A freed slot goes to the oldest waiter of the highest class. A waiter
+that queues longer than its class allows gets 503 with Retry-After.
+Admin and read requests give up first, after ADMISSION_TARGET_QUEUE_MS
+and twice that. Writes wait 4x and auth 8x. SOS never gives up. So under
+overload the analytics and list endpoints shed load and SOS keeps going.
+
+The limit adapts with AIMD on service time, and only while all slots
+are busy: with a free slot a slow request is slow by itself, not because
+of contention. Service time is judged against the route it ran: each
+route keeps a baseline, its fastest recent time, and a request is slow
+when it exceeds both ADMISSION_TARGET_LATENCY_MS and
+ADMISSION_LATENCY_TOLERANCE times that baseline. So media uploads,
+bcrypt logins and admin job runs, which are slow at any load, do not
+drag the limit down. A fast request raises the limit by 1/limit, which
+is about one slot per round of requests. A slow one cuts it by 10%, at
+most once per target latency, down to ADMISSION_MIN_LIMIT. The worker
+thus settles near the concurrency it can serve without slowing down,
+instead of letting every request slow down together.
+
+Counters are at GET /admin/admission.
+"""
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_INITIAL_LIMIT = float(os.getenv("ADMISSION_INITIAL_LIMIT", "32"))
+ADMISSION_MIN_LIMIT = float(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = float(os.getenv("ADMISSION_MAX_LIMIT", "256"))
+ADMISSION_TARGET_LATENCY_MS = float(os.getenv("ADMISSION_TARGET_LATENCY_MS", "500"))
+ADMISSION_TARGET_QUEUE_MS = float(os.getenv("ADMISSION_TARGET_QUEUE_MS", "100"))
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "1000"))
+
+# highest priority first
+CLASSES = ["sos", "auth", "writes", "reads", "admin"]
+# how long each class may queue, in multiples of the target; None waits for a slot
+QUEUE_BUDGET = {"sos": None, "auth": 8, "writes": 4, "reads": 2, "admin": 1}
+_DECREASE = 0.9
+# how fast a route's baseline creeps up towards slower samples, so it recovers from one lucky request
+_BASELINE_DRIFT = 0.01
+
+_SOS = re.compile(r"/sos/send_sos")
+
+
+def classify(method: str, path: str) -> str:
+    if _SOS.fullmatch(path):
+        return "sos"
+    if path.startswith("/admin/") or path.startswith("/sos/"):
+        return "admin"  # the rest of /sos is the admin alert list
+    if path.startswith("/auth/"):
+        return "auth"
+    return "reads" if method in ("GET", "HEAD", "OPTIONS") else "writes"
+
+
+class AdmissionController:
+    def __init__(self, initial: float = ADMISSION_INITIAL_LIMIT, min_limit: float = ADMISSION_MIN_LIMIT,
+                 max_limit: float = ADMISSION_MAX_LIMIT, target_latency_ms: float = ADMISSION_TARGET_LATENCY_MS,
+                 target_queue_ms: float = ADMISSION_TARGET_QUEUE_MS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 tolerance: float = ADMISSION_LATENCY_TOLERANCE):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency_ms / 1000
+        self.target_queue = target_queue_ms / 1000
+        self.max_queue = max_queue
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in CLASSES}
+        self._last_decrease = 0.0
+        self._baselines: Dict[str, float] = {}
+        self.admitted = {name: 0 for name in CLASSES}
+        self.shed = {name: 0 for name in CLASSES}
+
+    def _queued(self, upto: Optional[str] = None) -> int:
+        names = CLASSES if upto is None else CLASSES[:CLASSES.index(upto) + 1]
+        return sum(len(self._queues[name]) for name in names)
+
+    async def acquire(self, priority: str) -> bool:
+        """Take a slot, waiting behind higher classes; False means shed."""
+        if self.in_flight < int(self.limit) and not self._queued(priority):
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return True
+        if self._queued() >= self.max_queue and priority != "sos":
+            self.shed[priority] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._queues[priority]
+        queue.append(waiter)
+        budget = QUEUE_BUDGET[priority]
+        try:
+            # the slot is handed over by release(), which counts it in in_flight
+            await asyncio.wait_for(waiter, None if budget is None else budget * self.target_queue)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                self.shed[priority] += 1
+                return False
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+        self.admitted[priority] += 1
+        return True
+
+    def release(self, service_time: float, saturated: bool, route: str = ""):
+        self.in_flight -= 1
+        self._adapt(service_time, saturated, route)
+        self._wake()
+
+    def _baseline(self, route: str, service_time: float) -> float:
+        baseline = self._baselines.get(route, service_time)
+        if service_time > baseline:
+            baseline += (service_time - baseline) * _BASELINE_DRIFT
+        else:
+            baseline = service_time
+        self._baselines[route] = baseline
+        return baseline
+
+    def _adapt(self, service_time: float, saturated: bool, route: str):
+        baseline = self._baseline(route, service_time)
+        if not saturated:
+            return
+        now = time.monotonic()
+        if service_time > max(self.target_latency, baseline * self.tolerance):
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * _DECREASE)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _wake(self):
+        for name in CLASSES:
+            queue = self._queues[name]
+            while queue and self.in_flight < int(self.limit):
+                waiter = queue.popleft()
+                if not waiter.done():  # timed out waiters are already cancelled
+                    self.in_flight += 1
+                    waiter.set_result(True)
+            if self.in_flight >= int(self.limit):
+                return
+
+    def status(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": {name: len(self._queues[name]) for name in CLASSES},
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+        }
+
+
+controller = AdmissionController()
+
+
+async def admission(request: Request, call_next):
+    if not ADMISSION_ENABLED:
+        return await call_next(request)
+    ctl = controller
+    priority = classify(request.method, request.url.path)
+    if not await ctl.acquire(priority):
+        return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                            content={"detail": "Server is overloaded, retry shortly"})
+    saturated = ctl.in_flight >= int(ctl.limit)
+    started = time.monotonic()
+    try:
+        return await call_next(request)
+    finally:
+        # the router leaves the matched route in the shared scope
+        route = request.scope.get("route")
+        ctl.release(time.monotonic() - started, saturated,
+                    f"{request.method} {route.path}" if route is not None else priority)
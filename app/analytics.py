@@ -0,0 +1,243 @@
+"""
+Columnar in-memory copy of the live crimes tier for analytics.
+
+Every non-deleted crime in `crimes` (hidden ones included, as the admin
+statistics count them) is held as one row across a few numpy arrays:
+
+- crime_id int64
+- latitude, longitude float32 (about a metre of precision)
+- type_code int32, indexing the `types` dictionary of crime_type strings
+- created_at int64 microseconds since the epoch (UTC)
+- duplicate, hidden bool
+
+That is 30 bytes a row, where a loaded ORM object with its instance
+state takes well over a kilobyte. Aggregations are masks and bincounts
+over the arrays instead of GROUP BY queries.
+
+The copy is built once from the database. After that it is patched from
+the crime change log: rows for crime ids changed since the saved cursor
+are dropped and re-read. This happens on query, at most every
+ANALYTICS_MAX_LAG_SECONDS; with the default of 0 every query checks the
+log's head first, which is one primary key lookup. Every ANALYTICS_REBUILD_SECONDS, or when the
+cursor has been pruned from the log, it is built from scratch again.
+Each refresh swaps in a new set of arrays, so a query never sees a
+half-applied refresh.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import change_log, models
+
+load_dotenv()
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Look for new changes at most this often; statistics can be this stale
+ANALYTICS_MAX_LAG_SECONDS = float(os.getenv("ANALYTICS_MAX_LAG_SECONDS", "0"))
+ANALYTICS_REBUILD_SECONDS = float(os.getenv("ANALYTICS_REBUILD_SECONDS", "3600"))
+ANALYTICS_REFRESH_BATCH = 5000
+# beyond this many changed crimes in one refresh, rebuilding is cheaper
+ANALYTICS_REBUILD_RATIO = 0.2
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+_ID_CHUNK = 500
+
+
+def to_micros(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+class CrimeColumns:
+    """One generation of the columns. Never modified; refreshes build a new one."""
+
+    NAMES = ("crime_id", "latitude", "longitude", "type_code", "created_at", "duplicate", "hidden")
+
+    def __init__(self, crime_id, latitude, longitude, type_code, created_at, duplicate, hidden):
+        self.crime_id = crime_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.type_code = type_code
+        self.created_at = created_at
+        self.duplicate = duplicate
+        self.hidden = hidden
+
+    def __len__(self):
+        return len(self.crime_id)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.NAMES)
+
+    def take(self, rows) -> "CrimeColumns":
+        return CrimeColumns(*(getattr(self, name)[rows] for name in self.NAMES))
+
+    def concat(self, other: "CrimeColumns") -> "CrimeColumns":
+        return CrimeColumns(*(np.concatenate([getattr(self, name), getattr(other, name)]) for name in self.NAMES))
+
+
+class AnalyticsSnapshot:
+    def __init__(self, max_lag: float = ANALYTICS_MAX_LAG_SECONDS, rebuild_seconds: float = ANALYTICS_REBUILD_SECONDS,
+                 batch_size: int = ANALYTICS_REFRESH_BATCH):
+        self.max_lag = max_lag
+        self.rebuild_seconds = rebuild_seconds
+        self.batch_size = batch_size
+        self.types: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._columns: Optional[CrimeColumns] = None
+        self.cursor = 0
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.refreshes = 0
+
+    def type_code(self, crime_type: str, create: bool = True) -> Optional[int]:
+        code = self._codes.get(crime_type)
+        if code is None and create:
+            # append before publishing the code, so readers can always resolve it
+            self.types.append(crime_type)
+            code = self._codes[crime_type] = len(self.types) - 1
+        return code
+
+    @property
+    def columns(self) -> Optional[CrimeColumns]:
+        return self._columns
+
+    # LOADING
+
+    def _read(self, db: Session, *criteria) -> CrimeColumns:
+        crimes = models.Crimes
+        rows = db.query(
+            crimes.crime_id, crimes.latitude, crimes.longitude, crimes.crime_type,
+            crimes.created_at, crimes.canonical_id, crimes.is_hidden,
+        ).filter(crimes.deleted_at.is_(None), *criteria).all()
+        n = len(rows)
+        return CrimeColumns(
+            np.fromiter((r.crime_id for r in rows), np.int64, n),
+            np.fromiter((r.latitude for r in rows), np.float32, n),
+            np.fromiter((r.longitude for r in rows), np.float32, n),
+            np.fromiter((self.type_code(r.crime_type) for r in rows), np.int32, n),
+            np.fromiter((to_micros(r.created_at) for r in rows), np.int64, n),
+            np.fromiter((r.canonical_id is not None for r in rows), bool, n),
+            np.fromiter((bool(r.is_hidden) for r in rows), bool, n),
+        )
+
+    def build(self, db: Session):
+        # changes from here on are applied again by the next refresh; re-reading a row is harmless
+        cursor = change_log.head(db)
+        self._columns = self._read(db)
+        self.cursor = cursor
+        self._built_at = self._refreshed_at = time.monotonic()
+        self.rebuilds += 1
+
+    def refresh(self, db: Session):
+        """Apply changes logged since the cursor, or rebuild if the log no longer has them."""
+        head = change_log.head(db)
+        if head == self.cursor:
+            self._refreshed_at = time.monotonic()
+            return
+        oldest = change_log.oldest(db)
+        if self.cursor > head or (oldest is not None and self.cursor < oldest - 1):
+            return self.build(db)
+
+        changed, cursor = set(), self.cursor
+        while True:
+            rows = change_log.changes_since(db, cursor, self.batch_size)
+            changed.update(row.crime_id for row in rows)
+            if rows:
+                cursor = rows[-1].change_id
+            if len(rows) < self.batch_size:
+                break
+            if len(changed) > ANALYTICS_REBUILD_RATIO * len(self._columns):
+                return self.build(db)
+
+        if changed:
+            ids = sorted(changed)
+            fresh = [self._read(db, models.Crimes.crime_id.in_(ids[i:i + _ID_CHUNK]))
+                     for i in range(0, len(ids), _ID_CHUNK)]
+            columns = self._columns.take(~np.isin(self._columns.crime_id, ids))
+            for part in fresh:
+                columns = columns.concat(part)
+            self._columns = columns
+        self.cursor = cursor
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    def ensure_fresh(self, db: Session):
+        if self._columns is not None and time.monotonic() - self._refreshed_at < self.max_lag:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._columns is None or now - self._built_at > self.rebuild_seconds:
+                self.build(db)
+            elif now - self._refreshed_at >= self.max_lag:
+                self.refresh(db)
+
+    # QUERIES
+
+    def mask(self, columns: CrimeColumns, since: Optional[datetime] = None, until: Optional[datetime] = None,
+             collapse_duplicates: bool = False):
+        rows = np.ones(len(columns), dtype=bool)
+        if since is not None:
+            rows &= columns.created_at >= to_micros(since)
+        if until is not None:
+            rows &= columns.created_at < to_micros(until)
+        if collapse_duplicates:
+            rows &= ~columns.duplicate
+        return rows
+
+    def statistics(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   collapse_duplicates: bool = False, top: int = 5) -> dict:
+        """Same shape as GET /admin/statistics."""
+        columns = self._columns
+        rows = self.mask(columns, since, until, collapse_duplicates)
+
+        counts = np.bincount(columns.type_code[rows], minlength=len(self.types))
+        top_types = [int(code) for code in np.argsort(-counts, kind="stable")[:top] if counts[code]]
+
+        # a location is the exact coordinate pair, packed into one integer key
+        keys = (columns.latitude[rows].view(np.uint32).astype(np.uint64) << np.uint64(32)) \
+            | columns.longitude[rows].view(np.uint32)
+        places, place_counts = np.unique(keys, return_counts=True)
+        hottest = np.argsort(-place_counts, kind="stable")[:top]
+        latitudes = (places[hottest] >> np.uint64(32)).astype(np.uint32).view(np.float32)
+        longitudes = (places[hottest] & np.uint64(0xFFFFFFFF)).astype(np.uint32).view(np.float32)
+
+        return {
+            "total_reports": int(rows.sum()),
+            "top_crime_types": [{"type": self.types[code], "count": int(counts[code])} for code in top_types],
+            "hotspots": [
+                {
+                    # float32 carries about 7 significant digits
+                    "location": {"latitude": round(float(lat), 5), "longitude": round(float(lng), 5)},
+                    "crime_count": int(count),
+                }
+                for lat, lng, count in zip(latitudes, longitudes, place_counts[hottest])
+            ],
+        }
+
+    def status(self) -> dict:
+        columns = self._columns
+        rows = len(columns) if columns is not None else 0
+        nbytes = columns.nbytes if columns is not None else 0
+        return {
+            "rows": rows,
+            "crime_types": len(self.types),
+            "bytes": nbytes,
+            "bytes_per_row": nbytes / rows if rows else 0.0,
+            "cursor": self.cursor,
+            "seconds_since_refresh": time.monotonic() - self._refreshed_at if columns is not None else None,
+            "rebuilds": self.rebuilds,
+            "refreshes": self.refreshes,
+        }
+
+
+snapshot = AnalyticsSnapshot()
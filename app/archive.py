@@ -0,0 +1,100 @@
+"""
+Moves old crimes, with their votes and flags, from the live tables into
+the *_archive tables so the hot tables only hold recent data.
+
+Each batch is copied with INSERT ... SELECT and removed from the live
+tables in one transaction. A crime whose duplicates are still live stays
+until they age out too, and moves together with them, so live rows never
+point into the archive.
+"""
+import os
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import exists, insert, literal, select
+from sqlalchemy.orm import Session, aliased
+
+from . import models, change_log, crime_events
+
+load_dotenv()
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# live model -> archive model, children before the crimes they reference
+TIERS = (
+    (models.Votes, models.VoteArchive),
+    (models.AnonymousVotes, models.AnonymousVoteArchive),
+    (models.FlaggedCrime, models.FlaggedCrimeArchive),
+    (models.Crimes, models.CrimeArchive),
+)
+
+_CRIME_COLUMNS = (
+    models.Crimes.crime_id, models.Crimes.is_hidden, models.Crimes.deleted_at, models.Crimes.crime_type,
+    models.Crimes.latitude, models.Crimes.longitude, models.Crimes.created_at,
+)
+
+
+def _move(db: Session, live, archived, criterion, now: datetime):
+    live_table, archive_table = live.__table__, archived.__table__
+    columns = [c.name for c in live_table.columns]
+    db.execute(
+        insert(archive_table).from_select(
+            columns + ["archived_at"],
+            select(*(live_table.c[name] for name in columns), literal(now, archive_table.c.archived_at.type))
+            .where(criterion(live_table)),
+        )
+    )
+    db.execute(live_table.delete().where(criterion(live_table)))
+
+
+def archive_batch(db: Session, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE,
+                  now: Optional[datetime] = None) -> int:
+    """Archive up to `batch_size` crimes created before `cutoff`, plus their duplicates. Returns how many moved."""
+    now = now or datetime.now(UTC)
+    duplicate = aliased(models.Crimes)
+    rows = (
+        db.query(*_CRIME_COLUMNS)
+        .filter(
+            models.Crimes.created_at < cutoff,
+            ~exists().where(duplicate.canonical_id == models.Crimes.crime_id, duplicate.created_at >= cutoff),
+        )
+        .order_by(models.Crimes.crime_id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    ids = [row.crime_id for row in rows]
+    rows += (
+        db.query(*_CRIME_COLUMNS)
+        .filter(models.Crimes.canonical_id.in_(ids), models.Crimes.crime_id.notin_(ids))
+        .all()
+    )
+    ids = [row.crime_id for row in rows]
+    for live, archived in TIERS:
+        _move(db, live, archived, lambda table: table.c.crime_id.in_(ids), now)
+
+    # to clients and in-memory indexes an archived crime is gone; soft-deleted
+    # ones were already announced when that happened. Hidden ones were too,
+    # but the analytics snapshot still counts them.
+    change_log.record(db, "delete", [row.crime_id for row in rows if row.deleted_at is None])
+    visible = [row for row in rows if row.deleted_at is None and not row.is_hidden]
+    for row in visible:
+        crime_events.defer(db, "delete", None, crime_events.CrimePoint(
+            row.crime_id, row.crime_type, row.latitude, row.longitude, row.created_at))
+    db.commit()
+    return len(ids)
+
+
+def run(db: Session, older_than_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive every crime older than `older_than_days`, one batch per transaction."""
+    cutoff = datetime.now(UTC) - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        moved = archive_batch(db, cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
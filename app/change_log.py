@@ -0,0 +1,91 @@
+"""
+Append-only change log behind the crime sync feed.
+
+Every flush that creates, updates or deletes a crime inserts matching
+rows into `crime_changes` on the same connection, so they commit or roll
+back with the write itself. Set-based UPDATE/DELETE statements bypass the
+flush; code issuing them calls `record` before committing.
+
+change_id comes from the database's id allocation. With concurrent
+writers (Postgres), a transaction can commit an id below one that is
+already visible. So readers only go up to the newest change logged at
+least CHANGE_LOG_SETTLE_SECONDS ago. A cursor never passes an id whose
+transaction may still commit, as long as writes commit within that window
+(set idle_in_transaction_session_timeout to match). SQLite serialises
+writers and serves changes immediately.
+"""
+import os
+from datetime import datetime, timedelta, UTC
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+load_dotenv()
+
+# Changes older than this are pruned; clients with an older cursor must resync
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+# Postgres only: how long after being logged a change may still be waiting to commit
+CHANGE_LOG_SETTLE_SECONDS = float(os.getenv("CHANGE_LOG_SETTLE_SECONDS", "10"))
+CHANGE_FEED_MAX_LIMIT = 1000
+
+
+def record(db: Session, op: str, crime_ids: Iterable[int]):
+    rows = [{"crime_id": crime_id, "op": op, "changed_at": datetime.now(UTC)} for crime_id in crime_ids]
+    if rows:
+        db.connection().execute(insert(models.CrimeChange.__table__), rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _log_flush(session, flush_context):
+    for op, objects in (("create", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        crimes = [
+            obj.crime_id for obj in objects
+            if isinstance(obj, models.Crimes)
+            and (op != "update" or session.is_modified(obj, include_collections=False))
+        ]
+        record(session, op, crimes)
+
+
+def _settled(db: Session) -> Optional[datetime]:
+    """Changes logged before this have committed or rolled back; None where writers are serialised."""
+    if db.get_bind().dialect.name == "sqlite":
+        return None
+    return datetime.now(UTC) - timedelta(seconds=CHANGE_LOG_SETTLE_SECONDS)
+
+
+def head(db: Session) -> int:
+    """Cursor positioned after the newest settled change."""
+    query = db.query(func.max(models.CrimeChange.change_id))
+    settled = _settled(db)
+    if settled is not None:
+        query = query.filter(models.CrimeChange.changed_at < settled)
+    return query.scalar() or 0
+
+
+def oldest(db: Session) -> Optional[int]:
+    return db.query(func.min(models.CrimeChange.change_id)).scalar()
+
+
+def changes_since(db: Session, cursor: int, limit: int) -> List[models.CrimeChange]:
+    """Changes after `cursor` up to the head, oldest first."""
+    query = db.query(models.CrimeChange).filter(models.CrimeChange.change_id > cursor)
+    if _settled(db) is not None:
+        # later ids may still be joined by lower ones from open transactions
+        query = query.filter(models.CrimeChange.change_id <= head(db))
+    return query.order_by(models.CrimeChange.change_id).limit(limit).all()
+
+
+def prune(db: Session, now: Optional[datetime] = None) -> int:
+    """Delete changes past the retention window. Returns the number of rows removed."""
+    cutoff = (now or datetime.now(UTC)) - timedelta(days=CHANGE_LOG_RETENTION_DAYS)
+    # the newest row always stays so the head cursor survives a quiet month
+    deleted = db.query(models.CrimeChange).filter(
+        models.CrimeChange.changed_at < cutoff,
+        models.CrimeChange.change_id < head(db),
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
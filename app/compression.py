@@ -0,0 +1,114 @@
+"""
+Negotiated gzip/brotli compression of JSON and text responses.
+
+Crime, flag and SOS lists run to megabytes of JSON, which compresses
+several times over. A response of a compressible type and at least
+COMPRESSION_MIN_BYTES is encoded with the best encoding the client
+accepts: brotli when the optional `brotli` package is installed, else
+gzip. Smaller bodies go out as they are, because the saving is not
+worth the CPU. Bodies of COMPRESSION_THREADPOOL_BYTES or more are
+compressed on the threadpool, so one large list does not stall the
+event loop for every other request on the worker.
+
+Output is deterministic (gzip mtime 0). A strong ETag on a compressed
+response gets the encoding appended ("...-gzip"), since its bytes differ
+from the identity response. See app/etags.py.
+"""
+import gzip
+import os
+import re
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_THREADPOOL_BYTES = int(os.getenv("COMPRESSION_THREADPOOL_BYTES", str(64 * 1024)))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# event streams are left alone: buffering them would hold every event back
+_COMPRESSIBLE = re.compile(
+    r"application/([\w.-]+\+)?json|application/(javascript|xml)|text/(?!event-stream\b)[\w.+-]+|image/svg\+xml"
+)
+
+
+def available() -> List[str]:
+    """Encodings this worker can produce, preferred first."""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The preferred available encoding the client accepts, or None for identity."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in available():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _buffered(response: Response, body: bytes) -> Response:
+    buffered = Response(body, status_code=response.status_code)
+    buffered.raw_headers = list(response.raw_headers)
+    return buffered
+
+
+async def compression(request: Request, call_next):
+    response = await call_next(request)
+    if (not COMPRESSION_ENABLED or request.method == "HEAD" or "content-encoding" in response.headers
+            or not _COMPRESSIBLE.match(response.headers.get("content-type", ""))):
+        return response
+    response.headers.add_vary_header("Accept-Encoding")
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    length = response.headers.get("content-length")
+    if encoding is None or response.status_code in (204, 304) or (length and int(length) < COMPRESSION_MIN_BYTES):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return _buffered(response, body)
+    if len(body) >= COMPRESSION_THREADPOOL_BYTES:
+        body = await run_in_threadpool(compress, body, encoding)
+    else:
+        body = compress(body, encoding)
+
+    compressed = _buffered(response, body)
+    headers = compressed.headers
+    headers["Content-Length"] = str(len(body))
+    headers["Content-Encoding"] = encoding
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/") and etag.endswith('"'):
+        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+    return compressed
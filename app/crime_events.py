@@ -0,0 +1,96 @@
+"""
+Notifies in-memory indexes about committed changes to crimes.
+
+Changes are collected from the ORM flush and handed to subscribers only
+after the transaction commits, so a rolled back write never reaches an
+index. Set-based UPDATE/DELETE statements bypass the flush; code issuing
+them queues their events with `defer`.
+
+Hidden and soft-deleted crimes are not indexed, so their writes produce
+no events; hiding, unhiding and deleting are announced by the code doing
+them.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+class CrimePoint(NamedTuple):
+    crime_id: int
+    crime_type: str
+    latitude: float
+    longitude: float
+    created_at: Optional[datetime]
+
+
+# callback(op, new, old) with op in {"create", "update", "delete"}
+Listener = Callable[[str, Optional[CrimePoint], Optional[CrimePoint]], None]
+_listeners: List[Listener] = []
+
+_PENDING = "crime_events"
+
+
+def subscribe(listener: Listener) -> Listener:
+    _listeners.append(listener)
+    return listener
+
+
+def publish(op: str, new: Optional[CrimePoint], old: Optional[CrimePoint]):
+    for listener in _listeners:
+        try:
+            listener(op, new, old)
+        except Exception:
+            logger.exception("crime event listener %r failed", listener)
+
+
+def defer(session: Session, op: str, new: Optional[CrimePoint], old: Optional[CrimePoint]):
+    """Queue an event to be published when `session` commits."""
+    session.info.setdefault(_PENDING, []).append((op, new, old))
+
+
+def point(crime: models.Crimes) -> CrimePoint:
+    return CrimePoint(crime.crime_id, crime.crime_type, crime.latitude, crime.longitude, crime.created_at)
+
+
+def _previous(crime: models.Crimes) -> CrimePoint:
+    state = inspect(crime)
+
+    def old(name):
+        history = state.attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(crime, name)
+
+    return CrimePoint(crime.crime_id, old("crime_type"), old("latitude"), old("longitude"), old("created_at"))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    pending = session.info.setdefault(_PENDING, [])
+    for obj in session.new:
+        if isinstance(obj, models.Crimes) and obj.is_visible:
+            pending.append(("create", point(obj), None))
+    for obj in session.dirty:
+        if isinstance(obj, models.Crimes) and obj.is_visible \
+                and session.is_modified(obj, include_collections=False):
+            pending.append(("update", point(obj), _previous(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, models.Crimes) and obj.is_visible:
+            pending.append(("delete", None, point(obj)))
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch(session):
+    pending = session.info.pop(_PENDING, None)
+    for op, new, old in pending or ():
+        publish(op, new, old)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard(session, previous_transaction):
+    session.info.pop(_PENDING, None)
@@ -1,7 +1,9 @@
 from fastapi import HTTPException
-from . import schemas, models
+from . import schemas, models, dedup, scoring, change_log, crime_events
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, func
+from datetime import datetime, UTC
+from typing import Dict, List, Optional
 
 
 # Create User CRUD 
@@ -38,22 +40,73 @@ def check_user(db: Session, email: str = None, username: str = None, use_or: boo
 
 #Create Crime
 def create_crime(db: Session, user_id: int, crime: schemas.CrimeCreate):
+    # Link repeat reports of the same incident to the first one
+    dedup.index.ensure_warm(db)
+    created_at = datetime.now(UTC)
+    signature = dedup.simhash(crime.description)
+    canonical_id = dedup.index.find_duplicate(
+        crime.crime_type, crime.latitude, crime.longitude, crime.description, created_at, signature
+    )
+
     db_crime = models.Crimes(
         user_id=user_id,
         crime_type=crime.crime_type,
         description=crime.description,
         latitude=crime.latitude,
         longitude=crime.longitude,
-        media_url=crime.media_url
+        media_url=crime.media_url,
+        canonical_id=canonical_id,
+        created_at=created_at,
+        updated_at=created_at
     )
     db.add(db_crime)
     db.commit()
     db.refresh(db_crime)
+    dedup.index.add(db_crime, signature)
     return db_crime
 
+# Promote the oldest duplicate before a canonical report goes away
+def detach_duplicates(db: Session, db_crime: models.Crimes):
+    duplicates = [row.crime_id for row in db.query(models.Crimes.crime_id).filter(
+        models.Crimes.canonical_id == db_crime.crime_id
+    ).order_by(models.Crimes.crime_id)]
+    successor_id = duplicates[0] if duplicates else None
+
+    if successor_id is not None:
+        db.query(models.Crimes).filter(models.Crimes.crime_id == successor_id) \
+            .update({models.Crimes.canonical_id: None}, synchronize_session=False)
+        db.query(models.Crimes).filter(models.Crimes.canonical_id == db_crime.crime_id) \
+            .update({models.Crimes.canonical_id: successor_id}, synchronize_session=False)
+        change_log.record(db, "update", duplicates)
+    dedup.index.discard(db_crime, successor_id)
+    return successor_id
+
 # Get crime by ID 
 def get_crime_by_id(db: Session, crime_id: int):
-    return db.query(models.Crimes).filter(models.Crimes.crime_id == crime_id).first()
+    return db.query(models.Crimes).filter(
+        models.Crimes.crime_id == crime_id, models.Crimes.deleted_at.is_(None)
+    ).first()
+
+def get_crimes_by_ids(db: Session, crime_ids: List[int]) -> Dict[int, models.Crimes]:
+    # public reads: crimes hidden by a moderator count as missing
+    crimes = db.query(models.Crimes).filter(
+        models.Crimes.crime_id.in_(crime_ids), models.Crimes.is_visible
+    ).all()
+    return {crime.crime_id: crime for crime in crimes}
+
+def get_vote_tallies(db: Session, crime_ids: List[int]) -> Dict[int, dict]:
+    """Vote counts per type for each crime, split into authenticated, anonymous and total."""
+    tallies = {crime_id: {"authenticated": {}, "anonymous": {}, "total": {}} for crime_id in crime_ids}
+    for section, model in (("authenticated", models.Votes), ("anonymous", models.AnonymousVotes)):
+        rows = db.query(model.crime_id, model.vote_type, func.count(model.vote_id)) \
+            .filter(model.crime_id.in_(crime_ids)) \
+            .group_by(model.crime_id, model.vote_type) \
+            .all()
+        for crime_id, vote_type, count in rows:
+            tally = tallies[crime_id]
+            tally[section][vote_type] = count
+            tally["total"][vote_type] = tally["total"].get(vote_type, 0) + count
+    return tallies
 
 # create a vote
 from fastapi import HTTPException, status
@@ -70,12 +123,15 @@ def create_vote(db: Session, crime_id: int, user_id: int, vote: schemas.VoteRequ
             detail="You have already voted on this crime"
         )
 
+    now = datetime.now(UTC)
     new_vote = models.Votes(
         crime_id=crime_id,
         user_id=user_id,
-        vote_type=vote.vote_type
+        vote_type=vote.vote_type,
+        created_at=now
     )
     db.add(new_vote)
+    scoring.record(db, crime_id, scoring.vote_weight(vote.vote_type), now)
     db.commit()
     db.refresh(new_vote)
     return new_vote
@@ -95,12 +151,15 @@ def create_anonymous_vote(db: Session, crime_id: int, vote: schemas.VoteRequest,
             detail="You have already voted on this crime anonymously"
         )
 
+    now = datetime.now(UTC)
     new_vote = models.AnonymousVotes(
         crime_id=crime_id,
         ip_address=ip_address,
-        vote_type=vote.vote_type
+        vote_type=vote.vote_type,
+        created_at=now
     )
     db.add(new_vote)
+    scoring.record(db, crime_id, scoring.vote_weight(vote.vote_type, anonymous=True), now)
     db.commit()
     db.refresh(new_vote)
     return new_vote
@@ -141,13 +200,16 @@ def upsert_subscription(db: Session, user_id: int, sub: schemas.SubscriptionCrea
 # ADMIN CRUD
 
 def create_flagged_crime(db: Session, crime_id: int, flagged_by: int, reason: str, is_flagged: bool = True):
+    now = datetime.now(UTC)
     flagged = models.FlaggedCrime(
         crime_id=crime_id,
         flagged_by=flagged_by,
         reason=reason,
-        is_flagged=is_flagged
+        is_flagged=is_flagged,
+        created_at=now
     )
     db.add(flagged)
+    scoring.record(db, crime_id, scoring.flag_weight(is_flagged), now)
     db.commit()
     db.refresh(flagged)
     return flagged
@@ -156,9 +218,125 @@ def create_flagged_crime(db: Session, crime_id: int, flagged_by: int, reason: st
 def get_flagged_crime_by_id(db: Session, flagged_id: int):
     return db.query(models.FlaggedCrime).filter(models.FlaggedCrime.id == flagged_id).first()
 
-# Get all flagged crimes
-def get_flagged_crimes(db: Session):
-    return db.query(models.FlaggedCrime).all()
+# Get flagged crimes, one page at a time
+def _flagged_crimes_query(db: Session, status: Optional[str] = None):
+    query = db.query(models.FlaggedCrime)
+    if status:
+        query = query.filter(models.FlaggedCrime.status == status)
+    return query
+
+def get_flagged_crimes(db: Session, status: Optional[str] = None, limit: int = 100, offset: int = 0):
+    return _flagged_crimes_query(db, status).order_by(models.FlaggedCrime.id).offset(offset).limit(limit).all()
+
+def get_flagged_crimes_version(db: Session, status: Optional[str] = None) -> tuple:
+    """Count and latest flag and resolution times of the flags get_flagged_crimes pages through."""
+    flags = models.FlaggedCrime
+    return tuple(_flagged_crimes_query(db, status).with_entities(
+        func.count(flags.id), func.max(flags.created_at), func.max(flags.resolved_at)
+    ).one())
+
+
+# MODERATION
+
+def get_moderation_queue(db: Session, status: str = "open", crime_type: Optional[str] = None,
+                         bbox: Optional[tuple] = None, limit: int = 50, offset: int = 0):
+    """Flagged crimes with their flag counts, most flagged first. Returns (total, rows)."""
+    flags = models.FlaggedCrime
+    # aggregated on its own: once crimes is partitioned its primary key also has created_at,
+    # so grouping by crime_id alone no longer covers the crime columns
+    counts = db.query(
+        flags.crime_id,
+        func.count(flags.id).label("flag_count"),
+        func.max(flags.created_at).label("last_flagged_at"),
+    ).filter(flags.status == status, flags.is_flagged.is_(True)).group_by(flags.crime_id).subquery()
+    query = db.query(models.Crimes, counts.c.flag_count, counts.c.last_flagged_at) \
+        .join(counts, counts.c.crime_id == models.Crimes.crime_id) \
+        .filter(models.Crimes.deleted_at.is_(None))
+
+    if crime_type:
+        query = query.filter(models.Crimes.crime_type.ilike(f"%{crime_type}%"))
+    if bbox:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        query = query.filter(
+            models.Crimes.latitude.between(min_lat, max_lat),
+            models.Crimes.longitude.between(min_lng, max_lng),
+        )
+
+    total = query.count()
+    rows = query.order_by(counts.c.flag_count.desc(), counts.c.last_flagged_at.desc(), models.Crimes.crime_id) \
+        .offset(offset).limit(limit).all()
+    return total, rows
+
+def resolve_flags(db: Session, crime_ids: List[int], resolved_by: int) -> int:
+    return db.query(models.FlaggedCrime).filter(
+        models.FlaggedCrime.crime_id.in_(crime_ids), models.FlaggedCrime.status == "open"
+    ).update({
+        models.FlaggedCrime.status: "resolved",
+        models.FlaggedCrime.resolved_by: resolved_by,
+        models.FlaggedCrime.resolved_at: datetime.now(UTC),
+    }, synchronize_session=False)
+
+def _crime_points(db: Session, *criteria) -> List[crime_events.CrimePoint]:
+    rows = db.query(
+        models.Crimes.crime_id, models.Crimes.crime_type, models.Crimes.latitude,
+        models.Crimes.longitude, models.Crimes.created_at,
+    ).filter(*criteria).all()
+    return [crime_events.CrimePoint(*row) for row in rows]
+
+def set_crimes_hidden(db: Session, crime_ids: List[int], hidden: bool) -> List[int]:
+    """Hide or unhide crimes; returns the IDs whose state changed."""
+    points = _crime_points(
+        db,
+        models.Crimes.crime_id.in_(crime_ids),
+        models.Crimes.is_hidden.is_(not hidden),
+        models.Crimes.deleted_at.is_(None),
+    )
+    changed = [p.crime_id for p in points]
+    if not changed:
+        return []
+
+    db.query(models.Crimes).filter(models.Crimes.crime_id.in_(changed)).update(
+        {models.Crimes.is_hidden: hidden, models.Crimes.updated_at: datetime.now(UTC)},
+        synchronize_session=False,
+    )
+    change_log.record(db, "update", changed)
+    for p in points:
+        if hidden:
+            crime_events.defer(db, "delete", None, p)
+        else:
+            crime_events.defer(db, "create", p, None)
+    return changed
+
+def delete_crimes(db: Session, crime_ids: List[int]) -> List[int]:
+    """
+    Soft-delete crimes; their votes and flags stay with them until the
+    archive job moves them. Returns the IDs that were not deleted yet.
+    """
+    existing = [row.crime_id for row in db.query(models.Crimes.crime_id).filter(
+        models.Crimes.crime_id.in_(crime_ids), models.Crimes.deleted_at.is_(None)
+    )]
+    if not existing:
+        return []
+    visible = _crime_points(db, models.Crimes.crime_id.in_(existing), models.Crimes.is_visible)
+
+    # duplicates of a deleted report stand on their own from now on
+    orphans = [row.crime_id for row in db.query(models.Crimes.crime_id).filter(
+        models.Crimes.canonical_id.in_(existing), models.Crimes.crime_id.notin_(existing)
+    )]
+    if orphans:
+        db.query(models.Crimes).filter(models.Crimes.crime_id.in_(orphans)) \
+            .update({models.Crimes.canonical_id: None}, synchronize_session=False)
+        change_log.record(db, "update", orphans)
+
+    now = datetime.now(UTC)
+    db.query(models.Crimes).filter(models.Crimes.crime_id.in_(existing)).update(
+        {models.Crimes.deleted_at: now, models.Crimes.updated_at: now}, synchronize_session=False
+    )
+    change_log.record(db, "delete", existing)
+    for p in visible:
+        crime_events.defer(db, "delete", None, p)
+        dedup.index.discard(p)
+    return existing
 
 
 # create SOS alert
@@ -174,5 +352,52 @@ def create_sos_alert(db: Session, user_id: int, sos: schemas.SOSCreate):
     db.refresh(db_sos)
     return db_sos
 
-def get_all_sos_alerts(db: Session):
-    return db.query(models.SOSAlerts).all()
\ No newline at end of file
+def _sos_alerts_query(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    query = db.query(models.SOSAlerts)
+    if since:
+        query = query.filter(models.SOSAlerts.created_at >= since)
+    if until:
+        query = query.filter(models.SOSAlerts.created_at < until)
+    return query
+
+def get_all_sos_alerts(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return _sos_alerts_query(db, since, until).all()
+
+def get_sos_alerts_version(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> tuple:
+    """Count, latest id and latest send time of the alerts get_all_sos_alerts returns; alerts are never edited."""
+    alerts = models.SOSAlerts
+    return tuple(_sos_alerts_query(db, since, until).with_entities(
+        func.count(alerts.id), func.max(alerts.id), func.max(alerts.created_at)
+    ).one())
+
+
+# AUTH SESSIONS
+
+def create_auth_session(db: Session, session_id: str, user_id: int, refresh_token_hash: str, expires_at: datetime):
+    db_session = models.AuthSession(
+        session_id=session_id,
+        user_id=user_id,
+        refresh_token_hash=refresh_token_hash,
+        expires_at=expires_at
+    )
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
+    return db_session
+
+def get_auth_session(db: Session, session_id: str):
+    return db.query(models.AuthSession).filter(models.AuthSession.session_id == session_id).first()
+
+def revoke_auth_sessions(db: Session, revoked_at: datetime, session_id: Optional[str] = None, user_id: Optional[int] = None):
+    """Revoke one session or every live session of a user; return (session_id, expires_at) pairs."""
+    query = db.query(models.AuthSession).filter(models.AuthSession.revoked_at.is_(None))
+    if session_id is not None:
+        query = query.filter(models.AuthSession.session_id == session_id)
+    if user_id is not None:
+        query = query.filter(models.AuthSession.user_id == user_id)
+
+    revoked = query.with_entities(models.AuthSession.session_id, models.AuthSession.expires_at).all()
+    if revoked:
+        query.update({models.AuthSession.revoked_at: revoked_at}, synchronize_session=False)
+        db.commit()
+    return revoked
\ No newline at end of file
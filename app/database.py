@@ -1,6 +1,9 @@
 import os
+import re
+from pathlib import Path
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 load_dotenv()
@@ -8,10 +11,77 @@ load_dotenv()
 DATABASE_URL = os.getenv('DB_URL')
 engine = create_engine(DATABASE_URL)
 
+# Comma-separated URLs of read replicas; empty means every read uses the primary
+READ_REPLICA_URLS = [url.strip() for url in os.getenv('READ_REPLICA_URLS', '').split(',') if url.strip()]
+replica_engines = [create_engine(url, pool_pre_ping=True) for url in READ_REPLICA_URLS]
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# create: create missing tables on boot (inspects every table)
+# verify: trust Alembic, only check the database is at the expected revision
+# skip:   assume the schema is right
+SCHEMA_MODE = os.getenv('SCHEMA_MODE', 'create')
+# Revision to expect in verify mode; read from the migration scripts when unset
+SCHEMA_REVISION = os.getenv('SCHEMA_REVISION')
+# Connections to open per engine before the worker takes traffic; defaults to the pool size
+DB_POOL_WARM = os.getenv('DB_POOL_WARM')
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'alembic'
+
 def create_db_and_tables():
     Base.metadata.create_all(bind=engine)
 
+def expected_revisions() -> set:
+    """Head revisions of the migration scripts."""
+    if SCHEMA_REVISION:
+        return {SCHEMA_REVISION}
+    # read the identifiers straight from the files: loading them through
+    # alembic's ScriptDirectory costs more than create_all on a small schema
+    revisions, parents = set(), set()
+    for script in (MIGRATIONS_DIR / 'versions').glob('*.py'):
+        source = script.read_text()
+        revisions.update(re.findall(r"^revision[^=]*=\s*'(\w+)'", source, re.M))
+        for line in re.findall(r"^down_revision[^=]*=(.*)$", source, re.M):
+            parents.update(re.findall(r"'(\w+)'", line))
+    return revisions - parents
+
+def verify_schema(bind=engine):
+    with bind.connect() as conn:
+        current = {row[0] for row in conn.execute(text('SELECT version_num FROM alembic_version'))}
+    expected = expected_revisions()
+    if current != expected:
+        raise RuntimeError(
+            f"Database schema is at {sorted(current) or 'no revision'}, expected {sorted(expected)}; "
+            "run `alembic upgrade head`"
+        )
+
+def warm_pool(bind, connections=None) -> int:
+    """Open pool connections up front so the first requests do not pay for the handshakes."""
+    if connections is None:
+        connections = int(DB_POOL_WARM) if DB_POOL_WARM else getattr(bind.pool, 'size', lambda: 1)()
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = bind.connect()
+            opened.append(conn)
+            conn.execute(text('SELECT 1'))
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+def prepare_database():
+    """Worker startup: get the schema ready according to SCHEMA_MODE, then warm the pools."""
+    if SCHEMA_MODE == 'create':
+        create_db_and_tables()
+    elif SCHEMA_MODE == 'verify':
+        verify_schema()
+    warm_pool(engine)
+    for replica in replica_engines:
+        try:
+            warm_pool(replica)
+        except DBAPIError:
+            pass  # a replica that is down is skipped by the read router until it recovers
+
@@ -0,0 +1,209 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models
+
+load_dotenv()
+
+DEDUP_RADIUS_KM = float(os.getenv("DEDUP_RADIUS_KM", "0.5"))
+DEDUP_WINDOW_MINUTES = float(os.getenv("DEDUP_WINDOW_MINUTES", "120"))
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "12"))
+# Reports remembered per (crime type, cell); caps the work done per insert
+DEDUP_MAX_PER_CELL = int(os.getenv("DEDUP_MAX_PER_CELL", "64"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an the and or of to in on at by for from with near around was were is are it "
+    "this that there here my our me we i o clock just now today please help".split()
+)
+# _LANES[b] spreads the 8 bits of b into 8 one-byte lanes, so summing spread
+# hashes counts the set bits of every position at once
+_LANES = [sum(((b >> i) & 1) << (8 * i) for i in range(8)) for b in range(256)]
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over the content words and word bigrams of `text`."""
+    words = [w for w in _WORD.findall(text.lower()) if w not in _STOP_WORDS]
+    features = (words + [f"{a} {b}" for a, b in zip(words, words[1:])])[:255]
+    if not features:
+        return 0
+    total = 0
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        for k in range(8):
+            total += _LANES[(h >> (8 * k)) & 255] << (64 * k)
+    value = 0
+    for bit, count in enumerate(total.to_bytes(64, "little")):
+        if 2 * count > len(features):
+            value |= 1 << bit
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    )
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return datetime.now(UTC).timestamp()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
+
+
+class _Entry(NamedTuple):
+    crime_id: int
+    canonical_id: int
+    created_at: float
+    latitude: float
+    longitude: float
+    signature: int
+
+
+class DedupIndex:
+    """
+    Recent reports bucketed by (normalised crime type, grid cell). A new
+    report is compared only against the 3x3 cells around it, and each cell
+    keeps at most `max_per_cell` reports, so the cost of an insert is
+    bounded regardless of table size.
+    """
+
+    def __init__(
+        self,
+        radius_km: float = DEDUP_RADIUS_KM,
+        window_minutes: float = DEDUP_WINDOW_MINUTES,
+        max_hamming: int = DEDUP_MAX_HAMMING,
+        max_per_cell: int = DEDUP_MAX_PER_CELL,
+    ):
+        self.radius_km = radius_km
+        self.window = window_minutes * 60
+        self.max_hamming = max_hamming
+        self.max_per_cell = max_per_cell
+        # a cell is at least `radius_km` wide, so any match lies in the 3x3 block
+        self.cell_deg = radius_km / 111.0
+        self._cells: dict = {}
+        self._lock = threading.Lock()
+        self._warm = False
+
+    def _cell(self, latitude: float, longitude: float):
+        return int(latitude // self.cell_deg), int(longitude // self.cell_deg)
+
+    def _lng_span(self, latitude: float) -> int:
+        # cells narrow in km towards the poles, so look further east/west there
+        shrink = max(math.cos(math.radians(min(abs(latitude) + self.cell_deg, 89.9))), 1e-3)
+        return max(1, math.ceil(1 / shrink))
+
+    def find_duplicate(self, crime_type: str, latitude: float, longitude: float, description: str,
+                       created_at: Optional[datetime] = None, signature: Optional[int] = None) -> Optional[int]:
+        """Return the canonical crime_id this report most likely repeats, if any."""
+        if signature is None:
+            signature = simhash(description)
+        return self._match(crime_type, latitude, longitude, signature, _timestamp(created_at))
+
+    def _match(self, crime_type, latitude, longitude, signature, ts) -> Optional[int]:
+        kind = crime_type.strip().lower()
+        row, col = self._cell(latitude, longitude)
+        span = self._lng_span(latitude)
+        best, best_distance = None, self.max_hamming + 1
+        with self._lock:
+            for dr in (-1, 0, 1):
+                for dc in range(-span, span + 1):
+                    bucket = self._cells.get((kind, row + dr, col + dc))
+                    if not bucket:
+                        continue
+                    for entry in bucket:
+                        if abs(ts - entry.created_at) > self.window:
+                            continue
+                        distance = hamming(signature, entry.signature)
+                        if distance >= best_distance:
+                            continue
+                        if _haversine_km(latitude, longitude, entry.latitude, entry.longitude) > self.radius_km:
+                            continue
+                        best, best_distance = entry.canonical_id, distance
+        return best
+
+    def add(self, crime: models.Crimes, signature: Optional[int] = None):
+        entry = _Entry(
+            crime.crime_id,
+            crime.canonical_id or crime.crime_id,
+            _timestamp(crime.created_at),
+            crime.latitude,
+            crime.longitude,
+            simhash(crime.description) if signature is None else signature,
+        )
+        key = (crime.crime_type.strip().lower(), *self._cell(crime.latitude, crime.longitude))
+        with self._lock:
+            bucket = self._cells.get(key)
+            if bucket is None:
+                bucket = self._cells[key] = deque(maxlen=self.max_per_cell)
+            bucket.append(entry)
+
+    def discard(self, crime: models.Crimes, new_canonical_id: Optional[int] = None):
+        """Forget a deleted report and re-point its duplicates at `new_canonical_id`."""
+        with self._lock:
+            for key, bucket in self._cells.items():
+                if not any(e.crime_id == crime.crime_id or e.canonical_id == crime.crime_id for e in bucket):
+                    continue
+                kept = []
+                for e in bucket:
+                    if e.crime_id == crime.crime_id:
+                        continue
+                    if e.canonical_id == crime.crime_id:
+                        e = e._replace(canonical_id=new_canonical_id or e.crime_id)
+                    kept.append(e)
+                self._cells[key] = deque(kept, maxlen=self.max_per_cell)
+
+    def prune(self, now: Optional[float] = None):
+        """Drop reports that fell out of the time window."""
+        cutoff = (now if now is not None else datetime.now(UTC).timestamp()) - self.window
+        with self._lock:
+            for key in list(self._cells):
+                bucket = self._cells[key]
+                while bucket and bucket[0].created_at < cutoff:
+                    bucket.popleft()
+                if not bucket:
+                    del self._cells[key]
+
+    def warm(self, db: Session):
+        """Load the reports still inside the time window from the database."""
+        since = datetime.now(UTC) - timedelta(seconds=self.window)
+        crimes = (
+            db.query(models.Crimes)
+            .filter(models.Crimes.created_at >= since, models.Crimes.is_visible)
+            .order_by(models.Crimes.created_at)
+            .all()
+        )
+        with self._lock:
+            self._cells.clear()
+        for crime in crimes:
+            self.add(crime)
+        self._warm = True
+
+    def ensure_warm(self, db: Session):
+        if not self._warm:
+            self.warm(db)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._cells.values())
+
+
+index = DedupIndex()
@@ -1,8 +1,29 @@
+from fastapi import Depends, Request
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
 from .database import SessionLocal
+from . import replicas
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    # read-only handlers: a replica when one is healthy and the caller has not just written
+    router = replicas.router
+    db = router.session(replicas.last_write(request))
+    if db is None:
+        yield primary
+        return
+    try:
+        yield db
+    except DBAPIError as exc:
+        if exc.connection_invalidated:
+            router.mark_down(db.get_bind().engine)
+        raise
+    finally:
+        router.close(db)
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Conditional GET for the large list endpoints.
+
+Each list carries an ETag built from a cheap aggregate over the rows it
+would return, with the same filters: the row count and the latest change
+time. That is one aggregate query, which does not fetch or serialize the
+rows. When a client sends the tag back in If-None-Match and the
+aggregate has not changed, it gets 304 Not Modified before the list
+query runs.
+
+Flag and SOS lists depend only on their rows, so their tags are strong.
+A crime's trust_score decays continuously (app/scoring.py), and a vote
+changes trust_rank without touching updated_at. So the crime list tag
+also covers the sum of trust_rank and the current ETAG_SCORE_TICK_SECONDS
+period. It is weak because two responses with the same tag can differ in
+the last digits of their scores.
+
+A compressed response carries the tag with the encoding appended (see
+app/compression.py). Matching ignores that suffix.
+"""
+import hashlib
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+
+load_dotenv()
+
+# How long a crime list tag stays valid while scores decay underneath it
+ETAG_SCORE_TICK_SECONDS = float(os.getenv("ETAG_SCORE_TICK_SECONDS", "60"))
+
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def tag(*parts, weak: bool = False) -> str:
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def score_tick() -> int:
+    return int(time.time() // ETAG_SCORE_TICK_SECONDS)
+
+
+def _opaque(etag: str) -> str:
+    etag = etag.strip().removeprefix("W/").strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        etag = etag.removesuffix(suffix)
+    return etag
+
+
+def match(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """The entry of If-None-Match that names `etag` (weak comparison), or None."""
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for candidate in if_none_match.split(","):
+        if _opaque(candidate) == _opaque(etag):
+            return candidate.strip()
+    return None
+
+
+def not_modified(request: Request, response: Response, etag: str, private: bool = False) -> Optional[Response]:
+    """
+    Put the validator on `response` and return a 304 to send instead when
+    the client already holds this version.
+    """
+    cache_control = "private, no-cache" if private else "no-cache"
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    held = match(request.headers.get("if-none-match"), etag)
+    if held is None:
+        return None
+    # echo the tag as the client got it, encoding suffix included
+    return Response(status_code=304, headers={"ETag": held, "Cache-Control": cache_control})
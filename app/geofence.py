@@ -0,0 +1,181 @@
+"""
+Danger zones for moving users.
+
+A danger zone is a web-mercator cell at DANGER_ZOOM (about 1.2 km across
+at the equator for zoom 15) that saw at least DANGER_MIN_CRIMES visible
+reports in the last DANGER_WINDOW_HOURS. Each cell is counted together
+with its eight neighbours, so a hotspot that straddles a cell edge is
+still caught. The set of zones is rebuilt every DANGER_REFRESH_SECONDS.
+It is kept as two sorted numpy arrays, packed cell coordinates and
+counts, so checking a location ping is one tile computation and one
+binary search, and the table can be shared between workers as a
+memory-mapped snapshot (see app/snapshots.py).
+
+Repeat alerts are suppressed by `AlertState`. It remembers the
+(user, zone) pairs alerted in the last DANGER_ALERT_COOLDOWN_SECONDS, up
+to DANGER_ALERT_STATE_SIZE entries, and the least recently alerted
+entries drop out first.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, UTC
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models
+from .tiles import MAX_LATITUDE, tile_bounds, tile_xy
+
+load_dotenv()
+
+DANGER_ZOOM = int(os.getenv("DANGER_ZOOM", "15"))
+DANGER_WINDOW_HOURS = float(os.getenv("DANGER_WINDOW_HOURS", "720"))
+DANGER_MIN_CRIMES = int(os.getenv("DANGER_MIN_CRIMES", "5"))
+DANGER_REFRESH_SECONDS = float(os.getenv("DANGER_REFRESH_SECONDS", "600"))
+DANGER_ALERT_COOLDOWN_SECONDS = float(os.getenv("DANGER_ALERT_COOLDOWN_SECONDS", "1800"))
+DANGER_ALERT_STATE_SIZE = int(os.getenv("DANGER_ALERT_STATE_SIZE", "100000"))
+GEOFENCE_MAX_PINGS = int(os.getenv("GEOFENCE_MAX_PINGS", "500"))
+
+
+def cell_key(x, y):
+    return (x << 32) | y
+
+
+def tile_xy_array(latitudes, longitudes, zoom: int):
+    """tile_xy over numpy arrays."""
+    n = 1 << zoom
+    lat = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = ((longitudes + 180.0) / 360.0 * n).astype(np.int64)
+    y = ((1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+class DangerZones:
+    def __init__(self, zoom: int = DANGER_ZOOM, min_crimes: int = DANGER_MIN_CRIMES,
+                 window_hours: float = DANGER_WINDOW_HOURS, refresh_seconds: float = DANGER_REFRESH_SECONDS):
+        self.zoom = zoom
+        self.min_crimes = min_crimes
+        self.window_hours = window_hours
+        self.refresh_seconds = refresh_seconds
+        # (sorted cell keys, counts)
+        self._zones = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self._lock = threading.Lock()
+        self._built_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self._zones[0])
+
+    def build(self, db: Session):
+        since = datetime.now(UTC) - timedelta(hours=self.window_hours)
+        rows = db.query(models.Crimes.latitude, models.Crimes.longitude) \
+            .filter(models.Crimes.is_visible, models.Crimes.created_at >= since).all()
+        self.load((row.latitude for row in rows), (row.longitude for row in rows))
+
+    def load(self, latitudes: Iterable[float], longitudes: Iterable[float]):
+        n = 1 << self.zoom
+        x, y = tile_xy_array(np.fromiter(latitudes, float), np.fromiter(longitudes, float), self.zoom)
+        cells, counts = np.unique(cell_key(x, y), return_counts=True)
+        x, y = cells >> 32, cells & 0xFFFFFFFF
+
+        # every cell hands its count to itself and its eight neighbours
+        keys, weights = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                ny = y + dy
+                inside = (ny >= 0) & (ny < n)
+                keys.append(cell_key((x[inside] + dx) % n, ny[inside]))  # x wraps at the antimeridian
+                weights.append(counts[inside])
+        keys, position = np.unique(np.concatenate(keys), return_inverse=True)
+        sums = np.bincount(position, weights=np.concatenate(weights)).astype(np.int64)
+        hot = sums >= self.min_crimes
+        # swapped in whole, so lookups never see a half-built table
+        self._zones = (keys[hot], sums[hot])
+        self._built_at = time.monotonic()
+
+    def export(self):
+        keys, counts = self._zones
+        return {"keys": keys, "counts": counts}, {"zoom": self.zoom, "min_crimes": self.min_crimes}
+
+    def install(self, arrays: dict, meta: dict):
+        if meta["zoom"] != self.zoom or meta["min_crimes"] != self.min_crimes:
+            return  # published by a worker with different settings
+        self._zones = (arrays["keys"], arrays["counts"])
+        self._built_at = time.monotonic()
+
+    def ensure_built(self, db: Session):
+        if self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds:
+            with self._lock:
+                if self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds:
+                    self.build(db)
+
+    def lookup(self, latitude: float, longitude: float) -> Optional[Tuple[int, int]]:
+        """(cell key, crime count) of the danger zone containing the point, or None."""
+        x, y = tile_xy(latitude, longitude, self.zoom)
+        key = cell_key(x, y)
+        keys, counts = self._zones
+        i = int(keys.searchsorted(key))
+        if i == len(keys) or keys[i] != key:
+            return None
+        return key, int(counts[i])
+
+    def describe(self, key: int, count: int) -> dict:
+        x, y = key >> 32, key & 0xFFFFFFFF
+        min_lat, min_lng, max_lat, max_lng = tile_bounds(x, y, self.zoom)
+        return {
+            "cell": f"{self.zoom}/{x}/{y}",
+            "crime_count": count,
+            "min_lat": min_lat,
+            "min_lng": min_lng,
+            "max_lat": max_lat,
+            "max_lng": max_lng,
+        }
+
+
+class AlertState:
+    """Bounded LRU of recently alerted (user, zone) pairs."""
+
+    def __init__(self, capacity: int = DANGER_ALERT_STATE_SIZE, cooldown: float = DANGER_ALERT_COOLDOWN_SECONDS):
+        self.capacity = capacity
+        self.cooldown = cooldown
+        self._alerted: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._alerted)
+
+    def should_alert(self, user_id: int, zone: int, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        key = (user_id, zone)
+        with self._lock:
+            last = self._alerted.get(key)
+            if last is not None and now - last < self.cooldown:
+                return False
+            self._alerted[key] = now
+            self._alerted.move_to_end(key)
+            while len(self._alerted) > self.capacity:
+                self._alerted.popitem(last=False)
+            return True
+
+
+def check_pings(user_id: int, pings: List[Tuple[float, float]], zones: DangerZones,
+                state: AlertState) -> List[dict]:
+    """Alerts for the pings that enter a danger zone the user was not warned about recently."""
+    alerts = []
+    for index, (latitude, longitude) in enumerate(pings):
+        hit = zones.lookup(latitude, longitude)
+        if hit is not None and state.should_alert(user_id, hit[0]):
+            alerts.append({
+                "ping_index": index,
+                "latitude": latitude,
+                "longitude": longitude,
+                "zone": zones.describe(*hit),
+            })
+    return alerts
+
+
+zones = DangerZones()
+alert_state = AlertState()
@@ -0,0 +1,238 @@
+"""
+Idempotency-Key support for the write endpoints mobile clients retry:
+reporting a crime, sending an SOS and voting.
+
+A client sends the same `Idempotency-Key` header on every attempt of one
+logical request. The first attempt runs and its response is stored in
+`idempotency_keys` for IDEMPOTENCY_TTL_SECONDS. Later attempts get that
+response back, marked `Idempotent-Replayed: true`, without running the
+write again. Keys are scoped to the user the verified bearer token
+names, so a retry sent with a refreshed token still matches, and two
+users cannot collide. Anonymous votes fall back to the client address.
+Reusing a key for a different request body is answered with 422.
+
+Attempts that arrive while the first one is still running are coalesced:
+on the same worker they wait on the first attempt's future; on another
+worker they poll its row for up to IDEMPOTENCY_WAIT_SECONDS and then get
+409. A row left pending by a worker that died is taken over after
+IDEMPOTENCY_PENDING_SECONDS.
+
+Server errors and responses a retry could change (401, 408, 409, 429)
+are not stored, so the next attempt runs normally. Neither are bodies
+over IDEMPOTENCY_MAX_BODY_BYTES.
+"""
+import asyncio
+import hashlib
+import os
+import re
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .database import SessionLocal
+from .rate_limit import client_ip
+from .revocation import utcnow
+from .router import auth_utils
+
+load_dotenv()
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a duplicate waits for the first attempt before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# A pending row older than this belongs to a worker that died; the next attempt takes it over
+IDEMPOTENCY_PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "60"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(64 * 1024)))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+_POLL_SECONDS = 0.05
+
+ROUTES = [
+    ("POST", re.compile(r"/crime/crimes")),
+    ("POST", re.compile(r"/sos/send_sos")),
+    ("POST", re.compile(r"/vote/crimes/\d+/vote")),
+]
+# outcomes a retry may legitimately change
+_NOT_STORED = {401, 408, 409, 429}
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    content_type: Optional[str]
+    body: bytes
+
+
+def applies(method: str, path: str) -> bool:
+    return any(method == m and pattern.fullmatch(path) for m, pattern in ROUTES)
+
+
+def _digest(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, ttl: float = IDEMPOTENCY_TTL_SECONDS,
+                 pending_timeout: float = IDEMPOTENCY_PENDING_SECONDS):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """
+        ("new", None) when this attempt should run the request, ("done", response)
+        to replay, ("pending", None) while another attempt runs, or
+        ("mismatch", None) when the key was used for a different request.
+        """
+        keys = models.IdempotencyKey
+        now = utcnow()
+        with self.session_factory() as db:
+            row = db.get(keys, key)
+            if row is not None and row.expires_at <= now:
+                db.delete(row)
+                db.commit()
+                row = None
+            if row is None:
+                db.add(keys(key=key, fingerprint=fingerprint, created_at=now,
+                            expires_at=now + timedelta(seconds=self.ttl)))
+                try:
+                    db.commit()
+                    return "new", None
+                except IntegrityError:
+                    db.rollback()  # another worker claimed it first
+                    row = db.get(keys, key)
+                    if row is None:
+                        return "pending", None
+            if row.fingerprint != fingerprint:
+                return "mismatch", None
+            if row.status_code is not None:
+                return "done", StoredResponse(row.status_code, row.content_type, row.body)
+            if row.created_at < now - timedelta(seconds=self.pending_timeout):
+                taken = db.execute(
+                    update(keys).where(keys.key == key, keys.status_code.is_(None), keys.created_at == row.created_at)
+                    .values(created_at=now, expires_at=now + timedelta(seconds=self.ttl))
+                ).rowcount
+                db.commit()
+                if taken:
+                    return "new", None
+            return "pending", None
+
+    def complete(self, key: str, response: StoredResponse):
+        keys = models.IdempotencyKey
+        with self.session_factory() as db:
+            db.execute(update(keys).where(keys.key == key).values(
+                status_code=response.status_code, content_type=response.content_type, body=response.body,
+            ))
+            db.commit()
+
+    def release(self, key: str):
+        """Forget a pending key so the next attempt runs the request."""
+        keys = models.IdempotencyKey
+        with self.session_factory() as db:
+            db.execute(delete(keys).where(keys.key == key, keys.status_code.is_(None)))
+            db.commit()
+
+
+def prune(db: Session) -> int:
+    """Delete expired keys. Returns the number of rows removed."""
+    deleted = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.expires_at <= utcnow()) \
+        .delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+store = IdempotencyStore()
+# key -> (fingerprint, future of the stored response) for attempts running on this worker
+_inflight: Dict[str, Tuple[str, "asyncio.Future[Optional[StoredResponse]]"]] = {}
+
+
+def _replay(stored: StoredResponse) -> Response:
+    return Response(stored.body, status_code=stored.status_code, media_type=stored.content_type,
+                    headers={"Idempotent-Replayed": "true"})
+
+
+def caller_scope(request: Request) -> str:
+    """The user the bearer token names, else the client address."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        verified = auth_utils.token_verifier.try_verify(token.strip())
+        subject = verified.claims.get("sub") if verified.claims and not verified.error else None
+        if subject:
+            return f"user:{subject}"
+    return f"ip:{client_ip(request)}"
+
+
+def _mismatch() -> Response:
+    return JSONResponse(status_code=422, content={"detail": "Idempotency-Key was already used for a different request"})
+
+
+async def _claim(key: str, fingerprint: str):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        outcome, stored = await run_in_threadpool(store.claim, key, fingerprint)
+        if outcome != "pending" or loop.time() >= deadline:
+            return outcome, stored
+        await asyncio.sleep(_POLL_SECONDS)
+
+
+async def idempotency(request: Request, call_next):
+    header = request.headers.get("idempotency-key")
+    if header is None or not applies(request.method, request.url.path):
+        return await call_next(request)
+    if not header or len(header) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return JSONResponse(status_code=400, content={
+            "detail": f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"})
+
+    key = _digest(caller_scope(request).encode(), header.encode())
+    fingerprint = _digest(request.method.encode(), request.url.path.encode(), request.url.query.encode(),
+                          await request.body())
+
+    # coalesce with an attempt already running on this worker
+    while key in _inflight:
+        leader_fingerprint, leader = _inflight[key]
+        if leader_fingerprint != fingerprint:
+            return _mismatch()
+        stored = await asyncio.shield(leader)
+        if stored is not None:
+            return _replay(stored)
+
+    done = asyncio.get_running_loop().create_future()
+    _inflight[key] = (fingerprint, done)
+    stored = None
+    try:
+        outcome, stored = await _claim(key, fingerprint)
+        if outcome == "mismatch":
+            return _mismatch()
+        if outcome == "done":
+            return _replay(stored)
+        if outcome == "pending":
+            return JSONResponse(status_code=409, headers={"Retry-After": "1"},
+                                content={"detail": "A request with this Idempotency-Key is still in progress"})
+
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        except BaseException:
+            await run_in_threadpool(store.release, key)
+            raise
+        if response.status_code >= 500 or response.status_code in _NOT_STORED or len(body) > IDEMPOTENCY_MAX_BODY_BYTES:
+            await run_in_threadpool(store.release, key)
+        else:
+            stored = StoredResponse(response.status_code, response.headers.get("content-type"), body)
+            await run_in_threadpool(store.complete, key, stored)
+        replayable = Response(body, status_code=response.status_code)
+        replayable.raw_headers = response.raw_headers
+        return replayable
+    finally:
+        del _inflight[key]
+        done.set_result(stored)
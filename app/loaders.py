@@ -0,0 +1,63 @@
+"""
+Request-scoped data loaders for the batch endpoints.
+
+A loader collects the keys asked for during one request, drops the ones
+it has already fetched, and resolves the rest with one query per
+`max_batch_size` keys. Loaders live only as long as the request, so there
+is nothing to invalidate.
+"""
+import os
+from typing import Callable, Dict, Generic, Hashable, Iterable, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from . import crud
+from .dependencies import get_read_db
+
+load_dotenv()
+
+# Most IDs a client may ask for in one batch request
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "100"))
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    def __init__(self, batch_fn: Callable[[List[K]], Dict[K, V]], max_batch_size: int = BATCH_MAX_IDS):
+        self._batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._cache: Dict[K, Optional[V]] = {}
+
+    def load_many(self, keys: Iterable[K]) -> Dict[K, Optional[V]]:
+        """Values for `keys` in first-seen order; None for keys the batch function did not return."""
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self._cache]
+        for start in range(0, len(missing), self.max_batch_size):
+            chunk = missing[start:start + self.max_batch_size]
+            found = self._batch_fn(chunk)
+            for key in chunk:
+                self._cache[key] = found.get(key)
+        return {key: self._cache[key] for key in keys}
+
+    def load(self, key: K) -> Optional[V]:
+        return self.load_many([key])[key]
+
+
+class Loaders:
+    def __init__(self, db: Session):
+        self.crimes = DataLoader(lambda ids: crud.get_crimes_by_ids(db, ids))
+        self.vote_tallies = DataLoader(lambda ids: crud.get_vote_tallies(db, ids))
+
+
+def get_loaders(db: Session = Depends(get_read_db)) -> Loaders:
+    return Loaders(db)
+
+
+def check_batch(ids: List[int]):
+    if not ids:
+        raise HTTPException(status_code=400, detail="At least one id is required")
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IDS} ids per request")
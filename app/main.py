@@ -1,17 +1,35 @@
 from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from app.router import auth, crime, vote, subscription, admin, sos
-from .database import create_db_and_tables
+from .database import prepare_database, engine
+from app import partitions, replicas, media, scheduler, snapshots, idempotency, single_flight, admission, compression
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
-    create_db_and_tables()
+    prepare_database()
+    partitions.maintain(engine)
+    if snapshots.enabled():
+        # map whatever another worker already published instead of building
+        snapshots.snapshots.refresh()
+    if scheduler.SCHEDULER_ENABLED:
+        scheduler.scheduler.start()
     yield
-    # Shutdown logic (if any)
+    # Shutdown logic: stop scheduling and let queued thumbnails finish
+    scheduler.scheduler.stop()
+    media.drain(timeout=30)
 
 # Create app with lifespan
 app = FastAPI(lifespan=lifespan)
+app.middleware("http")(replicas.track_writes)
+app.middleware("http")(idempotency.idempotency)
+# inside single flight, so coalesced callers share one compressed body
+app.middleware("http")(compression.compression)
+# a shed request costs nothing past this point
+app.middleware("http")(admission.admission)
+# outermost, so only a flight's leader takes an admission slot
+app.middleware("http")(single_flight.single_flight)
 
 
 @app.get("/")
@@ -27,4 +45,7 @@ app.include_router(subscription.router)
 app.include_router(admin.router)
 app.include_router(sos.router)
 
+if media.MEDIA_BACKEND == "local":
+    app.mount(media.MEDIA_BASE_URL, StaticFiles(directory=media.MEDIA_ROOT, check_dir=False), name="media")
+
 
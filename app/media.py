@@ -0,0 +1,222 @@
+"""
+Media uploads for crime reports.
+
+Uploads are copied to the storage backend MEDIA_CHUNK_SIZE bytes at a
+time and cut off at MEDIA_MAX_BYTES, so a file is never held in memory
+whole. The backend is picked with MEDIA_BACKEND:
+
+- local (default): files under MEDIA_ROOT, served by the app at
+  MEDIA_BASE_URL.
+- s3: any S3-compatible bucket via boto3 (MEDIA_S3_BUCKET, optionally
+  MEDIA_S3_ENDPOINT_URL and MEDIA_S3_PUBLIC_URL). It streams through
+  boto3's multipart transfer.
+
+Once an image is stored, the crime's media_url points at it. A
+thumbnail is then rendered on a small thread pool, off the request,
+and written back to thumbnail_url when it is ready.
+"""
+import io
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import BinaryIO, Optional, Protocol, Set
+
+from dotenv import load_dotenv
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "local")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "./media")
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "/media")
+MEDIA_S3_BUCKET = os.getenv("MEDIA_S3_BUCKET")
+MEDIA_S3_ENDPOINT_URL = os.getenv("MEDIA_S3_ENDPOINT_URL")
+# Public prefix for object URLs; defaults to the bucket's virtual-hosted URL
+MEDIA_S3_PUBLIC_URL = os.getenv("MEDIA_S3_PUBLIC_URL")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+
+# accepted content types and the extension they are stored under
+ALLOWED_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "video/mp4": ".mp4",
+}
+
+
+class TooLarge(Exception):
+    pass
+
+
+class _Capped(io.RawIOBase):
+    """Reader that raises TooLarge once more than `limit` bytes have been read."""
+
+    def __init__(self, source: BinaryIO, limit: int):
+        self.source = source
+        self.limit = limit
+        self.size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        chunk = self.source.read(MEDIA_CHUNK_SIZE if n is None or n < 0 else n)
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise TooLarge()
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class Storage(Protocol):
+    def save(self, key: str, source: BinaryIO, content_type: str) -> None: ...
+
+    def open(self, key: str) -> BinaryIO: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def url(self, key: str) -> str: ...
+
+
+class LocalStorage:
+    def __init__(self, root: str = MEDIA_ROOT, base_url: str = MEDIA_BASE_URL):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def save(self, key: str, source: BinaryIO, content_type: str):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".part")
+        try:
+            with open(partial, "wb") as out:
+                shutil.copyfileobj(source, out, MEDIA_CHUNK_SIZE)
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.root / key, "rb")
+
+    def delete(self, key: str):
+        (self.root / key).unlink(missing_ok=True)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+
+class S3Storage:
+    def __init__(self, bucket: str = MEDIA_S3_BUCKET, endpoint_url: Optional[str] = MEDIA_S3_ENDPOINT_URL,
+                 public_url: Optional[str] = MEDIA_S3_PUBLIC_URL):
+        import boto3
+
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.public_url = (public_url or f"https://{bucket}.s3.amazonaws.com").rstrip("/")
+
+    def save(self, key: str, source: BinaryIO, content_type: str):
+        self.client.upload_fileobj(source, self.bucket, key, ExtraArgs={"ContentType": content_type})
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+
+# built on first upload; boto3 alone takes longer to import than the rest of the app
+storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global storage
+    if storage is None:
+        storage = S3Storage() if MEDIA_BACKEND == "s3" else LocalStorage()
+    return storage
+
+executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="thumbnails")
+_pending: Set[Future] = set()
+_pending_lock = threading.Lock()
+
+
+def store(crime_id: int, source: BinaryIO, content_type: str) -> str:
+    """Stream an upload to storage and return its key. Raises TooLarge past MEDIA_MAX_BYTES."""
+    key = f"crimes/{crime_id}/{uuid.uuid4().hex}{ALLOWED_TYPES[content_type]}"
+    try:
+        get_storage().save(key, io.BufferedReader(_Capped(source, MEDIA_MAX_BYTES), MEDIA_CHUNK_SIZE), content_type)
+    except TooLarge:
+        get_storage().delete(key)
+        raise
+    return key
+
+
+def thumbnail_key(key: str) -> str:
+    return key.rsplit(".", 1)[0] + "_thumb.jpg"
+
+
+def render_thumbnail(key: str) -> str:
+    """Write a JPEG no larger than THUMBNAIL_SIZE on each side next to `key`; returns its key."""
+    from PIL import Image
+
+    with get_storage().open(key) as source:
+        image = Image.open(io.BytesIO(source.read()))
+        # lets the JPEG decoder scale down while decoding instead of afterwards
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=80)
+    out.seek(0)
+    thumb = thumbnail_key(key)
+    get_storage().save(thumb, out, "image/jpeg")
+    return thumb
+
+
+def _thumbnail_job(bind: Engine, crime_id: int, key: str):
+    try:
+        thumb = render_thumbnail(key)
+    except Exception:
+        logger.exception("thumbnail for crime %s (%s) failed", crime_id, key)
+        return
+    with Session(bind=bind) as db:
+        crime = db.get(models.Crimes, crime_id)
+        # a newer upload may have replaced the media while this one rendered
+        if crime is not None and crime.media_url == get_storage().url(key):
+            crime.thumbnail_url = get_storage().url(thumb)
+            db.commit()
+
+
+def submit_thumbnail(bind: Engine, crime_id: int, key: str) -> Future:
+    future = executor.submit(_thumbnail_job, bind, crime_id, key)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_discard)
+    return future
+
+
+def _discard(future: Future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def drain(timeout: Optional[float] = None):
+    """Wait for queued thumbnails, e.g. before shutdown."""
+    with _pending_lock:
+        pending = list(_pending)
+    wait(pending, timeout=timeout)
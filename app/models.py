@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, UniqueConstraint, Index, LargeBinary, false, and_
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 from .database import Base
@@ -7,9 +8,9 @@ from .database import Base
 class Users(Base):
     __tablename__ = "users"
 
-    user_id = Column(Integer, primary_key=True, index=True, unique=True)
+    user_id = Column(Integer, primary_key=True)
     fullname = Column(String, nullable=False)
-    username = Column(String, nullable=False)
+    username = Column(String, nullable=False, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     role = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
@@ -19,22 +20,55 @@ class Users(Base):
     votes = relationship("Votes", back_populates="user")
     subscriptions = relationship("Subscription", back_populates="user")
     sos_alerts = relationship("SOSAlerts", back_populates="user", cascade="all, delete-orphan")
-    flagged_crimes = relationship("FlaggedCrime", back_populates="admin")
+    flagged_crimes = relationship("FlaggedCrime", back_populates="admin", foreign_keys="FlaggedCrime.flagged_by")
+    sessions = relationship("AuthSession", back_populates="user", cascade="all, delete-orphan")
 
 
-class Crimes(Base):
+class CrimeMixin:
+    """Behaviour shared by live and archived crimes."""
+
+    @hybrid_property
+    def is_visible(self) -> bool:
+        return not self.is_hidden and self.deleted_at is None
+
+    @is_visible.inplace.expression
+    @classmethod
+    def _is_visible_expression(cls):
+        return and_(cls.is_hidden.is_(False), cls.deleted_at.is_(None))
+
+    @property
+    def trust_score(self) -> float:
+        from .scoring import current_score
+        return current_score(self.trust_rank)
+
+
+class Crimes(CrimeMixin, Base):
     __tablename__ = "crimes"
 
-    crime_id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    crime_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     crime_type = Column(String, nullable=False)
     description = Column(String, nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     media_url = Column(String, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    # rendered in the background after an upload, see app/media.py
+    thumbnail_url = Column(String, nullable=True)
+    # set when ingest matched this report to an earlier one describing the same incident
+    canonical_id = Column(Integer, ForeignKey("crimes.crime_id", ondelete="SET NULL"), nullable=True, index=True)
+    # decayed vote/flag evidence scaled to a fixed epoch, see app/scoring.py
+    trust_rank = Column(Float, nullable=False, default=0.0, server_default="0", index=True)
+    # hidden by a moderator: kept for the record but left out of every public read
+    is_hidden = Column(Boolean, nullable=False, default=False, server_default=false(), index=True)
+    # soft delete: votes and flags stay until the row is archived
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), index=True)
     updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
 
+    __table_args__ = (
+        Index("ix_crimes_crime_type_created_at", "crime_type", "created_at"),
+    )
+
     user = relationship("Users", back_populates="crimes")
     votes = relationship("Votes", back_populates="crime", cascade="all, delete-orphan")
     anonymous_votes = relationship("AnonymousVotes", back_populates="crime", cascade="all, delete-orphan")
@@ -44,7 +78,7 @@ class Crimes(Base):
 class Votes(Base):
     __tablename__ = "votes"
 
-    vote_id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    vote_id = Column(Integer, primary_key=True, autoincrement=True)
     crime_id = Column(Integer, ForeignKey("crimes.crime_id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     vote_type = Column(String, nullable=False)
@@ -52,6 +86,7 @@ class Votes(Base):
 
     __table_args__ = (
         UniqueConstraint("crime_id", "user_id", name="unique_user_vote"),
+        Index("ix_votes_crime_id_vote_type", "crime_id", "vote_type"),
     )
 
     user = relationship("Users", back_populates="votes")
@@ -70,6 +105,7 @@ class AnonymousVotes(Base):
 
     __table_args__ = (
         UniqueConstraint("crime_id", "ip_address", name="unique_anon_vote"),
+        Index("ix_anonymous_votes_crime_id_vote_type", "crime_id", "vote_type"),
     )
 
     crime = relationship("Crimes", back_populates="anonymous_votes")
@@ -78,8 +114,8 @@ class AnonymousVotes(Base):
 class Subscription(Base):
     __tablename__ = "subscriptions"
 
-    id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     radius = Column(Float, nullable=False)
@@ -91,26 +127,145 @@ class Subscription(Base):
 class FlaggedCrime(Base):
     __tablename__ = "flagged_crimes"
 
-    id = Column(Integer, primary_key=True, index=True)
-    crime_id = Column(Integer, ForeignKey("crimes.crime_id"), nullable=False)
+    id = Column(Integer, primary_key=True)
+    crime_id = Column(Integer, ForeignKey("crimes.crime_id"), nullable=False, index=True)
     flagged_by = Column(Integer, ForeignKey("users.user_id"))
     reason = Column(String, default="No reason provided")
     is_flagged = Column(Boolean, default=True)
+    status = Column(String, nullable=False, default="open", server_default="open")  # open | resolved
+    resolved_by = Column(Integer, ForeignKey("users.user_id"), nullable=True)
+    resolved_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
 
+    __table_args__ = (
+        Index("ix_flagged_crimes_status_crime_id", "status", "crime_id"),
+    )
+
     # relationships
     crime = relationship("Crimes", back_populates="flags")
-    admin = relationship("Users", back_populates="flagged_crimes") 
+    admin = relationship("Users", back_populates="flagged_crimes", foreign_keys=[flagged_by])
 
 
 class SOSAlerts(Base):
     __tablename__ = "sos_alerts"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=True)  # Nullable for anonymous alerts
     message = Column(String, nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC), index=True)
+
+    user = relationship("Users", back_populates="sos_alerts")
+
+
+class AuthSession(Base):
+    __tablename__ = "auth_sessions"
+
+    session_id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
+    refresh_token_hash = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    last_used_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+    user = relationship("Users", back_populates="sessions")
+
+
+class CrimeChange(Base):
+    """Append-only log of crime writes; change_id is the sync cursor handed to clients."""
+    __tablename__ = "crime_changes"
+
+    change_id = Column(Integer, primary_key=True, autoincrement=True)
+    # no foreign key: the tombstone has to outlive the crime
+    crime_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # create | update | delete
+    changed_at = Column(DateTime, default=lambda: datetime.now(UTC), index=True)
+
+
+class JobLock(Base):
+    """Lease and last outcome of a scheduled job, shared by every worker; see app/scheduler.py."""
+    __tablename__ = "job_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)  # ok | failed | timeout
+    last_duration_ms = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
+
+
+class IdempotencyKey(Base):
+    """Outcome of a write sent with an Idempotency-Key header; see app/idempotency.py."""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256 of the caller and the header value
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path and body
+    status_code = Column(Integer, nullable=True)  # null while the first request is running
+    content_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# ARCHIVE TIER: crimes past ARCHIVE_AFTER_DAYS and their votes and flags, moved by app/archive.py.
+# Same columns as the live tables plus archived_at; no foreign keys so rows can move in any order.
+
+class CrimeArchive(CrimeMixin, Base):
+    __tablename__ = "crimes_archive"
+
+    crime_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    crime_type = Column(String, nullable=False)
+    description = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    media_url = Column(String, nullable=True)
+    thumbnail_url = Column(String, nullable=True)
+    canonical_id = Column(Integer, nullable=True)
+    trust_rank = Column(Float, nullable=False, default=0.0)
+    is_hidden = Column(Boolean, nullable=False, default=False)
+    deleted_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, index=True)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class VoteArchive(Base):
+    __tablename__ = "votes_archive"
+
+    vote_id = Column(Integer, primary_key=True, autoincrement=False)
+    crime_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    vote_type = Column(String, nullable=False)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class AnonymousVoteArchive(Base):
+    __tablename__ = "anonymous_votes_archive"
+
+    vote_id = Column(Integer, primary_key=True, autoincrement=False)
+    crime_id = Column(Integer, nullable=False, index=True)
+    ip_address = Column(String, nullable=False)
+    vote_type = Column(String, nullable=False)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class FlaggedCrimeArchive(Base):
+    __tablename__ = "flagged_crimes_archive"
 
-    user = relationship("Users", back_populates="sos_alerts")
\ No newline at end of file
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    crime_id = Column(Integer, nullable=False, index=True)
+    flagged_by = Column(Integer)
+    reason = Column(String)
+    is_flagged = Column(Boolean)
+    status = Column(String, nullable=False)
+    resolved_by = Column(Integer, nullable=True)
+    resolved_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
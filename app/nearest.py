@@ -0,0 +1,377 @@
+import heapq
+import math
+import os
+import threading
+import time
+from datetime import datetime, UTC
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models, crime_events
+
+load_dotenv()
+
+EARTH_RADIUS_KM = 6371.0
+NEAREST_LEAF_SIZE = int(os.getenv("NEAREST_LEAF_SIZE", "32"))
+# Full rebuild from the database at most this often (checked on query)
+NEAREST_REBUILD_SECONDS = float(os.getenv("NEAREST_REBUILD_SECONDS", "3600"))
+# Fold pending inserts into the tree once they exceed this share of it
+NEAREST_PENDING_RATIO = float(os.getenv("NEAREST_PENDING_RATIO", "0.05"))
+# Writes this long before a snapshot's database read are replayed onto it too,
+# for transactions that had not committed when the read ran
+SNAPSHOT_REPLAY_SLACK = 60.0
+
+
+def to_xyz(latitude, longitude):
+    """Unit vectors on the sphere; chord length orders points like haversine distance."""
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lng = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord_sq: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def _timestamp(value: Optional[datetime]) -> int:
+    if value is None:
+        return int(time.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return int(value.timestamp())
+
+
+class KDTree:
+    """
+    Static k-d tree stored as flat arrays. Points are reordered so every
+    leaf covers a contiguous slice, which keeps leaf scans vectorised and
+    lets the whole tree be shared as plain arrays.
+    """
+
+    def __init__(self, xyz, ids, types, created, leaf_size: int = NEAREST_LEAF_SIZE):
+        n = len(ids)
+        order = np.arange(n)
+        start, end, dim, val, left, right = [0], [n], [-1], [0.0], [-1], [-1]
+        stack = [0] if n > leaf_size else []
+        while stack:
+            node = stack.pop()
+            s, e = start[node], end[node]
+            idx = order[s:e]
+            pts = xyz[idx]
+            spread = pts.max(axis=0) - pts.min(axis=0)
+            d = int(spread.argmax())
+            if spread[d] == 0:
+                continue  # all points identical, keep as a leaf
+            mid = (e - s) // 2
+            idx = idx[np.argpartition(pts[:, d], mid)]
+            order[s:e] = idx
+            dim[node] = d
+            val[node] = float(xyz[idx[mid], d])
+            for child_start, child_end in ((s, s + mid), (s + mid, e)):
+                start.append(child_start)
+                end.append(child_end)
+                dim.append(-1)
+                val.append(0.0)
+                left.append(-1)
+                right.append(-1)
+                if child_end - child_start > leaf_size:
+                    stack.append(len(start) - 1)
+            left[node], right[node] = len(start) - 2, len(start) - 1
+
+        self.xyz = np.ascontiguousarray(xyz[order])
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.types = np.asarray(types, dtype=np.int32)[order]
+        self.created = np.asarray(created, dtype=np.int64)[order]
+        self.alive = np.ones(n, dtype=bool)
+        self.nodes = np.array([start, end, dim, left, right], dtype=np.int64)
+        self.split = np.array(val, dtype=np.float64)
+        self._init_lookup()
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "KDTree":
+        """Tree over existing arrays, e.g. memory-mapped from a snapshot; nothing is copied."""
+        tree = cls.__new__(cls)
+        for name in ("xyz", "ids", "types", "created", "nodes", "split"):
+            setattr(tree, name, arrays[name])
+        tree.alive = np.ones(len(tree.ids), dtype=bool)
+        tree._init_lookup(arrays.get("by_id"))
+        return tree
+
+    def arrays(self) -> dict:
+        names = ("xyz", "ids", "types", "created", "nodes", "split")
+        return {**{name: getattr(self, name) for name in names}, "by_id": self._by_id}
+
+    def _init_lookup(self, by_id=None):
+        # python lists make the node walk much cheaper than numpy scalar indexing
+        self._start, self._end, self._dim, self._left, self._right = (row.tolist() for row in self.nodes)
+        self._val = self.split.tolist()
+        self._by_id = np.argsort(self.ids, kind="stable") if by_id is None else by_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def slot(self, crime_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.ids, crime_id, sorter=self._by_id))
+        if pos < len(self._by_id):
+            slot = int(self._by_id[pos])
+            if self.ids[slot] == crime_id:
+                return slot
+        return None
+
+    def query(self, q, k: int, type_code: Optional[int], since: Optional[int], heap: list):
+        """Push (-chord², crime_id) of the k nearest live matches into the max-heap `heap`."""
+        if not len(self.ids):
+            return
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(heap) >= k and bound >= -heap[0][0]:
+                continue
+            left = self._left[node]
+            if left < 0:
+                s, e = self._start[node], self._end[node]
+                diff = self.xyz[s:e] - q
+                dist = np.einsum("ij,ij->i", diff, diff)
+                ok = self.alive[s:e]
+                if type_code is not None:
+                    ok = ok & (self.types[s:e] == type_code)
+                if since is not None:
+                    ok = ok & (self.created[s:e] >= since)
+                for i in np.flatnonzero(ok):
+                    d = float(dist[i])
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, int(self.ids[s + i])))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, int(self.ids[s + i])))
+                continue
+            gap = q[self._dim[node]] - self._val[node]
+            near, far = (left, self._right[node]) if gap < 0 else (self._right[node], left)
+            stack.append((far, max(bound, gap * gap)))
+            stack.append((near, bound))
+
+
+class _Buffer:
+    """Append-only arrays for points added since the last tree build, scanned linearly."""
+
+    def __init__(self, capacity: int = 1024):
+        self.count = 0
+        self.xyz = np.empty((capacity, 3))
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.types = np.empty(capacity, dtype=np.int32)
+        self.created = np.empty(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.slots = {}
+
+    def append(self, crime_id, xyz, type_code, created):
+        if self.count == len(self.ids):
+            for name in ("xyz", "ids", "types", "created", "alive"):
+                old = getattr(self, name)
+                grown = np.zeros((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+                grown[: self.count] = old
+                setattr(self, name, grown)
+        i = self.count
+        self.xyz[i], self.ids[i], self.types[i], self.created[i], self.alive[i] = xyz, crime_id, type_code, created, True
+        self.slots[crime_id] = i
+        self.count += 1
+
+    def discard(self, crime_id) -> bool:
+        i = self.slots.pop(crime_id, None)
+        if i is None:
+            return False
+        self.alive[i] = False
+        return True
+
+    def query(self, q, k, type_code, since, heap):
+        n = self.count
+        if not n:
+            return
+        diff = self.xyz[:n] - q
+        dist = np.einsum("ij,ij->i", diff, diff)
+        ok = self.alive[:n]
+        if type_code is not None:
+            ok = ok & (self.types[:n] == type_code)
+        if since is not None:
+            ok = ok & (self.created[:n] >= since)
+        hits = np.flatnonzero(ok)
+        if len(hits) > k:
+            hits = hits[np.argpartition(dist[hits], k)[:k]]
+        for i in hits:
+            d = float(dist[i])
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, int(self.ids[i])))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, int(self.ids[i])))
+
+
+class NearestIndex:
+    """
+    k-nearest crimes by great-circle distance. A KDTree holds the bulk of
+    the points; creates land in a pending buffer and deletes mark tree
+    slots dead until the tree is rebuilt, either when the pending list
+    buffer grows past `pending_ratio` of the tree or every `rebuild_seconds`.
+    """
+
+    def __init__(self, rebuild_seconds: float = NEAREST_REBUILD_SECONDS,
+                 pending_ratio: float = NEAREST_PENDING_RATIO):
+        self.rebuild_seconds = rebuild_seconds
+        self.pending_ratio = pending_ratio
+        self._tree: Optional[KDTree] = None
+        self._pending = _Buffer()
+        self._type_codes = {}
+        self._lock = threading.RLock()
+        # one rebuild at a time; queries and writes only wait for the swap
+        self._build_lock = threading.Lock()
+        self._built_at = 0.0
+        # wall-clock start of the database read behind the current tree
+        self._source_time = 0.0
+        # crime_id -> when this worker removed it, replayed onto installed snapshots
+        self._removed = {}
+
+    def type_code(self, crime_type: str, create: bool = True) -> Optional[int]:
+        key = crime_type.strip().lower()
+        code = self._type_codes.get(key)
+        if code is None and create:
+            code = self._type_codes[key] = len(self._type_codes)
+        return code
+
+    @property
+    def built(self) -> bool:
+        return self._tree is not None
+
+    def build(self, db: Session):
+        started = time.time()
+        rows = db.query(
+            models.Crimes.crime_id,
+            models.Crimes.crime_type,
+            models.Crimes.latitude,
+            models.Crimes.longitude,
+            models.Crimes.created_at,
+        ).filter(models.Crimes.is_visible).all()
+        self.load(
+            [r.crime_id for r in rows],
+            [r.crime_type for r in rows],
+            [r.latitude for r in rows],
+            [r.longitude for r in rows],
+            [_timestamp(r.created_at) for r in rows],
+            source_time=started,
+        )
+
+    def load(self, ids, crime_types, latitudes, longitudes, created, source_time: Optional[float] = None):
+        """
+        Serve from a tree over these rows, read from the database at
+        `source_time`. Creates and deletes seen since then are replayed on top.
+        """
+        with self._lock:
+            types = [self.type_code(t) for t in crime_types]
+        xyz = to_xyz(latitudes, longitudes).reshape(-1, 3)
+        tree = KDTree(xyz, ids, types, created)
+        with self._lock:
+            self._swap(tree, dict(self._type_codes), time.time() if source_time is None else source_time)
+
+    def export(self):
+        """Tree arrays and metadata for publishing as a snapshot (see app/snapshots.py)."""
+        with self._lock:
+            if self._pending.count or not self._tree.alive.all():
+                self._compact()
+            return self._tree.arrays(), {"type_codes": self._type_codes, "source_time": self._source_time}
+
+    def install(self, arrays: dict, meta: dict):
+        """
+        Serve from a published tree. Creates and deletes this worker saw
+        since the snapshot's database read are replayed on top of it.
+        """
+        tree = KDTree.from_arrays(arrays)
+        with self._lock:
+            self._swap(tree, dict(meta["type_codes"]), meta["source_time"])
+
+    def _swap(self, tree: KDTree, type_codes: dict, source_time: float):
+        """Install `tree`, keeping pending creates it lacks and re-applying recent deletes. Call under the lock."""
+        # allow for transactions that were still open when the database read ran
+        since = source_time - SNAPSHOT_REPLAY_SLACK
+        names = {code: name for name, code in self._type_codes.items()}
+        old = self._pending
+        self._type_codes = type_codes
+        self._tree, self._pending = tree, _Buffer()
+        self._removed = {crime_id: at for crime_id, at in self._removed.items() if at >= since}
+        for crime_id in self._removed:
+            slot = tree.slot(crime_id)
+            if slot is not None:
+                tree.alive[slot] = False
+        for i in range(old.count):
+            crime_id = int(old.ids[i])
+            # an update is a remove and an add, so the pending copy replaces the tree's; a create
+            # committed while the read ran is in the tree already
+            recent = crime_id in self._removed or (old.created[i] >= since and tree.slot(crime_id) is None)
+            if old.alive[i] and recent:
+                self._pending.append(crime_id, old.xyz[i], self.type_code(names[int(old.types[i])]),
+                                     int(old.created[i]))
+        self._built_at = time.monotonic()
+        self._source_time = source_time
+
+    def _stale(self) -> bool:
+        return self._tree is None or time.monotonic() - self._built_at > self.rebuild_seconds
+
+    def ensure_built(self, db: Session):
+        if self._stale():
+            # the query runs outside self._lock, so lookups keep being served from the old tree
+            with self._build_lock:
+                if self._stale():
+                    self.build(db)
+
+    def _compact(self):
+        tree, pending = self._tree, self._pending
+        keep = np.flatnonzero(tree.alive)
+        fresh = np.flatnonzero(pending.alive[: pending.count])
+        self._tree = KDTree(*(
+            np.concatenate([getattr(tree, name)[keep], getattr(pending, name)[fresh]])
+            for name in ("xyz", "ids", "types", "created")
+        ))
+        self._pending = _Buffer()
+
+    def add(self, crime_id: int, crime_type: str, latitude: float, longitude: float, created_at=None):
+        with self._lock:
+            self._pending.append(crime_id, to_xyz(latitude, longitude), self.type_code(crime_type), _timestamp(created_at))
+            if self._tree is not None and self._pending.count > max(1000, self.pending_ratio * len(self._tree)):
+                self._compact()
+
+    def remove(self, crime_id: int):
+        with self._lock:
+            self._removed[crime_id] = time.time()
+            if not self._pending.discard(crime_id) and self._tree is not None:
+                slot = self._tree.slot(crime_id)
+                if slot is not None:
+                    self._tree.alive[slot] = False
+
+    def on_crime_event(self, op, new, old):
+        if self._tree is None and not self._build_lock.locked():
+            return  # the lazy build will read the row from the database
+        if old is not None:
+            self.remove(old.crime_id)
+        if new is not None:
+            self.add(new.crime_id, new.crime_type, new.latitude, new.longitude, new.created_at)
+
+    def nearest(self, latitude: float, longitude: float, k: int, crime_type: Optional[str] = None,
+                since: Optional[datetime] = None) -> List[Tuple[int, float]]:
+        """[(crime_id, distance_km)] of the k closest crimes, nearest first."""
+        q = to_xyz(latitude, longitude)
+        type_code = None
+        if crime_type is not None:
+            type_code = self.type_code(crime_type, create=False)
+            if type_code is None:
+                return []
+        since_ts = _timestamp(since) if since is not None else None
+
+        heap = []
+        with self._lock:
+            self._tree.query(q, k, type_code, since_ts, heap)
+            self._pending.query(q, k, type_code, since_ts, heap)
+
+        return [(crime_id, chord_to_km(-neg)) for neg, crime_id in sorted(heap, reverse=True)]
+
+
+index = NearestIndex()
+crime_events.subscribe(index.on_crime_event)
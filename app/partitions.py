@@ -0,0 +1,262 @@
+"""
+Optional monthly range partitioning of `crimes` and `sos_alerts` on
+created_at (PostgreSQL only, enabled with PARTITION_BY_MONTH=true).
+
+On other databases, or with the flag off, the tables stay plain heaps
+and the same created_at range filters are served by the created_at
+indexes, so callers never need to know which layout is in use.
+
+Converting an existing table (`convert`, also run by the alembic
+migration) keeps every row readable and writable throughout. The old
+table becomes the partition for everything before a cutover month, two
+months ahead, and monthly partitions start there:
+
+1. prepare, online: add the range check NOT VALID, fill in missing
+   created_at values in batches, validate the check, and build a unique
+   (id, created_at) index concurrently. Writes continue the whole time.
+2. swap, one short transaction: rename the table to <table>_legacy, put a
+   partitioned table with the same columns, defaults, indexes and
+   outgoing foreign keys in its place, and attach the old table to it.
+   The validated check and the existing indexes mean attaching it does
+   not rescan or rebuild anything.
+
+Old rows stay in <table>_legacy. Queries for recent months prune it
+away, and it ages out with the archive like any other partition.
+
+Partitioned tables cannot be the target of a foreign key unless it
+includes the partition key. Converting `crimes` therefore drops the
+foreign keys that point at it: votes, anonymous votes, flags and
+canonical_id. The application already removes those rows together with
+their crime. The conversion is not reversible by migration.
+"""
+import logging
+import os
+import re
+from datetime import datetime, UTC
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+
+from . import models
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PARTITION_BY_MONTH = os.getenv("PARTITION_BY_MONTH", "false").lower() in ("1", "true", "yes")
+# Partitions are created this many months ahead of the current one
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_FILL_BATCH = int(os.getenv("PARTITION_FILL_BATCH", "5000"))
+
+PARTITIONED_TABLES = {
+    "crimes": models.Crimes.__table__,
+    "sos_alerts": models.SOSAlerts.__table__,
+}
+PARTITION_KEY = "created_at"
+
+
+def enabled(bind) -> bool:
+    return PARTITION_BY_MONTH and bind.dialect.name == "postgresql"
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"), {"t": table}
+    ).first() is not None
+
+
+def create_partition(conn: Connection, table: str, month: datetime):
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    ))
+
+
+def ensure_partitions(conn: Connection, start: Optional[datetime] = None,
+                      months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Create any missing monthly partitions from `start` (default: this month) to `months_ahead`."""
+    now = month_start(datetime.now(UTC))
+    month = month_start(start) if start else now
+    created = 0
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            continue
+        # the months before the cutover belong to the converted table
+        m = max(month, legacy_end(conn, table) or month)
+        while m <= add_months(now, months_ahead):
+            create_partition(conn, table, m)
+            created += 1
+            m = add_months(m, 1)
+    return created
+
+
+def maintain(engine: Engine) -> int:
+    """Startup/scheduled hook: keep future partitions ahead of the clock."""
+    if not enabled(engine):
+        return 0
+    with engine.begin() as conn:
+        return ensure_partitions(conn)
+
+
+# CONVERSION
+
+def _legacy(table: str) -> str:
+    return f"{table}_legacy"
+
+
+def _checks(table: str):
+    return f"{table}_{PARTITION_KEY}_not_null", f"{table}_{PARTITION_KEY}_before_cutover"
+
+
+def cutover_month(now: Optional[datetime] = None) -> datetime:
+    """First month with a partition of its own; rows before it stay in the old table."""
+    # two months out, so writes during a conversion that spans a month end still fit the old table
+    return add_months(month_start(now or datetime.now(UTC)), 2)
+
+
+def legacy_end(conn: Connection, table: str) -> Optional[datetime]:
+    """Upper bound of the partition made from the pre-conversion table, if there is one."""
+    bound = conn.execute(
+        text("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = to_regclass(:t)"),
+        {"t": _legacy(table)},
+    ).scalar()
+    match = re.search(r"TO \('([^']+)'\)", bound or "")
+    return datetime.fromisoformat(match.group(1)) if match else None
+
+
+def prepare(conn: Connection, table: str, cutover: datetime, batch_size: int = PARTITION_FILL_BATCH) -> int:
+    """
+    Get the live `table` ready to become the partition for rows before
+    `cutover` without blocking writes. `conn` must be in autocommit mode:
+    every batch commits on its own and the index is built concurrently.
+    Returns the number of rows whose missing created_at was filled in.
+    """
+    pk = PARTITIONED_TABLES[table].primary_key.columns.values()[0].name
+    not_null, before_cutover = _checks(table)
+    conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{not_null}"'))
+    conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{before_cutover}"'))
+    # NOT VALID checks hold new writes to the range at once and are validated after the fill
+    conn.execute(text(f'ALTER TABLE "{table}" ADD CONSTRAINT "{not_null}" CHECK ({PARTITION_KEY} IS NOT NULL) NOT VALID'))
+    conn.execute(text(
+        f'ALTER TABLE "{table}" ADD CONSTRAINT "{before_cutover}" '
+        f"CHECK ({PARTITION_KEY} < '{cutover:%Y-%m-%d}') NOT VALID"
+    ))
+
+    filled = 0
+    while True:
+        count = conn.execute(text(
+            f'UPDATE "{table}" SET {PARTITION_KEY} = now() AT TIME ZONE \'utc\' '
+            f'WHERE {pk} IN (SELECT {pk} FROM "{table}" WHERE {PARTITION_KEY} IS NULL LIMIT :n)'
+        ), {"n": batch_size}).rowcount
+        filled += count
+        if count < batch_size:
+            break
+        logger.info("partitioning %s: filled in created_at on %d rows", table, filled)
+
+    # SHARE UPDATE EXCLUSIVE: reads and writes carry on while the table is scanned
+    conn.execute(text(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT "{not_null}"'))
+    conn.execute(text(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT "{before_cutover}"'))
+    # the partition's share of the new (id, created_at) primary key
+    key_index = f"{table}_{pk}_{PARTITION_KEY}_key"
+    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{key_index}"'))  # left invalid by an earlier attempt
+    conn.execute(text(f'CREATE UNIQUE INDEX CONCURRENTLY "{key_index}" ON "{table}" ({pk}, {PARTITION_KEY})'))
+    return filled
+
+
+def swap(conn: Connection, table: str, cutover: datetime):
+    """
+    Put a partitioned table in place of the prepared `table` and attach the
+    old one as its partition for rows before `cutover`. Run in one transaction.
+    """
+    meta = PARTITIONED_TABLES[table]
+    legacy = _legacy(table)
+    pk = [c.name for c in meta.primary_key.columns]
+    not_null, before_cutover = _checks(table)
+    inspector = inspect(conn)
+
+    for source in inspector.get_table_names():
+        for fk in inspector.get_foreign_keys(source):
+            if fk["referred_table"] == table:
+                logger.warning("partitioning %s: dropping foreign key %s.%s", table, source, fk["name"])
+                conn.execute(text(f'ALTER TABLE "{source}" DROP CONSTRAINT "{fk["name"]}"'))
+
+    # free the table, primary key and index names for the partitioned table
+    pk_name = inspector.get_pk_constraint(table)["name"]
+    conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+    conn.execute(text(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{pk_name}" TO "{pk_name}_legacy"'))
+    for index in meta.indexes:
+        conn.execute(text(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_legacy"'))
+    # proven by the validated check, so this does not scan
+    conn.execute(text(f'ALTER TABLE "{legacy}" ALTER COLUMN {PARTITION_KEY} SET NOT NULL'))
+
+    # the partition key has to be part of the primary key
+    conn.execute(text(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE ({PARTITION_KEY})'
+    ))
+    conn.execute(text(f'ALTER TABLE "{table}" ADD PRIMARY KEY ({", ".join(pk + [PARTITION_KEY])})'))
+    for column in pk:
+        # the copied default still draws from the old table's sequence; the new table owns it now
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": legacy, "c": column}).scalar()
+        if sequence:
+            conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY "{table}".{column}'))
+    for index in meta.indexes:
+        conn.execute(CreateIndex(index))
+    for fk in meta.foreign_key_constraints:
+        if fk.referred_table.name == table:
+            continue
+        ondelete = f" ON DELETE {fk.ondelete}" if fk.ondelete else ""
+        conn.execute(text(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "fk_{table}_{fk.column_keys[0]}" '
+            f'FOREIGN KEY ({", ".join(c.name for c in fk.columns)}) '
+            f'REFERENCES "{fk.referred_table.name}" ({", ".join(e.column.name for e in fk.elements)}){ondelete}'
+        ))
+
+    # matching indexes and foreign keys on the old table are attached rather than rebuilt
+    conn.execute(text(
+        f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" '
+        f"FOR VALUES FROM (MINVALUE) TO ('{cutover:%Y-%m-%d}')"
+    ))
+    conn.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{not_null}"'))
+    conn.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{before_cutover}"'))
+    ensure_partitions(conn, start=cutover)
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+
+def convert(engine: Engine, tables=tuple(PARTITIONED_TABLES), batch_size: int = PARTITION_FILL_BATCH):
+    """Partition existing tables in place; a no-op off PostgreSQL or for tables already partitioned."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect() as conn:
+        tables = [table for table in tables if not is_partitioned(conn, table)]
+    cutover = cutover_month()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in tables:
+            prepare(conn, table, cutover, batch_size)
+    with engine.begin() as conn:
+        for table in tables:
+            swap(conn, table, cutover)
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    convert(engine)
+    maintain(engine)
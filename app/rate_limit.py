@@ -0,0 +1,131 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Protocol
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    name: str
+    capacity: float      # burst size
+    refill_rate: float   # tokens per second
+
+
+def _per_minute(name: str, burst_env: str, rate_env: str, burst: str, rate: str) -> RateLimitPolicy:
+    return RateLimitPolicy(
+        name=name,
+        capacity=float(os.getenv(burst_env, burst)),
+        refill_rate=float(os.getenv(rate_env, rate)) / 60.0,
+    )
+
+
+# Per-route policies, keyed by client IP
+POLICIES = {
+    "anonymous_vote": _per_minute("anonymous_vote", "ANON_VOTE_BURST", "ANON_VOTE_PER_MINUTE", "20", "10"),
+    "sos": _per_minute("sos", "SOS_BURST", "SOS_PER_MINUTE", "5", "5"),
+}
+
+
+class RateLimitBackend(Protocol):
+    """
+    Storage for token buckets. The in-memory backend is per process; a
+    deployment with several workers can plug in a shared implementation
+    (e.g. a Redis script doing the same refill arithmetic) via `set_backend`.
+    """
+
+    def acquire(self, key: str, policy: RateLimitPolicy, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Return 0.0 if allowed, else seconds until they are available."""
+        ...
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last_refill]; ordered by last use for LRU eviction
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+
+
+class InMemoryBackend:
+    """
+    Buckets are spread over independently locked shards so concurrent
+    requests for different clients rarely contend. Each shard holds at most
+    `max_keys_per_shard` buckets and drops the least recently used one when
+    full; an idle bucket has refilled to capacity anyway, so evicting it
+    loses nothing.
+    """
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 4096):
+        if shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self._mask = shards - 1
+        self._shards = [_Shard() for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def acquire(self, key: str, policy: RateLimitPolicy, cost: float = 1.0) -> float:
+        shard = self._shards[hash(key) & self._mask]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = [policy.capacity, now]
+                shard.buckets[key] = bucket
+                if len(shard.buckets) > self.max_keys_per_shard:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(policy.capacity, bucket[0] + (now - bucket[1]) * policy.refill_rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            missing = cost - bucket[0]
+
+        if policy.refill_rate <= 0:
+            return math.inf
+        return missing / policy.refill_rate
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self._shards)
+
+
+backend: RateLimitBackend = InMemoryBackend()
+
+
+def set_backend(new_backend: RateLimitBackend):
+    global backend
+    backend = new_backend
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def enforce(request: Request, policy_name: str, key: Optional[str] = None):
+    """Raise 429 with Retry-After when the client has exhausted its bucket."""
+    policy = POLICIES[policy_name]
+    wait = backend.acquire(f"{policy.name}:{key or client_ip(request)}", policy)
+    if wait > 0:
+        retry_after = 3600 if math.isinf(wait) else max(1, math.ceil(wait))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, slow down",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def limit(policy_name: str):
+    """Route dependency applying `policy_name` to the caller's IP."""
+    def dependency(request: Request):
+        enforce(request, policy_name)
+    return dependency
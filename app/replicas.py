@@ -0,0 +1,175 @@
+"""
+Routes read-only handlers to read replicas, writes stay on the primary.
+
+Handlers that only read take their session from `get_read_db`, which
+hands out a session on the next healthy replica (round robin) and falls
+back to the primary when:
+
+- no replicas are configured (READ_REPLICA_URLS is empty),
+- the caller wrote something in the last REPLICA_STICKY_SECONDS, so a
+  lagging replica cannot hide their own write from them,
+- no replica could hand out a connection. The pool's pre-ping checks it
+  on checkout, so there is no extra round trip. A failed replica is
+  skipped for REPLICA_RETRY_SECONDS and then tried again.
+
+Writes are noticed by `track_writes`. After every successful non-GET
+request it sends the caller a signed marker holding the write's time,
+as the `last_write` cookie and as the X-Last-Write header, which
+clients without a cookie jar send back. Any worker can check the marker,
+so a follow-up read that lands on another worker still goes to the
+primary. The worker that took the write also remembers it, keyed by
+Authorization header or client address, for callers that send neither.
+"""
+import hashlib
+import hmac
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .database import replica_engines
+
+load_dotenv()
+
+# How long a caller keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# How long a replica that failed its check is left alone
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+WRITE_COOKIE = "last_write"
+WRITE_HEADER = "X-Last-Write"
+_MAX_STICKY_CALLERS = 10000
+_SIGNING_KEY = os.getenv("SECRET_KEY", "").encode()
+
+
+class ReadOnlySession(Session):
+    """Session on a replica; flushing would write to a copy that the primary then overwrites."""
+
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _refuse_flush(session, flush_context, instances):
+    raise RuntimeError("Read replica sessions are read-only; use get_db for writes")
+
+
+class ReplicaRouter:
+    def __init__(self, engines: List[Engine], sticky_seconds: float = REPLICA_STICKY_SECONDS,
+                 retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.engines = list(engines)
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self._next = itertools.cycle(range(len(self.engines))) if self.engines else None
+        self._down_until: Dict[int, float] = {}
+        # caller -> wall-clock time of their last write through this worker
+        self._last_write: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # stickiness
+
+    def mark_write(self, caller: str) -> float:
+        now = time.time()
+        with self._lock:
+            if len(self._last_write) >= _MAX_STICKY_CALLERS:
+                self._last_write = {k: v for k, v in self._last_write.items() if self.is_sticky(v)}
+            self._last_write[caller] = now
+        return now
+
+    def last_write(self, caller: str) -> Optional[float]:
+        return self._last_write.get(caller)
+
+    def is_sticky(self, last_write: Optional[float]) -> bool:
+        return last_write is not None and last_write + self.sticky_seconds > time.time()
+
+    # health
+
+    def mark_down(self, engine: Engine):
+        self._down_until[self.engines.index(engine)] = time.monotonic() + self.retry_seconds
+
+    def healthy(self) -> List[Engine]:
+        """Replicas not currently skipped, starting with the next one in turn."""
+        if not self.engines:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            start = next(self._next)
+        order = [(start + i) % len(self.engines) for i in range(len(self.engines))]
+        return [self.engines[i] for i in order if self._down_until.get(i, 0.0) <= now]
+
+    def session(self, last_write: Optional[float]) -> Optional[Session]:
+        """
+        A session holding a connection to a healthy replica, or None if the
+        caller should use the primary. Close it with `close`.
+        """
+        if self.is_sticky(last_write):
+            return None
+        for engine in self.healthy():
+            try:
+                connection = engine.connect()
+            except DBAPIError:
+                self.mark_down(engine)
+                continue
+            return ReadOnlySession(bind=connection, autoflush=False)
+        return None
+
+    @staticmethod
+    def close(db: Session):
+        connection = db.get_bind()
+        db.close()
+        connection.close()
+
+
+router = ReplicaRouter(replica_engines)
+
+
+def caller_key(request: Request) -> str:
+    return request.headers.get("authorization") or (request.client.host if request.client else "")
+
+
+def _sign(stamp: str) -> str:
+    return hmac.new(_SIGNING_KEY, stamp.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def write_marker(at: float) -> str:
+    stamp = f"{at:.6f}"
+    return f"{stamp}:{_sign(stamp)}"
+
+
+def marker_time(marker: Optional[str]) -> Optional[float]:
+    """The write time a marker carries, or None when it is missing or not ours."""
+    stamp, _, signature = (marker or "").partition(":")
+    if not signature or not hmac.compare_digest(signature, _sign(stamp)):
+        return None
+    try:
+        return float(stamp)
+    except ValueError:
+        return None
+
+
+def last_write(request: Request) -> Optional[float]:
+    """When the caller last wrote, from their marker or from this worker's memory."""
+    times = [
+        marker_time(request.headers.get(WRITE_HEADER) or request.cookies.get(WRITE_COOKIE)),
+        router.last_write(caller_key(request)),
+    ]
+    return max((t for t in times if t is not None), default=None)
+
+
+async def track_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in SAFE_METHODS and response.status_code < 400:
+        written_at = router.mark_write(caller_key(request))
+        if router.engines:
+            marker = write_marker(written_at)
+            response.set_cookie(WRITE_COOKIE, marker, max_age=math.ceil(router.sticky_seconds),
+                                httponly=True, samesite="lax")
+            response.headers[WRITE_HEADER] = marker
+    return response
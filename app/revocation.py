@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models
+
+load_dotenv()
+
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+
+# Re-read this much history on each sync so revocations committed late or
+# stamped by a worker with a slightly slow clock are not missed
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def utcnow() -> datetime:
+    # naive UTC, comparable with what the DateTime columns hand back
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class RevocationList:
+    """
+    In-memory set of revoked session ids, checked on every authenticated
+    request. Revocations made by this worker are added immediately; the
+    ones made by other workers arrive through an incremental sync on
+    ``auth_sessions.revoked_at`` at most every `sync_interval` seconds.
+    Entries are dropped once the session has expired, since no access token
+    can outlive its session's refresh window.
+    """
+
+    def __init__(self, sync_interval: float = REVOCATION_SYNC_SECONDS):
+        self.sync_interval = sync_interval
+        self._revoked: dict = {}  # session_id -> session expires_at
+        self._last_sync: Optional[datetime] = None
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def add(self, session_id: str, expires_at: datetime):
+        with self._lock:
+            self._revoked[session_id] = expires_at
+
+    def sync(self, db: Session):
+        now = utcnow()
+        query = db.query(
+            models.AuthSession.session_id,
+            models.AuthSession.expires_at,
+        ).filter(
+            models.AuthSession.revoked_at.isnot(None),
+            models.AuthSession.expires_at > now,
+        )
+        if self._last_sync is not None:
+            query = query.filter(models.AuthSession.revoked_at >= self._last_sync - SYNC_OVERLAP)
+        rows = query.all()
+
+        with self._lock:
+            for session_id, expires_at in rows:
+                self._revoked[session_id] = expires_at
+            self._last_sync = now
+            for session_id in [s for s, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[session_id]
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def maybe_sync(self, db: Session):
+        if time.monotonic() >= self._next_sync:
+            self.sync(db)
+
+    def reset(self):
+        with self._lock:
+            self._revoked.clear()
+            self._last_sync = None
+            self._next_sync = 0.0
+
+
+revocation_list = RevocationList()
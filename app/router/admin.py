@@ -1,12 +1,13 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from typing import List, Literal, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from app import schemas, crud, models
-from app.dependencies import get_db
+from app import schemas, crud, models, scoring, archive, scheduler, analytics, admission, etags
+from app.dependencies import get_db, get_read_db
 from app.router import auth_utils
-from sqlalchemy import func
+from app.loaders import check_batch
+from sqlalchemy import func, select, union_all
 
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -39,49 +40,256 @@ def flag_crime(
 
 @router.get("/crimes/flagged", response_model=List[schemas.FlaggedCrimeOut])
 def get_flagged_crimes(
+    request: Request,
+    response: Response,
+    status: Optional[Literal["open", "resolved"]] = Query(None, description="Only flags in this state"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
 ):
     # if current_user.role != "admin":
     #     raise HTTPException(status_code=403, detail="Admins only")
 
-    flagged_crimes = crud.get_flagged_crimes(db)
+    etag = etags.tag(crud.get_flagged_crimes_version(db, status))
+    not_modified = etags.not_modified(request, response, etag, private=True)
+    if not_modified:
+        return not_modified
+
+    flagged_crimes = crud.get_flagged_crimes(db, status, limit, offset)
     return flagged_crimes
 
 
+@router.get("/moderation/queue", response_model=schemas.ModerationQueueResponse)
+def get_moderation_queue(
+    status: Literal["open", "resolved"] = Query("open"),
+    crime_type: Optional[str] = Query(None),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Flagged crimes grouped with their flag counts, most flagged first."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    region = (min_lat, min_lng, max_lat, max_lng)
+    if any(v is not None for v in region) and any(v is None for v in region):
+        raise HTTPException(status_code=400, detail="Give all of min_lat, min_lng, max_lat, max_lng or none")
+
+    total, rows = crud.get_moderation_queue(
+        db, status, crime_type, region if region[0] is not None else None, limit, offset
+    )
+    items = [
+        {
+            "crime_id": crime.crime_id,
+            "crime_type": crime.crime_type,
+            "description": crime.description,
+            "latitude": crime.latitude,
+            "longitude": crime.longitude,
+            "is_hidden": crime.is_hidden,
+            "flag_count": flag_count,
+            "last_flagged_at": last_flagged_at,
+        }
+        for crime, flag_count, last_flagged_at in rows
+    ]
+    return {"total": total, "items": items}
+
+
+@router.post("/moderation/actions")
+def moderate_crimes(
+    body: schemas.ModerationAction,
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Resolve, hide, unhide or delete a batch of crimes in one transaction."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    check_batch(body.crime_ids)
+
+    crime_ids = list(dict.fromkeys(body.crime_ids))
+    flags_resolved = 0
+    if body.action == "delete":
+        affected = crud.delete_crimes(db, crime_ids)
+    elif body.action == "unhide":
+        affected = crud.set_crimes_hidden(db, crime_ids, hidden=False)
+    else:
+        affected = crud.set_crimes_hidden(db, crime_ids, hidden=True) if body.action == "hide" else []
+        flags_resolved = crud.resolve_flags(db, crime_ids, current_user.user_id)
+    db.commit()
+
+    return {"action": body.action, "crime_ids": affected, "flags_resolved": flags_resolved}
+
+
+
+@router.post("/sessions/{session_id}/revoke")
+def revoke_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    revoked = auth_utils.revoke_sessions(db, session_id=session_id)
+    if not revoked:
+        raise HTTPException(status_code=404, detail="Active session not found")
+    return {"revoked": revoked}
+
+
+@router.post("/users/{user_id}/sessions/revoke")
+def revoke_user_sessions(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    return {"revoked": auth_utils.revoke_sessions(db, user_id=user_id)}
+
+
+@router.post("/scores/recompute")
+def recompute_scores(
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Rebuild every crime's trust score, e.g. after changing the decay settings."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    return {"scored": scoring.recompute(db)}
+
+
+@router.post("/archive/run")
+def run_archive(
+    older_than_days: float = Query(archive.ARCHIVE_AFTER_DAYS, gt=0),
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Move crimes older than `older_than_days` and their votes and flags to the archive tables."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    return {"archived": archive.run(db, older_than_days)}
+
+
+@router.get("/jobs", response_model=List[schemas.JobStatus])
+def list_jobs(
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Background jobs with this worker's run counts and the last run across all workers."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    return scheduler.scheduler.status(db)
+
+
+@router.post("/jobs/{name}/run", response_model=schemas.JobStatus)
+def run_job(
+    name: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Run a background job now; skipped if another worker holds its lease."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    job = scheduler.scheduler.jobs.get(name)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    scheduler.scheduler.run_job(job, bind=db.get_bind(), force=True)
+    return next(row for row in scheduler.scheduler.status(db) if row["name"] == name)
+
+
+@router.get("/admission", response_model=schemas.AdmissionStatus)
+def get_admission_status(current_user: schemas.UserBase = Depends(auth_utils.get_current_user)):
+    """This worker's concurrency limit, queues, and admitted and shed requests per priority class."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    return admission.controller.status()
+
+
+@router.get("/analytics", response_model=schemas.AnalyticsStatus)
+def get_analytics_status(
+    db: Session = Depends(get_read_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Size and freshness of this worker's columnar copy of the crimes behind /admin/statistics."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    analytics.snapshot.ensure_fresh(db)
+    return analytics.snapshot.status()
+
 
 # to start today 
 
 @router.get("/statistics")
 def get_statistics(
-    db: Session = Depends(get_db),
+    collapse_duplicates: bool = Query(False, description="Count each incident once"),
+    include_archived: bool = Query(False, description="Also count crimes moved to the archive tier"),
+    since: Optional[datetime] = Query(None, description="Only count crimes reported at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only count crimes reported before this time"),
+    db: Session = Depends(get_read_db),
     current_user: schemas.UserBase = Depends(auth_utils.get_current_user)
 ):
     
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
+    if analytics.ANALYTICS_ENABLED and not include_archived:
+        analytics.snapshot.ensure_fresh(db)
+        return analytics.snapshot.statistics(since, until, collapse_duplicates)
+
+    # live (not soft-deleted) crimes, optionally together with the archive
+    tiers = [models.Crimes] + ([models.CrimeArchive] if include_archived else [])
+
+    def reports(m):
+        # the range goes inside each branch so partitioned storage can prune months
+        criteria = [m.deleted_at.is_(None)]
+        if since:
+            criteria.append(m.created_at >= since)
+        if until:
+            criteria.append(m.created_at < until)
+        return select(m.crime_id, m.crime_type, m.latitude, m.longitude, m.canonical_id).where(*criteria)
+
+    source = union_all(*(reports(m) for m in tiers)).subquery("reports")
+    c = source.c
+
+    def crimes(*columns):
+        query = db.query(*columns).select_from(source)
+        if collapse_duplicates:
+            query = query.filter(c.canonical_id.is_(None))
+        return query
+
     # total reports
-    total_reports = db.query(func.count(models.Crimes.crime_id)).scalar()
+    total_reports = crimes(func.count(c.crime_id)).scalar()
 
     # top crime types
     top_types = (
-        db.query(models.Crimes.crime_type, func.count(models.Crimes.crime_id))
-        .group_by(models.Crimes.crime_type)
-        .order_by(func.count(models.Crimes.crime_id).desc())
+        crimes(c.crime_type, func.count(c.crime_id))
+        .group_by(c.crime_type)
+        .order_by(func.count(c.crime_id).desc())
         .limit(5)
         .all()
     )
 
     # hotspots (group by lat/long)
     hotspots = (
-        db.query(
-            models.Crimes.latitude,
-            models.Crimes.longitude,
-            func.count(models.Crimes.crime_id).label("crime_count")
+        crimes(
+            c.latitude,
+            c.longitude,
+            func.count(c.crime_id).label("crime_count")
         )
-        .group_by(models.Crimes.latitude, models.Crimes.longitude)
-        .order_by(func.count(models.Crimes.crime_id).desc())
+        .group_by(c.latitude, c.longitude)
+        .order_by(func.count(c.crime_id).desc())
         .limit(5)
         .all()
     )
@@ -14,7 +14,7 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Check if email or username already exists
     if crud.check_user(db, email=user.email, username=user.username, use_or=True):
         raise HTTPException(status_code=400, detail="Email or username already taken")
-    hashed_password = auth_utils.pwd_context.hash(user.password)
+    hashed_password = auth_utils.hash_password(user.password)
     new_user = crud.create_user(db, user, hashed_password)
     return {"message": "User created successfully", "username": new_user.username}
 
@@ -32,12 +32,26 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = auth_utils.create_access_token(
-        data={"sub": user.username},
-        expires_delta=timedelta(minutes=auth_utils.ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    return auth_utils.start_session(db, user)
 
-    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/refresh")
+def refresh(body: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    # no password check here, the refresh token stands in for it
+    return auth_utils.refresh_session(db, body.refresh_token)
+
+
+@router.post("/logout")
+def logout(
+    db: Session = Depends(get_db),
+    verified = Depends(auth_utils.get_token_claims),
+    current_user: models.Users = Depends(auth_utils.get_current_user)
+):
+    session_id = verified.claims.get("sid")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="Token is not bound to a session")
+    auth_utils.revoke_sessions(db, session_id=session_id)
+    return {"message": "Logged out"}
 
 
 @router.get("/me/", response_model=schemas.UserResponse)
@@ -60,10 +74,10 @@ async def update_user_profile(
 
     # ✅ Update password securely
     if updateUser.old_password and updateUser.new_password:
-        if not auth_utils.pwd_context.verify(updateUser.old_password, user.hashed_password):
+        if not auth_utils.verify_password(updateUser.old_password, user.hashed_password):
             raise HTTPException(status_code=400, detail="Old password is incorrect")
 
-        user.hashed_password = auth_utils.pwd_context.hash(updateUser.new_password)
+        user.hashed_password = auth_utils.hash_password(updateUser.new_password)
 
     db.commit()
     db.refresh(user)
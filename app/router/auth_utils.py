@@ -1,14 +1,19 @@
+import hashlib
+import hmac
 import os
+import secrets
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+import jwt
 from sqlalchemy.orm import Session
 from app.dependencies import get_db
 from app import crud, models
+from app.token_verifier import TokenVerifier, VerificationResult
+from app.revocation import revocation_list, utcnow
 
 
 # Load environment variables
@@ -17,17 +22,29 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context, built on first use: passlib and the bcrypt
+# backend are slow to load and most requests never touch a password
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # OAuth2 token scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
+# Decoded-claims cache shared by every request in this worker
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
+
 
 # Password verification
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def hash_password(password: str) -> str:
+    return get_pwd_context().hash(password)
 
 # User authentication
 def authenticate_user(db: Session, username: str, password: str):
@@ -48,6 +65,77 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+
+# Refresh tokens are "<session_id>.<secret>"; only a hash of the secret is stored
+def _hash_refresh_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+def _issue_tokens(username: str, session_id: str, secret: str) -> dict:
+    access_token = create_access_token(
+        data={"sub": username, "sid": session_id},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": f"{session_id}.{secret}",
+        "token_type": "bearer",
+    }
+
+def start_session(db: Session, user: models.Users) -> dict:
+    """Open a refresh session for a freshly authenticated user."""
+    session_id = secrets.token_hex(16)
+    secret = secrets.token_urlsafe(32)
+    crud.create_auth_session(
+        db,
+        session_id=session_id,
+        user_id=user.user_id,
+        refresh_token_hash=_hash_refresh_secret(secret),
+        expires_at=utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return _issue_tokens(user.username, session_id, secret)
+
+def refresh_session(db: Session, refresh_token: str) -> dict:
+    """
+    Exchange a refresh token for a new access/refresh pair. Each refresh
+    token works once; presenting an already rotated one means it leaked,
+    so the whole session is revoked.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    session_id, _, secret = refresh_token.partition(".")
+    db_session = crud.get_auth_session(db, session_id) if secret else None
+    if not db_session or db_session.revoked_at or db_session.expires_at <= utcnow():
+        raise invalid
+
+    old_hash = _hash_refresh_secret(secret)
+    if not hmac.compare_digest(db_session.refresh_token_hash, old_hash):
+        revoke_sessions(db, session_id=session_id)
+        raise invalid
+
+    new_secret = secrets.token_urlsafe(32)
+    # compare-and-swap so two concurrent refreshes cannot both succeed
+    rotated = db.query(models.AuthSession).filter(
+        models.AuthSession.session_id == session_id,
+        models.AuthSession.refresh_token_hash == old_hash,
+    ).update({
+        models.AuthSession.refresh_token_hash: _hash_refresh_secret(new_secret),
+        models.AuthSession.last_used_at: utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    if not rotated:
+        raise invalid
+
+    return _issue_tokens(db_session.user.username, session_id, new_secret)
+
+def revoke_sessions(db: Session, session_id: Optional[str] = None, user_id: Optional[int] = None) -> int:
+    revoked = crud.revoke_auth_sessions(db, utcnow(), session_id=session_id, user_id=user_id)
+    for revoked_id, expires_at in revoked:
+        revocation_list.add(revoked_id, expires_at)
+    return len(revoked)
+
 async def get_token_optional(request: Request) -> Optional[str]:
     """
     Wrapper to make sure we return None when no token is provided,
@@ -59,30 +147,48 @@ async def get_token_optional(request: Request) -> Optional[str]:
     return token
 
 
+def get_token_claims(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> Optional[VerificationResult]:
+    """
+    Verify the bearer token once per request. FastAPI caches dependency
+    results within a request, so every dependency asking for the claims
+    shares this result.
+    """
+    if not token:
+        return None
+    verified = token_verifier.try_verify(token)
+    session_id = verified.claims.get("sid") if verified.claims else None
+    if session_id:
+        revocation_list.maybe_sync(db)
+        if session_id in revocation_list:
+            return VerificationResult(None, "Session has been revoked")
+    return verified
+
+
 # Get current user from token
 def get_current_user(
     db: Session = Depends(get_db), 
-    token: str = Depends(oauth2_scheme)
+    verified: Optional[VerificationResult] = Depends(get_token_claims)
 ):
-    if not token:
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if not username:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token payload missing username",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except JWTError as e:
+    if verified.error:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Token decode failed: {verified.error}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    username: str = verified.claims.get("sub")
+    if not username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Token decode failed: {str(e)}",
+            detail="Token payload missing username",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
@@ -96,27 +202,18 @@ def get_current_user(
     return user
 
 def get_current_user_optional(
-    token: str = Depends(oauth2_scheme),
+    verified: Optional[VerificationResult] = Depends(get_token_claims),
     db: Session = Depends(get_db)
 ):
     """
     Return current user if token is valid,
     otherwise return None (anonymous user).
     """
-    if not token:  # no token provided or empty string
+    if not verified or verified.error:  # no token, empty string or invalid token
         return None
 
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-
-        if not username or not isinstance(username, str):
-            return None
-
-        
-
-    except JWTError:
+    username: str = verified.claims.get("sub")
+    if not username or not isinstance(username, str):
         return None
 
     return crud.check_user(db, username=username)
@@ -1,11 +1,15 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, status, Query, Request, Response, UploadFile
+from typing import List, Literal, Optional
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app import schemas, crud, models
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.router import auth_utils
+from app import tiles, nearest, scoring, change_log, media, trends, etags
+from app.loaders import Loaders, check_batch, get_loaders
+from datetime import datetime, UTC
 import math
 
 router = APIRouter(prefix="/crime", tags=["Crime"])
@@ -49,19 +53,64 @@ def create_crime(
 
 @router.get("/crime", response_model=List[schemas.CrimeResponse])
 def get_crimes(
+    request: Request,
+    response: Response,
     crime_type: Optional[str] = Query(None, description="Filter by crime type"),
     radius: Optional[float] = Query(None, description="Radius in km"),
     lat: Optional[float] = Query(None, description="Latitude for radius filter"),
     lng: Optional[float] = Query(None, description="Longitude for radius filter"),
-    db: Session = Depends(get_db),
+    collapse_duplicates: bool = Query(False, description="Only return the canonical report of each incident"),
+    min_score: Optional[float] = Query(None, description="Only crimes whose trust score is at least this"),
+    sort: Optional[Literal["score", "newest"]] = Query(None, description="Order by trust score or by report time"),
+    include_archived: bool = Query(False, description="Also search crimes moved to the archive tier"),
+    since: Optional[datetime] = Query(None, description="Only crimes reported at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only crimes reported before this time"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(models.Crimes)
+    tiers = (models.Crimes, models.CrimeArchive) if include_archived else (models.Crimes,)
+    queries = []
+    for model in tiers:
+        query = db.query(model).filter(model.is_visible)
+
+        # a created_at range lets partitioned storage skip whole months
+        if since:
+            query = query.filter(model.created_at >= since)
+        if until:
+            query = query.filter(model.created_at < until)
+
+        if collapse_duplicates:
+            query = query.filter(model.canonical_id.is_(None))
+
+        if min_score is not None:
+            query = query.filter(model.trust_rank >= scoring.rank_threshold(min_score))
+
+        # ✅ Filter by crime type
+        if crime_type:
+            query = query.filter(model.crime_type.ilike(f"%{crime_type}%"))
+
+        queries.append(query)
 
-    # ✅ Filter by crime type
-    if crime_type:
-        query = query.filter(models.Crimes.crime_type.ilike(f"%{crime_type}%"))
+    # answer a revalidation from one aggregate per tier, before fetching any rows
+    versions = [
+        tuple(query.with_entities(func.count(model.crime_id), func.max(model.updated_at), func.sum(model.trust_rank)).one())
+        for model, query in zip(tiers, queries)
+    ]
+    not_modified = etags.not_modified(request, response, etags.tag(versions, etags.score_tick(), weak=True))
+    if not_modified:
+        return not_modified
 
-    crimes = query.all()
+    crimes = []
+    for model, query in zip(tiers, queries):
+        if sort == "score":
+            query = query.order_by(model.trust_rank.desc(), model.crime_id.desc())
+        elif sort == "newest":
+            query = query.order_by(model.created_at.desc(), model.crime_id.desc())
+        crimes += query.all()
+
+    if include_archived and sort == "score":
+        crimes.sort(key=lambda c: (c.trust_rank, c.crime_id), reverse=True)
+    elif include_archived and sort == "newest":
+        crimes.sort(key=lambda c: (c.created_at, c.crime_id), reverse=True)
 
     # ✅ Apply radius filter in Python
     if radius and lat and lng:
@@ -72,10 +121,134 @@ def get_crimes(
 
     return crimes
 
+@router.get("/clusters")
+def get_clusters(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22, description="Map zoom level"),
+    crime_type: Optional[str] = Query(None, description="Only count this crime type"),
+    db: Session = Depends(get_db),
+):
+    """Pre-clustered crime counts per map cell inside a bounding box."""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="min_lat/min_lng must not exceed max_lat/max_lng")
+
+    tiles.index.ensure_built(db)
+    try:
+        cells = tiles.index.clusters(min_lat, min_lng, max_lat, max_lng, zoom, crime_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"zoom": min(zoom, tiles.index.max_level), "cells": cells}
+
+@router.get("/trends", response_model=schemas.TrendSeries)
+def get_trends(
+    bucket: Literal["hour", "day", "week"] = Query("day", description="Bucket width; weeks start on Monday (UTC)"),
+    since: Optional[datetime] = Query(None, description="Start of the window (default: 30 days before until)"),
+    until: Optional[datetime] = Query(None, description="End of the window (default: now)"),
+    crime_type: Optional[str] = Query(None, description="Only count this crime type (exact match)"),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    db: Session = Depends(get_read_db),
+):
+    """Crime counts per time bucket, optionally inside a bounding box; counts[i] covers start + i * step."""
+    box = (min_lat, min_lng, max_lat, max_lng)
+    if any(v is None for v in box):
+        if any(v is not None for v in box):
+            raise HTTPException(status_code=400, detail="Give all of min_lat, min_lng, max_lat, max_lng or none")
+        box = None
+    elif min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="min_lat/min_lng must not exceed max_lat/max_lng")
+
+    until = until or datetime.now(UTC)
+    since = since or until - timedelta(days=30)
+    try:
+        return trends.series(db, bucket, since, until, crime_type, box)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/nearest", response_model=List[schemas.NearbyCrimeResponse])
+def get_nearest_crimes(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100, description="Number of crimes to return"),
+    crime_type: Optional[str] = Query(None, description="Only return this crime type"),
+    since_hours: Optional[float] = Query(None, gt=0, description="Only crimes reported in the last N hours"),
+    db: Session = Depends(get_db),
+):
+    """The k crimes closest to a point, nearest first."""
+    since = datetime.now(UTC) - timedelta(hours=since_hours) if since_hours else None
+
+    nearest.index.ensure_built(db)
+    hits = nearest.index.nearest(lat, lng, k, crime_type, since)
+    if not hits:
+        return []
+
+    crimes = crud.get_crimes_by_ids(db, [crime_id for crime_id, _ in hits])
+    return [
+        {**schemas.CrimeResponse.model_validate(crimes[crime_id]).model_dump(), "distance_km": round(distance, 3)}
+        for crime_id, distance in hits
+        if crime_id in crimes
+    ]
+
+@router.get("/changes", response_model=schemas.ChangeFeedResponse)
+def get_changes(
+    since: Optional[int] = Query(None, ge=0, description="Cursor from the previous sync; omit to get the current cursor"),
+    limit: int = Query(500, ge=1, le=change_log.CHANGE_FEED_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """
+    Crimes created, updated or deleted after `since`, oldest first. A crime
+    changed several times in one page appears once with its latest state;
+    deleted crimes come back as tombstones with `crime` set to null.
+    """
+    head = change_log.head(db)
+    if since is None:
+        return {"changes": [], "cursor": head, "has_more": False}
+
+    oldest = change_log.oldest(db)
+    if since > head or (oldest is not None and since < oldest - 1):
+        raise HTTPException(status_code=410, detail="Sync cursor expired, fetch the full list again")
+
+    rows = change_log.changes_since(db, since, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {row.crime_id: row for row in rows}
+    crimes = crud.get_crimes_by_ids(db, [crime_id for crime_id, row in latest.items() if row.op != "delete"])
+    changes = []
+    for row in sorted(latest.values(), key=lambda r: r.change_id):
+        crime = crimes.get(row.crime_id)
+        # deleted by a change past this page
+        op = row.op if crime is not None else "delete"
+        changes.append({"change_id": row.change_id, "op": op, "crime_id": row.crime_id, "crime": crime})
+
+    return {"changes": changes, "cursor": rows[-1].change_id if rows else since, "has_more": has_more}
+
+@router.get("/batch", response_model=schemas.CrimeBatchResponse)
+def get_crimes_batch(
+    ids: List[int] = Query(..., description="Crime IDs, e.g. ?ids=1&ids=2"),
+    include_votes: bool = Query(False, description="Also return the vote tally of each crime"),
+    loaders: Loaders = Depends(get_loaders),
+):
+    """Several crimes (and optionally their votes) in one round trip, in the order asked for."""
+    check_batch(ids)
+    crimes = loaders.crimes.load_many(ids)
+    found = [crime_id for crime_id, crime in crimes.items() if crime is not None]
+    return {
+        "crimes": [crimes[crime_id] for crime_id in found],
+        "missing": [crime_id for crime_id, crime in crimes.items() if crime is None],
+        "votes": loaders.vote_tallies.load_many(found) if include_votes else None,
+    }
+
 @router.get("/crime/{crime_id}", response_model=schemas.CrimeResponse)
 def get_crime(crime_id: int, db: Session = Depends(get_db)):
     crime = crud.get_crime_by_id(db, crime_id)
-    if not crime:
+    if not crime or crime.is_hidden:
         raise HTTPException(status_code=404, detail="Crime not found")
     return crime
 
@@ -100,14 +273,48 @@ def update_crime(crime_id: int, crime: schemas.CrimeUpdate, db: Session = Depend
     return db_crime
 
 
+@router.post("/{crime_id}/media", response_model=schemas.CrimeResponse)
+def upload_media(
+    crime_id: int,
+    file: UploadFile = File(..., description="Photo (JPEG, PNG, WebP) or MP4 video"),
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user),
+):
+    """Attach a photo or video to a report; image thumbnails follow in the background."""
+    db_crime = crud.get_crime_by_id(db, crime_id)
+    if not db_crime:
+        raise HTTPException(status_code=404, detail="Crime not found")
+    if db_crime.user_id != current_user.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to update this crime")
+    if file.content_type not in media.ALLOWED_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported media type {file.content_type}")
+
+    try:
+        key = media.store(crime_id, file.file, file.content_type)
+    except media.TooLarge:
+        raise HTTPException(status_code=413, detail=f"Media larger than {media.MEDIA_MAX_BYTES} bytes")
+
+    db_crime.media_url = media.get_storage().url(key)
+    db_crime.thumbnail_url = None
+    db.commit()
+    db.refresh(db_crime)
+    if file.content_type.startswith("image/"):
+        media.submit_thumbnail(db.get_bind(), crime_id, key)
+    return db_crime
+
+
 @router.delete("/crime/{crime_id}")
 def delete_crime(crime_id: int, db: Session = Depends(get_db), current_user: schemas.UserBase = Depends(auth_utils.get_current_user)):
     db_crime = crud.get_crime_by_id(db, crime_id)
 
+    if not db_crime:
+        raise HTTPException(status_code=404, detail="Crime not found")
+
     if db_crime.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this crime")
 
-    db.delete(db_crime)
+    crud.detach_duplicates(db, db_crime)
+    crud.delete_crimes(db, [crime_id])
     db.commit()
 
     return {"message": "Crime deleted successfully"}
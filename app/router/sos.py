@@ -1,17 +1,18 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from typing import List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from app import schemas, crud, models
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.router import auth_utils
+from app import rate_limit, etags
 
 
 
 router = APIRouter(prefix="/sos", tags=["SOS"])
 
-@router.post("/send_sos", response_model=schemas.SOSResponse)
+@router.post("/send_sos", response_model=schemas.SOSResponse, dependencies=[Depends(rate_limit.limit("sos"))])
 def send_sos_alert(
     sos_request: schemas.SOSCreate,
     db: Session = Depends(get_db),
@@ -23,7 +24,11 @@ def send_sos_alert(
 
 @router.get("/sos_alerts", response_model=List[schemas.SOSResponse])
 def get_all_sos_alerts(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    since: Optional[datetime] = Query(None, description="Only alerts sent at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only alerts sent before this time"),
+    db: Session = Depends(get_read_db),
     current_user: schemas.UserBase = Depends(auth_utils.get_current_user)
 ):
     if current_user.role != "admin":
@@ -31,7 +36,12 @@ def get_all_sos_alerts(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin access required to view all SOS alerts",
         )
-    sos_alerts = crud.get_all_sos_alerts(db)
+    etag = etags.tag(crud.get_sos_alerts_version(db, since, until))
+    not_modified = etags.not_modified(request, response, etag, private=True)
+    if not_modified:
+        return not_modified
+
+    sos_alerts = crud.get_all_sos_alerts(db, since, until)
     return sos_alerts
 
 
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from app import schemas, crud, models
+from app import schemas, crud, models, geofence
 from app.dependencies import get_db
 from app.router import auth_utils
 
@@ -77,4 +77,29 @@ def get_subscription(
     if not sub_obj:
         raise HTTPException(status_code=404, detail="No subscription found for the user")
 
-    return sub_obj
\ No newline at end of file
+    return sub_obj
+
+
+@router.post("/pings", response_model=schemas.PingResponse)
+def check_location_pings(
+    batch: schemas.PingBatch,
+    db: Session = Depends(get_db),
+    current_user: schemas.UserBase = Depends(auth_utils.get_current_user)
+):
+    """
+    Check a batch of location pings (oldest first) against the danger zones.
+    Each zone is reported to a user at most once per cooldown.
+    """
+    if not batch.pings:
+        raise HTTPException(status_code=400, detail="At least one ping is required")
+    if len(batch.pings) > geofence.GEOFENCE_MAX_PINGS:
+        raise HTTPException(status_code=400, detail=f"At most {geofence.GEOFENCE_MAX_PINGS} pings per request")
+
+    geofence.zones.ensure_built(db)
+    alerts = geofence.check_pings(
+        current_user.user_id,
+        [(ping.latitude, ping.longitude) for ping in batch.pings],
+        geofence.zones,
+        geofence.alert_state,
+    )
+    return {"checked": len(batch.pings), "alerts": alerts}
\ No newline at end of file
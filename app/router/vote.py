@@ -1,12 +1,14 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app import schemas, crud, models
-from app.dependencies import get_db
+from app.dependencies import get_db, get_read_db
 from app.router import auth_utils
+from app import rate_limit
+from app.loaders import Loaders, check_batch, get_loaders
 
 
 router = APIRouter(prefix="/vote", tags=["Vote"])
@@ -23,7 +25,8 @@ def create_vote(
     if current_user:
         return crud.create_vote(db, crime_id, current_user.user_id, vote)
     else:
-        ip_address = request.client.host
+        ip_address = rate_limit.client_ip(request)
+        rate_limit.enforce(request, "anonymous_vote", ip_address)
         return crud.create_anonymous_vote(db, crime_id, vote, ip_address)
 
 
@@ -31,38 +34,23 @@ def create_vote(
 
 
 
+@router.get("/crimes/votes", response_model=Dict[int, schemas.VoteTally])
+def get_votes_batch(
+    ids: List[int] = Query(..., description="Crime IDs, e.g. ?ids=1&ids=2"),
+    loaders: Loaders = Depends(get_loaders),
+):
+    """Vote tallies of several crimes, keyed by crime_id."""
+    check_batch(ids)
+    return loaders.vote_tallies.load_many(ids)
+
+
 @router.get("/crimes/{crime_id}/votes")
 def get_votes(
     crime_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    # Get authenticated votes count
-    auth_votes = db.query(models.Votes.vote_type, func.count(models.Votes.vote_id)) \
-        .filter(models.Votes.crime_id == crime_id) \
-        .group_by(models.Votes.vote_type) \
-        .all()
-
-    # Get anonymous votes count
-    anon_votes = db.query(models.AnonymousVotes.vote_type, func.count(models.AnonymousVotes.vote_id)) \
-        .filter(models.AnonymousVotes.crime_id == crime_id) \
-        .group_by(models.AnonymousVotes.vote_type) \
-        .all()
-
-    # Convert results into dictionaries
-    result = {
-        "authenticated": {vote_type: count for vote_type, count in auth_votes},
-        "anonymous": {vote_type: count for vote_type, count in anon_votes},
-    }
-
-    # Optionally add a total aggregation
-    total_votes = {}
-    for section in ["authenticated", "anonymous"]:
-        for vote_type, count in result[section].items():
-            total_votes[vote_type] = total_votes.get(vote_type, 0) + count
-
-    result["total"] = total_votes
-
-    return result
+    # authenticated, anonymous and total counts per vote type
+    return crud.get_vote_tallies(db, [crime_id])[crime_id]
 
                 
     
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+In-process scheduler for periodic maintenance jobs.
+
+Started from the app's lifespan, a daemon thread wakes each registered
+job every `interval` seconds, stretched by up to `jitter` of the interval
+so workers started together drift apart. Each run happens on a small
+thread pool, so one slow job does not hold up the rest.
+
+Exclusive jobs (the default) run on one worker at a time. Before a run,
+the worker takes a lease on the job's `job_locks` row with a single
+conditional UPDATE. The lease is only granted when nobody holds it and
+nobody finished the job within the last 90% of its interval. That works
+the same on SQLite and Postgres. Jobs that fill per-process state, such
+as the in-memory indexes, are registered with exclusive=False and run on
+every worker.
+
+A run that outlives its timeout is recorded as "timeout". A Python thread
+cannot be killed, so the run keeps going in the background. Its lease is
+extended by one more timeout, and this worker will not start the same job
+again until the run ends.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import or_, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import analytics, archive, change_log, dedup, geofence, idempotency, models, nearest, partitions, scoring, snapshots, tiles
+from .database import engine
+from .revocation import utcnow
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "600"))
+JOB_JITTER = float(os.getenv("JOB_JITTER", "0.1"))
+
+JOB_ARCHIVE_SECONDS = float(os.getenv("JOB_ARCHIVE_SECONDS", "86400"))
+JOB_PRUNE_CHANGES_SECONDS = float(os.getenv("JOB_PRUNE_CHANGES_SECONDS", "3600"))
+JOB_RECOMPUTE_SCORES_SECONDS = float(os.getenv("JOB_RECOMPUTE_SCORES_SECONDS", "86400"))
+JOB_PARTITIONS_SECONDS = float(os.getenv("JOB_PARTITIONS_SECONDS", "86400"))
+JOB_WARM_INDEXES_SECONDS = float(os.getenv("JOB_WARM_INDEXES_SECONDS", "300"))
+JOB_PRUNE_IDEMPOTENCY_SECONDS = float(os.getenv("JOB_PRUNE_IDEMPOTENCY_SECONDS", "3600"))
+JOB_PRUNE_DEDUP_SECONDS = float(os.getenv("JOB_PRUNE_DEDUP_SECONDS", "600"))
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[Session], object], interval: float,
+                 timeout: float = JOB_TIMEOUT_SECONDS, jitter: float = JOB_JITTER, exclusive: bool = True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.exclusive = exclusive
+        self.next_run = 0.0
+        self.dispatched = False
+        self.thread: Optional[threading.Thread] = None
+        # metrics for this worker
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.last_status: Optional[str] = None
+        self.last_duration_ms: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self.last_result = None
+
+    @property
+    def running(self) -> bool:
+        return self.dispatched or (self.thread is not None and self.thread.is_alive())
+
+    def schedule_next(self, now: float, first: bool = False):
+        spread = random.uniform(0, self.jitter) * self.interval
+        self.next_run = now + (spread if first else self.interval + spread)
+
+
+class Scheduler:
+    def __init__(self, bind: Engine, workers: int = SCHEDULER_WORKERS):
+        self.bind = bind
+        self.jobs: Dict[str, Job] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, fn: Callable[[Session], object], interval: float, **options) -> Job:
+        job = Job(name, fn, interval, **options)
+        self.jobs[name] = job
+        return job
+
+    # LEASES
+
+    def _acquire(self, bind: Engine, job: Job, force: bool) -> bool:
+        now = utcnow()
+        locks = models.JobLock
+        with Session(bind=bind) as db:
+            if db.get(locks, job.name) is None:
+                db.add(locks(name=job.name))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()  # another worker created it first
+            criteria = [locks.name == job.name, or_(locks.locked_until.is_(None), locks.locked_until < now)]
+            if not force:
+                recent = now - timedelta(seconds=job.interval * 0.9)
+                criteria.append(or_(locks.last_run_at.is_(None), locks.last_run_at <= recent))
+            acquired = db.execute(
+                update(locks).where(*criteria).values(
+                    owner=self.owner, locked_until=now + timedelta(seconds=job.timeout), last_started_at=now,
+                )
+            ).rowcount
+            db.commit()
+        return acquired == 1
+
+    def _release(self, bind: Engine, job: Job, still_running: bool):
+        now = utcnow()
+        locks = models.JobLock
+        with Session(bind=bind) as db:
+            db.execute(
+                update(locks).where(locks.name == job.name, locks.owner == self.owner).values(
+                    locked_until=now + timedelta(seconds=job.timeout) if still_running else None,
+                    last_run_at=now,
+                    last_status=job.last_status,
+                    last_duration_ms=job.last_duration_ms,
+                    last_error=job.last_error,
+                )
+            )
+            db.commit()
+
+    # RUNNING
+
+    def run_job(self, job: Job, bind: Optional[Engine] = None, force: bool = False) -> str:
+        """Run `job` once if its lease can be taken; returns ok, failed, timeout or skipped."""
+        bind = bind or self.bind
+        if job.exclusive and not self._acquire(bind, job, force):
+            job.skipped += 1
+            return "skipped"
+
+        outcome = {}
+
+        def body():
+            try:
+                with Session(bind=bind) as db:
+                    outcome["result"] = job.fn(db)
+            except Exception as exc:
+                logger.exception("job %s failed", job.name)
+                outcome["error"] = exc
+
+        started = time.monotonic()
+        job.thread = threading.Thread(target=body, name=f"job-{job.name}", daemon=True)
+        job.thread.start()
+        job.thread.join(job.timeout)
+        job.last_duration_ms = int((time.monotonic() - started) * 1000)
+        job.runs += 1
+        if job.thread.is_alive():
+            job.timeouts += 1
+            job.last_status, job.last_error = "timeout", f"still running after {job.timeout:g}s"
+        elif "error" in outcome:
+            job.failures += 1
+            job.last_status, job.last_error = "failed", repr(outcome["error"])[:500]
+        else:
+            job.last_status, job.last_error, job.last_result = "ok", None, outcome.get("result")
+        if job.exclusive:
+            self._release(bind, job, still_running=job.thread.is_alive())
+        return job.last_status
+
+    def _run_dispatched(self, job: Job):
+        try:
+            self.run_job(job)
+        except Exception:
+            logger.exception("scheduling job %s failed", job.name)
+        finally:
+            job.dispatched = False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in self.jobs.values():
+                if job.next_run <= now and not job.running:
+                    job.schedule_next(now)
+                    job.dispatched = True
+                    self._executor.submit(self._run_dispatched, job)
+            wake = min((job.next_run for job in self.jobs.values()), default=now + 60)
+            self._stop.wait(min(max(wake - now, 0.1), 60))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        now = time.monotonic()
+        for job in self.jobs.values():
+            job.schedule_next(now, first=True)
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="scheduler")
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = self._executor = None
+
+    def status(self, db: Session) -> List[dict]:
+        leases = {lock.name: lock for lock in db.query(models.JobLock).filter(models.JobLock.name.in_(self.jobs))}
+        rows = []
+        for job in self.jobs.values():
+            lease = leases.get(job.name)
+            rows.append({
+                "name": job.name,
+                "interval_seconds": job.interval,
+                "timeout_seconds": job.timeout,
+                "exclusive": job.exclusive,
+                "running": job.running,
+                "runs": job.runs,
+                "failures": job.failures,
+                "timeouts": job.timeouts,
+                "skipped": job.skipped,
+                "last_status": job.last_status,
+                "last_duration_ms": job.last_duration_ms,
+                "last_error": job.last_error,
+                # cluster-wide, whichever worker ran it last
+                "last_run_at": lease.last_run_at if lease else None,
+                "last_run_status": lease.last_status if lease else None,
+                "locked_by": lease.owner if lease and lease.locked_until and lease.locked_until > utcnow() else None,
+            })
+        return rows
+
+
+def register_default_jobs(scheduler: Scheduler):
+    def warm_indexes(db: Session):
+        nearest.index.ensure_built(db)
+        tiles.index.ensure_built(db)
+        if analytics.ANALYTICS_ENABLED:
+            analytics.snapshot.ensure_fresh(db)
+
+    scheduler.register("archive", lambda db: archive.run(db), JOB_ARCHIVE_SECONDS)
+    scheduler.register("prune_changes", lambda db: change_log.prune(db), JOB_PRUNE_CHANGES_SECONDS)
+    scheduler.register("prune_idempotency_keys", lambda db: idempotency.prune(db), JOB_PRUNE_IDEMPOTENCY_SECONDS)
+    # reconciles the incrementally maintained trust_rank with the vote and flag tables
+    scheduler.register("recompute_scores", lambda db: scoring.recompute(db), JOB_RECOMPUTE_SCORES_SECONDS)
+    scheduler.register("partitions", lambda db: partitions.maintain(db.get_bind()), JOB_PARTITIONS_SECONDS)
+    scheduler.register("warm_indexes", warm_indexes, JOB_WARM_INDEXES_SECONDS, exclusive=False)
+    # every worker keeps its own duplicate index; drop reports past the dedup window
+    scheduler.register("prune_dedup", lambda db: dedup.index.prune(), JOB_PRUNE_DEDUP_SECONDS, exclusive=False)
+    if snapshots.enabled():
+        # one worker per host builds the shared indexes, the rest map them
+        scheduler.register(snapshots.publish_job_name(), lambda db: snapshots.snapshots.publish_all(db),
+                           snapshots.SNAPSHOT_PUBLISH_SECONDS)
+        scheduler.register("load_snapshots", lambda db: snapshots.snapshots.refresh(),
+                           snapshots.SNAPSHOT_POLL_SECONDS, exclusive=False)
+    else:
+        scheduler.register("danger_zones", lambda db: geofence.zones.build(db), geofence.DANGER_REFRESH_SECONDS,
+                           exclusive=False)
+
+
+scheduler = Scheduler(engine)
+register_default_jobs(scheduler)
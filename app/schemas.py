@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Dict, List, Literal, Optional
 from enum import Enum
 from datetime import datetime
 
@@ -40,6 +40,10 @@ class UserResponse(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class UserUpdate(BaseModel):
     username: Optional[str] = None
     fullname: Optional[str] = None
@@ -65,11 +69,46 @@ class CrimeCreate(CrimeBase):
 class CrimeResponse(CrimeBase):
     crime_id: int
     user_id: int
+    canonical_id: Optional[int] = None
+    thumbnail_url: Optional[str] = None
+    trust_score: float = 0.0
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
+class NearbyCrimeResponse(CrimeResponse):
+    distance_km: float
+
+class CrimeChangeOut(BaseModel):
+    change_id: int
+    op: str
+    crime_id: int
+    crime: Optional[CrimeResponse] = None
+
+class ChangeFeedResponse(BaseModel):
+    changes: List[CrimeChangeOut]
+    cursor: int
+    has_more: bool
+
+class TrendSeries(BaseModel):
+    bucket: str
+    start: datetime
+    step_seconds: int
+    counts: List[int]
+    total: int
+    source: str
+
+class VoteTally(BaseModel):
+    authenticated: Dict[str, int]
+    anonymous: Dict[str, int]
+    total: Dict[str, int]
+
+class CrimeBatchResponse(BaseModel):
+    crimes: List[CrimeResponse]
+    missing: List[int]
+    votes: Optional[Dict[int, VoteTally]] = None
+
 class CrimeUpdate(BaseModel):
     crime_type: Optional[str] = None
     description: Optional[str] = None
@@ -114,6 +153,36 @@ class SubscriptionResponse(SubscriptionBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+
+class LocationPing(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+
+class PingBatch(BaseModel):
+    pings: List[LocationPing]
+
+
+class DangerZone(BaseModel):
+    cell: str
+    crime_count: int
+    min_lat: float
+    min_lng: float
+    max_lat: float
+    max_lng: float
+
+
+class DangerAlert(BaseModel):
+    ping_index: int
+    latitude: float
+    longitude: float
+    zone: DangerZone
+
+
+class PingResponse(BaseModel):
+    checked: int
+    alerts: List[DangerAlert]
+
 class FlaggedCrimeBase(BaseModel):
     reason: str = "No reason provided"
     
@@ -127,6 +196,9 @@ class FlaggedCrimeOut(FlaggedCrimeBase):
     id: int
     crime_id: int
     flagged_by: int
+    status: str = "open"
+    resolved_by: Optional[int] = None
+    resolved_at: Optional[datetime] = None
     created_at: datetime
     
 
@@ -151,4 +223,62 @@ class SOSResponse(SOSBase):
     user_id: int
     created_at: datetime
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ModerationQueueItem(BaseModel):
+    crime_id: int
+    crime_type: str
+    description: str
+    latitude: float
+    longitude: float
+    is_hidden: bool
+    flag_count: int
+    last_flagged_at: datetime
+
+
+class ModerationQueueResponse(BaseModel):
+    total: int
+    items: List[ModerationQueueItem]
+
+
+class ModerationAction(BaseModel):
+    action: Literal["resolve", "hide", "unhide", "delete"]
+    crime_ids: List[int]
+
+
+class JobStatus(BaseModel):
+    name: str
+    interval_seconds: float
+    timeout_seconds: float
+    exclusive: bool
+    running: bool
+    runs: int
+    failures: int
+    timeouts: int
+    skipped: int
+    last_status: Optional[str] = None
+    last_duration_ms: Optional[int] = None
+    last_error: Optional[str] = None
+    last_run_at: Optional[datetime] = None
+    last_run_status: Optional[str] = None
+    locked_by: Optional[str] = None
+
+
+class AdmissionStatus(BaseModel):
+    limit: float
+    in_flight: int
+    queued: Dict[str, int]
+    admitted: Dict[str, int]
+    shed: Dict[str, int]
+
+
+class AnalyticsStatus(BaseModel):
+    rows: int
+    crime_types: int
+    bytes: int
+    bytes_per_row: float
+    cursor: int
+    seconds_since_refresh: Optional[float] = None
+    rebuilds: int
+    refreshes: int
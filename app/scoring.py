@@ -0,0 +1,122 @@
+"""
+Time-decayed trust score for crime reports.
+
+Every vote or flag adds a signed weight that halves every
+`TRUST_HALF_LIFE_HOURS`. Rather than decaying every row as time passes,
+each contribution is stored scaled to a fixed epoch:
+
+    trust_rank = sum(weight * 2 ** ((event_time - TRUST_EPOCH) / half_life))
+
+The current score of every crime is trust_rank times the same factor
+2 ** -((now - TRUST_EPOCH) / half_life), so ordering by the indexed
+`crimes.trust_rank` column is ordering by current score, a new vote is a
+single `trust_rank = trust_rank + delta` update, and a score threshold
+becomes a plain comparison against a rescaled bound.
+
+Changing the half-life, the weights or the epoch invalidates the stored
+ranks; run `recompute` (POST /admin/scores/recompute) afterwards. With the
+default one-week half-life the ranks stay well inside float range for
+about 19 years past the epoch; move the epoch forward and recompute
+before then.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, UTC
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+load_dotenv()
+
+TRUST_HALF_LIFE_HOURS = float(os.getenv("TRUST_HALF_LIFE_HOURS", "168"))
+TRUST_USER_VOTE_WEIGHT = float(os.getenv("TRUST_USER_VOTE_WEIGHT", "1.0"))
+TRUST_ANON_VOTE_WEIGHT = float(os.getenv("TRUST_ANON_VOTE_WEIGHT", "0.25"))
+TRUST_FLAG_WEIGHT = float(os.getenv("TRUST_FLAG_WEIGHT", "5.0"))
+TRUST_EPOCH = datetime.fromisoformat(os.getenv("TRUST_EPOCH", "2025-01-01T00:00:00")).replace(tzinfo=UTC)
+
+RECOMPUTE_BATCH_SIZE = 5000
+
+
+def _age_units(at: Optional[datetime]) -> float:
+    """Half-lives elapsed between the epoch and `at`."""
+    if at is None:
+        at = datetime.now(UTC)
+    elif at.tzinfo is None:
+        at = at.replace(tzinfo=UTC)
+    return (at - TRUST_EPOCH).total_seconds() / (TRUST_HALF_LIFE_HOURS * 3600)
+
+
+def contribution(weight: float, at: Optional[datetime] = None) -> float:
+    """`weight` observed at `at`, expressed in trust_rank units."""
+    return weight * 2.0 ** _age_units(at)
+
+
+def current_score(rank: Optional[float], now: Optional[datetime] = None) -> float:
+    """Decayed score today for a stored trust_rank."""
+    return (rank or 0.0) * 2.0 ** -_age_units(now)
+
+
+def rank_threshold(min_score: float, now: Optional[datetime] = None) -> float:
+    """The trust_rank a crime needs for its current score to reach `min_score`."""
+    return min_score * 2.0 ** _age_units(now)
+
+
+def vote_weight(vote_type: str, anonymous: bool = False) -> float:
+    weight = TRUST_ANON_VOTE_WEIGHT if anonymous else TRUST_USER_VOTE_WEIGHT
+    return weight if vote_type == "up" else -weight
+
+
+def flag_weight(is_flagged: bool) -> float:
+    # an entry with is_flagged=False records a review that found nothing wrong
+    return -TRUST_FLAG_WEIGHT if is_flagged else 0.0
+
+
+def record(db: Session, crime_id: int, weight: float, at: Optional[datetime] = None):
+    """Add one vote or flag to a crime's score; runs in the caller's transaction."""
+    if not weight:
+        return
+    db.execute(
+        update(models.Crimes)
+        .where(models.Crimes.crime_id == crime_id)
+        .values(
+            trust_rank=models.Crimes.trust_rank + contribution(weight, at),
+            # the report itself did not change
+            updated_at=models.Crimes.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recompute(db: Session) -> int:
+    """Rebuild every trust_rank from the votes and flags tables. Returns the number of scored crimes."""
+    ranks = defaultdict(float)
+    sources = (
+        (models.Votes, lambda row: vote_weight(row.vote_type)),
+        (models.AnonymousVotes, lambda row: vote_weight(row.vote_type, anonymous=True)),
+    )
+    for model, weigh in sources:
+        rows = db.query(model.crime_id, model.vote_type, model.created_at).yield_per(RECOMPUTE_BATCH_SIZE)
+        for row in rows:
+            ranks[row.crime_id] += contribution(weigh(row), row.created_at)
+    flags = db.query(
+        models.FlaggedCrime.crime_id, models.FlaggedCrime.is_flagged, models.FlaggedCrime.created_at
+    ).yield_per(RECOMPUTE_BATCH_SIZE)
+    for row in flags:
+        ranks[row.crime_id] += contribution(flag_weight(row.is_flagged), row.created_at)
+
+    crimes = models.Crimes.__table__
+    db.execute(update(crimes).values(trust_rank=0.0, updated_at=crimes.c.updated_at))
+    set_rank = (
+        update(crimes)
+        .where(crimes.c.crime_id == bindparam("b_crime_id"))
+        .values(trust_rank=bindparam("b_rank"), updated_at=crimes.c.updated_at)
+    )
+    params = [{"b_crime_id": crime_id, "b_rank": rank} for crime_id, rank in ranks.items()]
+    for start in range(0, len(params), RECOMPUTE_BATCH_SIZE):
+        db.execute(set_rank, params[start:start + RECOMPUTE_BATCH_SIZE])
+    db.commit()
+    return len(ranks)
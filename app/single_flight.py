@@ -0,0 +1,114 @@
+"""
+Request coalescing (single flight) for hot public reads.
+
+When a big incident breaks, thousands of clients ask for the same crime
+list or vote tally at the same moment. Without coalescing, every one of
+those requests runs its own query and serializes its own copy of the
+JSON. Here, the first request for a key runs normally. Identical
+requests that arrive while it is in flight wait for it and get the same
+status, headers and body. Once it finishes the key is forgotten, so
+this is not a cache. A request that arrives a moment later runs again,
+whether or not any caching is configured.
+
+The key is the route path plus its query parameters, sorted and with
+numbers in a canonical form, so `lat=6.50&lng=3.3` and `lng=3.30&lat=6.5`
+share a flight. Callers who just wrote are read from the primary (see
+app/replicas.py) and only share flights with each other, and a caller
+never joins a flight that started before their last write: its read may
+not include that write, so they run their own. Likewise, callers only
+share a flight with callers that negotiate the same compression
+(app/compression.py) and send the same If-None-Match, because those
+change the response. The routes listed here return the same body to
+every caller.
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+
+from . import compression, replicas
+
+load_dotenv()
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+ROUTES = [
+    re.compile(r"/crime/crime"),
+    re.compile(r"/crime/nearest"),
+    re.compile(r"/crime/trends"),
+    re.compile(r"/vote/crimes/\d+/votes"),
+]
+
+
+class SharedResponse(NamedTuple):
+    status_code: int
+    raw_headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+class Stats:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+
+
+stats = Stats()
+# key -> (wall-clock start time, future of the leader's response)
+_inflight: Dict[tuple, Tuple[float, "asyncio.Future[Optional[SharedResponse]]"]] = {}
+
+
+def _canonical(value: str) -> str:
+    try:
+        return repr(float(value))
+    except ValueError:
+        return value
+
+
+def flight_key(request: Request) -> Optional[tuple]:
+    if request.method != "GET" or not any(route.fullmatch(request.url.path) for route in ROUTES):
+        return None
+    params = tuple(sorted((name, _canonical(value)) for name, value in request.query_params.multi_items()))
+    encoding = compression.negotiate(request.headers.get("accept-encoding", "")) if compression.COMPRESSION_ENABLED else None
+    return (request.url.path, params, replicas.router.is_sticky(replicas.last_write(request)), encoding,
+            request.headers.get("if-none-match"))
+
+
+def _response(shared: SharedResponse) -> Response:
+    response = Response(shared.body, status_code=shared.status_code)
+    response.raw_headers = list(shared.raw_headers)
+    return response
+
+
+async def single_flight(request: Request, call_next):
+    key = flight_key(request) if SINGLE_FLIGHT_ENABLED else None
+    if key is None:
+        return await call_next(request)
+
+    flight = _inflight.get(key)
+    if flight is not None:
+        started, leader = flight
+        last_write = replicas.last_write(request)
+        if last_write is not None and last_write >= started:
+            return await call_next(request)  # the flight may not see our write
+        shared = await asyncio.shield(leader)
+        if shared is not None:
+            stats.coalesced += 1
+            return _response(shared)
+        return await call_next(request)  # the leader failed; try on our own
+
+    done = asyncio.get_running_loop().create_future()
+    _inflight[key] = (time.time(), done)
+    shared = None
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        shared = SharedResponse(response.status_code, response.raw_headers, body)
+        stats.leaders += 1
+        return _response(shared)
+    finally:
+        del _inflight[key]
+        done.set_result(shared)
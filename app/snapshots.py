@@ -0,0 +1,155 @@
+"""
+Read-mostly indexes shared between worker processes on one host.
+
+Without this, every uvicorn/gunicorn worker builds its own nearest-crime
+tree and danger-zone table from the database and keeps a private copy.
+With SNAPSHOT_DIR set:
+
+- one worker per host (the holder of the `publish_snapshots:<host>`
+  job lease) rebuilds each index from the database every
+  SNAPSHOT_PUBLISH_SECONDS and writes its arrays as .npy files to a new
+  version directory, SNAPSHOT_DIR/<index>/<version>/. Only when every
+  file is written does it point SNAPSHOT_DIR/<index>/CURRENT at the
+  version, with an atomic rename, so readers never see half a snapshot.
+- every worker checks CURRENT every SNAPSHOT_POLL_SECONDS, and on
+  startup, and maps a new version read-only with np.load(mmap_mode="r").
+  The pages come from the OS page cache, so N workers hold one copy of
+  the index instead of N, and a fresh worker is ready without a build.
+
+Writes a worker sees between snapshots are still applied to its own
+index through crime_events, on top of the mapped arrays; see
+NearestIndex.install. The last SNAPSHOT_KEEP versions are kept, so a
+worker that is between reading CURRENT and mapping the files does not
+lose them. Workers that already mapped an older version keep it after it
+is deleted, as the mapping holds on to the file.
+
+The tile index is not shared: its per-tile aggregates are patched on
+every write and are small next to the tree.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import geofence, nearest
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Empty disables snapshots; every worker then builds its own indexes
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+SNAPSHOT_PUBLISH_SECONDS = float(os.getenv("SNAPSHOT_PUBLISH_SECONDS", "300"))
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "15"))
+
+
+def enabled() -> bool:
+    return bool(SNAPSHOT_DIR)
+
+
+class SnapshotStore:
+    """Versioned directories of .npy arrays plus a meta.json, one series per index name."""
+
+    def __init__(self, root: str, keep: int = SNAPSHOT_KEEP):
+        self.root = Path(root)
+        self.keep = keep
+
+    def publish(self, name: str, arrays: Dict[str, np.ndarray], meta: dict) -> str:
+        series = self.root / name
+        # sorts by publish time; the pid keeps two publishers on one host apart
+        version = f"{time.time_ns():020d}-{os.getpid()}"
+        partial = series / f".{version}.part"
+        partial.mkdir(parents=True)
+        try:
+            for key, array in arrays.items():
+                np.save(partial / f"{key}.npy", np.ascontiguousarray(array))
+            (partial / "meta.json").write_text(json.dumps(meta))
+            os.replace(partial, series / version)
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        pointer = series / f".CURRENT.{os.getpid()}"
+        pointer.write_text(version)
+        os.replace(pointer, series / "CURRENT")
+        self.prune(name)
+        return version
+
+    def current(self, name: str) -> Optional[str]:
+        try:
+            return (self.root / name / "CURRENT").read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self, name: str, version: str) -> Tuple[Dict[str, np.ndarray], dict]:
+        """Arrays of `version`, memory-mapped read-only, and its metadata."""
+        path = self.root / name / version
+        meta = json.loads((path / "meta.json").read_text())
+        arrays = {file.stem: np.load(file, mmap_mode="r") for file in path.glob("*.npy")}
+        return arrays, meta
+
+    def prune(self, name: str):
+        series = self.root / name
+        current = self.current(name)
+        versions = sorted(p.name for p in series.iterdir() if p.is_dir() and not p.name.startswith("."))
+        for version in versions[:-self.keep] if self.keep > 0 else versions:
+            if version != current:
+                shutil.rmtree(series / version, ignore_errors=True)
+
+
+class Snapshots:
+    """The indexes that are published and installed, and which version each worker serves."""
+
+    def __init__(self, store: SnapshotStore):
+        self.store = store
+        self.sources: Dict[str, Tuple[Callable[[Session], None], object]] = {}
+        self.installed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, build: Callable[[Session], None], index):
+        """`index` needs export() -> (arrays, meta) and install(arrays, meta)."""
+        self.sources[name] = (build, index)
+
+    def publish_all(self, db: Session) -> Dict[str, str]:
+        published = {}
+        for name, (build, index) in self.sources.items():
+            build(db)
+            arrays, meta = index.export()
+            published[name] = self.store.publish(name, arrays, meta)
+        # the publisher maps the files too rather than keeping its private copy
+        self.refresh()
+        return published
+
+    def refresh(self) -> int:
+        """Install any newer published versions; returns how many were installed."""
+        installed = 0
+        with self._lock:
+            for name, (build, index) in self.sources.items():
+                version = self.store.current(name)
+                if version is None or version == self.installed.get(name):
+                    continue
+                try:
+                    arrays, meta = self.store.load(name, version)
+                except FileNotFoundError:
+                    continue  # pruned under us; a newer version is current now
+                index.install(arrays, meta)
+                self.installed[name] = version
+                installed += 1
+        return installed
+
+
+def publish_job_name() -> str:
+    # snapshots are files on this host, so each host needs its own publisher
+    return f"publish_snapshots:{socket.gethostname()}"
+
+
+snapshots = Snapshots(SnapshotStore(SNAPSHOT_DIR or "."))
+snapshots.register("nearest", nearest.index.build, nearest.index)
+snapshots.register("danger_zones", geofence.zones.build, geofence.zones)
@@ -0,0 +1,177 @@
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from . import models, crime_events
+
+load_dotenv()
+
+# Finest cell level kept in the index (web-mercator zoom; ~600 m cells at 16)
+CLUSTER_MAX_LEVEL = int(os.getenv("CLUSTER_MAX_LEVEL", "16"))
+# A tile at zoom z is split into 2**CLUSTER_SUBDIVISION cells per side
+CLUSTER_SUBDIVISION = int(os.getenv("CLUSTER_SUBDIVISION", "3"))
+CLUSTER_TILE_CACHE_SIZE = int(os.getenv("CLUSTER_TILE_CACHE_SIZE", "4096"))
+MAX_TILES_PER_QUERY = 256
+
+MAX_LATITUDE = 85.05112878
+
+
+def tile_xy(latitude: float, longitude: float, zoom: int):
+    n = 1 << zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x: int, y: int, zoom: int):
+    """(min_lat, min_lng, max_lat, max_lng) of a tile; the inverse of tile_xy."""
+    n = 1 << zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+class _Cell:
+    __slots__ = ("count", "sum_lat", "sum_lng", "by_type")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lng = 0.0
+        self.by_type = Counter()
+
+
+class TileIndex:
+    """
+    Crime counts per web-mercator cell for every level up to
+    `max_level`, kept current from crime events. A cluster query touches
+    only the cells of the tiles in view, and each tile's answer is cached
+    until a crime inside it changes.
+    """
+
+    def __init__(self, max_level: int = CLUSTER_MAX_LEVEL, subdivision: int = CLUSTER_SUBDIVISION,
+                 cache_size: int = CLUSTER_TILE_CACHE_SIZE):
+        self.max_level = max_level
+        self.subdivision = subdivision
+        self.cache_size = cache_size
+        self._levels = [dict() for _ in range(max_level + 1)]
+        self._tile_cache: "OrderedDict[tuple, list]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._built = False
+
+    def _apply(self, crime_type: str, latitude: float, longitude: float, delta: int):
+        # coarser tiles are the finest tile's coordinates shifted right
+        fx, fy = tile_xy(latitude, longitude, self.max_level)
+        with self._lock:
+            for level, cells in enumerate(self._levels):
+                shift = self.max_level - level
+                key = (fx >> shift, fy >> shift)
+                cell = cells.get(key)
+                if cell is None:
+                    if delta < 0:
+                        continue
+                    cell = cells[key] = _Cell()
+                cell.count += delta
+                cell.sum_lat += delta * latitude
+                cell.sum_lng += delta * longitude
+                cell.by_type[crime_type] += delta
+                if cell.by_type[crime_type] <= 0:
+                    del cell.by_type[crime_type]
+                if cell.count <= 0:
+                    del cells[key]
+                self._tile_cache.pop((level, *key), None)
+
+    def add(self, crime_type: str, latitude: float, longitude: float):
+        self._apply(crime_type, latitude, longitude, 1)
+
+    def remove(self, crime_type: str, latitude: float, longitude: float):
+        self._apply(crime_type, latitude, longitude, -1)
+
+    def on_crime_event(self, op, new, old):
+        if not self._built:
+            return  # the lazy build will read the row from the database
+        if old is not None:
+            self.remove(old.crime_type, old.latitude, old.longitude)
+        if new is not None:
+            self.add(new.crime_type, new.latitude, new.longitude)
+
+    def build(self, db: Session):
+        rows = db.query(models.Crimes.crime_type, models.Crimes.latitude, models.Crimes.longitude) \
+            .filter(models.Crimes.is_visible).all()
+        with self._lock:
+            self._levels = [dict() for _ in range(self.max_level + 1)]
+            self._tile_cache.clear()
+            for crime_type, latitude, longitude in rows:
+                self._apply(crime_type, latitude, longitude, 1)
+            self._built = True
+
+    def ensure_built(self, db: Session):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build(db)
+
+    def _tile_cells(self, zoom: int, x: int, y: int) -> list:
+        key = (zoom, x, y)
+        with self._lock:
+            cached = self._tile_cache.get(key)
+            if cached is not None:
+                self._tile_cache.move_to_end(key)
+                return cached
+
+            level = min(zoom + self.subdivision, self.max_level)
+            shift = level - zoom
+            cells = self._levels[level]
+            result = []
+            if (x, y) in self._levels[zoom]:
+                for cx in range(x << shift, (x + 1) << shift):
+                    for cy in range(y << shift, (y + 1) << shift):
+                        cell = cells.get((cx, cy))
+                        if cell is not None:
+                            result.append({
+                                "cell": f"{level}/{cx}/{cy}",
+                                "latitude": cell.sum_lat / cell.count,
+                                "longitude": cell.sum_lng / cell.count,
+                                "count": cell.count,
+                                "by_type": dict(cell.by_type),
+                            })
+
+            self._tile_cache[key] = result
+            if len(self._tile_cache) > self.cache_size:
+                self._tile_cache.popitem(last=False)
+            return result
+
+    def clusters(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                 zoom: int, crime_type: Optional[str] = None) -> list:
+        zoom = min(zoom, self.max_level)
+        x0, y0 = tile_xy(max_lat, min_lng, zoom)
+        x1, y1 = tile_xy(min_lat, max_lng, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_TILES_PER_QUERY:
+            raise ValueError("Bounding box covers too many tiles at this zoom level")
+
+        result = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for cell in self._tile_cells(zoom, x, y):
+                    if not (min_lat <= cell["latitude"] <= max_lat and min_lng <= cell["longitude"] <= max_lng):
+                        continue
+                    if crime_type is not None:
+                        count = sum(n for t, n in cell["by_type"].items() if t.lower() == crime_type.lower())
+                        if not count:
+                            continue
+                        cell = {**cell, "count": count,
+                                "by_type": {t: n for t, n in cell["by_type"].items() if t.lower() == crime_type.lower()}}
+                    result.append(cell)
+        return result
+
+
+index = TileIndex()
+crime_events.subscribe(index.on_crime_event)
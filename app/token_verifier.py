@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import jwt
+from jwt.utils import base64url_decode
+
+
+class VerificationResult(NamedTuple):
+    claims: Optional[dict]
+    error: Optional[str]
+
+
+class TokenVerifier:
+    """
+    HS* JWT verification with the key prepared once and decoded claims
+    cached until the token's ``exp``, in an LRU keyed by the SHA-256 of the
+    token. Expired tokens are rejected from the payload alone, before the
+    signature is checked.
+    """
+
+    def __init__(self, secret: str, algorithm: str, max_entries: int = 10000):
+        self.algorithm = algorithm
+        self._alg = jwt.get_algorithm_by_name(algorithm)
+        self._key = self._alg.prepare_key(secret)
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token: str) -> dict:
+        """Return the token's claims or raise a `jwt.PyJWTError`."""
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+
+        if entry is not None:
+            claims, exp = entry
+            if exp is None or exp > now:
+                return claims
+            with self._lock:
+                self._cache.pop(key, None)
+            raise jwt.ExpiredSignatureError("Signature has expired")
+
+        claims = self._decode(token, now)
+        with self._lock:
+            self._cache[key] = (claims, claims.get("exp"))
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return claims
+
+    def _decode(self, token: str, now: float) -> dict:
+        try:
+            signing_input, _, signature = token.rpartition(".")
+            header_segment, _, payload_segment = signing_input.partition(".")
+            payload = json.loads(base64url_decode(payload_segment))
+        except ValueError as e:
+            raise jwt.DecodeError(f"Invalid token: {e}")
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload")
+
+        exp = payload.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise jwt.DecodeError("Expiration Time claim (exp) must be a number")
+            if exp <= now:
+                raise jwt.ExpiredSignatureError("Signature has expired")
+        nbf = payload.get("nbf")
+        if isinstance(nbf, (int, float)) and nbf > now:
+            raise jwt.ImmatureSignatureError("The token is not yet valid (nbf)")
+
+        try:
+            header = json.loads(base64url_decode(header_segment))
+            signature = base64url_decode(signature)
+        except ValueError as e:
+            raise jwt.DecodeError(f"Invalid token: {e}")
+        if not isinstance(header, dict) or header.get("alg") != self.algorithm:
+            raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+        if not self._alg.verify(signing_input.encode(), self._key, signature):
+            raise jwt.InvalidSignatureError("Signature verification failed")
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def try_verify(self, token: str) -> VerificationResult:
+        try:
+            return VerificationResult(self.verify(token), None)
+        except jwt.PyJWTError as e:
+            return VerificationResult(None, str(e))
@@ -0,0 +1,130 @@
+"""
+Crime counts over time in fixed hour, day or week buckets (weeks start on
+Monday, all times UTC), for the live crimes tier.
+
+Short windows are counted by the database, grouping on date_trunc
+(Postgres) or strftime (SQLite) over created_at. With a crime_type, the
+(crime_type, created_at) index covers the range scan. Windows longer
+than TRENDS_SNAPSHOT_AFTER_DAYS are counted from the columnar analytics
+snapshot (app/analytics.py), which turns a scan of months of rows into
+a bincount.
+
+A series is returned as the start of the first bucket, the bucket width
+and one count per bucket, with empty buckets included, so clients get a
+plain array instead of a list of objects.
+"""
+import os
+from datetime import datetime, timedelta, UTC
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import analytics, models
+
+load_dotenv()
+
+TRENDS_MAX_BUCKETS = int(os.getenv("TRENDS_MAX_BUCKETS", "2000"))
+# Longer windows are served from the analytics snapshot when it is enabled
+TRENDS_SNAPSHOT_AFTER_DAYS = float(os.getenv("TRENDS_SNAPSHOT_AFTER_DAYS", "7"))
+
+STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+
+# one text key per bucket on SQLite; Postgres uses date_trunc
+_SQLITE_BUCKETS = {
+    "hour": ("%Y-%m-%d %H:00:00",),
+    "day": ("%Y-%m-%d",),
+    "week": ("%Y-%m-%d", "-6 days", "weekday 1"),  # back to the Monday on or before
+}
+
+Box = Tuple[float, float, float, float]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(UTC).replace(tzinfo=None) if value.tzinfo else value
+
+
+def bucket_start(value: datetime, bucket: str) -> datetime:
+    value = _naive_utc(value).replace(minute=0, second=0, microsecond=0)
+    if bucket != "hour":
+        value = value.replace(hour=0)
+    if bucket == "week":
+        value -= timedelta(days=value.weekday())
+    return value
+
+
+def bucket_count(start: datetime, until: datetime, bucket: str) -> int:
+    return max(0, -(-(_naive_utc(until) - start) // STEPS[bucket]))
+
+
+def _bucket_key(db: Session, bucket: str):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(bucket, models.Crimes.created_at)
+    return func.strftime(_SQLITE_BUCKETS[bucket][0], models.Crimes.created_at, *_SQLITE_BUCKETS[bucket][1:])
+
+
+def from_database(db: Session, bucket: str, start: datetime, until: datetime, crime_type: Optional[str] = None,
+                  box: Optional[Box] = None) -> List[int]:
+    crimes = models.Crimes
+    key = _bucket_key(db, bucket)
+    query = db.query(key, func.count(crimes.crime_id)).filter(
+        crimes.is_visible, crimes.created_at >= start, crimes.created_at < _naive_utc(until),
+    )
+    if crime_type:
+        query = query.filter(crimes.crime_type == crime_type)
+    if box:
+        min_lat, min_lng, max_lat, max_lng = box
+        query = query.filter(crimes.latitude.between(min_lat, max_lat), crimes.longitude.between(min_lng, max_lng))
+
+    counts = [0] * bucket_count(start, until, bucket)
+    for value, count in query.group_by(key).all():
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        counts[(_naive_utc(value) - start) // STEPS[bucket]] += count
+    return counts
+
+
+def from_snapshot(snapshot: analytics.AnalyticsSnapshot, bucket: str, start: datetime, until: datetime,
+                  crime_type: Optional[str] = None, box: Optional[Box] = None) -> List[int]:
+    columns = snapshot.columns
+    rows = snapshot.mask(columns, start, until) & ~columns.hidden
+    if crime_type:
+        code = snapshot.type_code(crime_type, create=False)
+        rows &= columns.type_code == (-1 if code is None else code)
+    if box:
+        min_lat, min_lng, max_lat, max_lng = box
+        # compared in float32 like the stored values, so edge points stay inside
+        rows &= (columns.latitude >= np.float32(min_lat)) & (columns.latitude <= np.float32(max_lat))
+        rows &= (columns.longitude >= np.float32(min_lng)) & (columns.longitude <= np.float32(max_lng))
+
+    n = bucket_count(start, until, bucket)
+    step = STEPS[bucket] // timedelta(microseconds=1)
+    index = (columns.created_at[rows] - analytics.to_micros(start)) // step
+    return np.bincount(index, minlength=n)[:n].tolist()
+
+
+def series(db: Session, bucket: str, since: datetime, until: datetime, crime_type: Optional[str] = None,
+           box: Optional[Box] = None) -> dict:
+    """Raises ValueError when the window is empty or needs more than TRENDS_MAX_BUCKETS buckets."""
+    start = bucket_start(since, bucket)
+    n = bucket_count(start, until, bucket)
+    if n == 0:
+        raise ValueError("until must be after since")
+    if n > TRENDS_MAX_BUCKETS:
+        raise ValueError(f"{n} {bucket} buckets requested; at most {TRENDS_MAX_BUCKETS}, use a wider bucket")
+
+    if analytics.ANALYTICS_ENABLED and _naive_utc(until) - start > timedelta(days=TRENDS_SNAPSHOT_AFTER_DAYS):
+        analytics.snapshot.ensure_fresh(db)
+        counts, source = from_snapshot(analytics.snapshot, bucket, start, until, crime_type, box), "snapshot"
+    else:
+        counts, source = from_database(db, bucket, start, until, crime_type, box), "database"
+    return {
+        "bucket": bucket,
+        "start": start,
+        "step_seconds": int(STEPS[bucket].total_seconds()),
+        "counts": counts,
+        "total": sum(counts),
+        "source": source,
+    }
@@ -0,0 +1,117 @@
+"""
+GET /admin/statistics and a year of GET /crime/trends served by SQL
+GROUP BYs versus the columnar analytics snapshot (app/analytics.py) on a
+synthetic SQLite dataset, the cost of keeping the snapshot current, and
+its memory next to the same crimes loaded as ORM objects.
+
+    python benchmarks/bench_analytics.py --crimes 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import analytics, models, trends
+from app.database import Base
+from app.router import admin
+
+CRIME_TYPES = ["Theft", "Burglary", "Assault", "Vandalism", "Robbery", "Fraud", "Arson", "Kidnapping"]
+ADMIN = SimpleNamespace(role="admin")
+
+
+def populate(bind, n_crimes, seed=42):
+    rnd = random.Random(seed)
+    now = datetime(2025, 9, 1)
+    with bind.begin() as conn:
+        conn.execute(insert(models.Users.__table__), [{
+            "user_id": 1, "fullname": "Bench", "username": "bench", "email": "bench@example.com",
+            "role": "user", "hashed_password": "x",
+        }])
+        rows = []
+        for i in range(1, n_crimes + 1):
+            ts = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+            rows.append({
+                "crime_id": i, "user_id": 1, "crime_type": rnd.choice(CRIME_TYPES), "description": "synthetic report",
+                # a few thousand distinct places, so the hotspot grouping has work to do
+                "latitude": round(rnd.uniform(6.4, 6.7), 3), "longitude": round(rnd.uniform(3.2, 3.6), 3),
+                "created_at": ts, "updated_at": ts,
+            })
+        conn.execute(insert(models.Crimes.__table__), rows)
+
+
+def statistics(db, **params):
+    params = {"collapse_duplicates": False, "include_archived": False, "since": None, "until": None, **params}
+    return admin.get_statistics(**params, db=db, current_user=ADMIN)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bind = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind)
+        populate(bind, args.crimes)
+        since = datetime(2025, 6, 1)
+        year_ago, end = datetime(2024, 9, 1), datetime(2025, 9, 1)
+
+        with Session(bind=bind) as db:
+            analytics.ANALYTICS_ENABLED = False
+            sql_all = timed(lambda: statistics(db), args.repeat)
+            sql_since = timed(lambda: statistics(db, since=since), args.repeat)
+            sql_trend = timed(lambda: trends.series(db, "day", year_ago, end, "Theft"), args.repeat)
+
+            analytics.ANALYTICS_ENABLED = True
+            snapshot = analytics.snapshot
+            build = timed(lambda: snapshot.build(db), 1)
+            columnar_all = timed(lambda: statistics(db), args.repeat)
+            columnar_since = timed(lambda: statistics(db, since=since), args.repeat)
+            columnar_trend = timed(lambda: trends.series(db, "day", year_ago, end, "Theft"), args.repeat)
+
+            for i in range(args.changes):
+                db.add(models.Crimes(user_id=1, crime_type="Theft", description="new", latitude=6.5, longitude=3.3))
+            db.commit()
+            refresh = timed(lambda: snapshot.ensure_fresh(db), 1)
+            check = timed(lambda: snapshot.ensure_fresh(db), args.repeat)
+
+        with Session(bind=bind) as db:
+            tracemalloc.start()
+            loaded = db.query(models.Crimes).all()
+            orm_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+    status = snapshot.status()
+    print(f"{args.crimes} crimes")
+    print(f"{'':<28} {'SQL':>10} {'columnar':>10}")
+    print(f"{'statistics, all time':<28} {sql_all:8.1f}ms {columnar_all:8.1f}ms")
+    print(f"{'statistics, since':<28} {sql_since:8.1f}ms {columnar_since:8.1f}ms")
+    print(f"{'trend, one type, 365 days':<28} {sql_trend:8.1f}ms {columnar_trend:8.1f}ms")
+    print(f"snapshot build {build:.0f}ms, apply {args.changes} changes {refresh:.1f}ms, "
+          f"no-change check {check:.2f}ms")
+    print(f"memory: {status['bytes_per_row']:.0f} bytes/row columnar, "
+          f"{orm_bytes / len(loaded):.0f} bytes/row as ORM objects ({orm_bytes / status['bytes']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+GET /crime/crime over a large table: uncompressed, compressed with each
+available encoding (app/compression.py), and revalidated with
+If-None-Match (app/etags.py). Runs the whole app in-process over ASGI
+against a synthetic SQLite database.
+
+    python benchmarks/bench_compression.py --crimes 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_compression.db')}"
+for name, value in (("SECRET_KEY", "bench"), ("ALGORITHM", "HS256"), ("ACCESS_TOKEN_EXPIRE_MINUTES", "30")):
+    os.environ.setdefault(name, value)
+
+import httpx
+from sqlalchemy import insert
+
+from app import compression, models
+from app.database import Base, engine
+from app.main import app
+
+
+def populate(n_crimes, seed=42):
+    rnd = random.Random(seed)
+    now = datetime(2025, 9, 1)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Users.__table__), [{
+            "user_id": 1, "fullname": "Bench", "username": "bench", "email": "bench@example.com",
+            "role": "user", "hashed_password": "x",
+        }])
+        conn.execute(insert(models.Crimes.__table__), [{
+            "user_id": 1, "crime_type": rnd.choice(["Theft", "Assault", "Robbery"]), "description": "synthetic report",
+            "latitude": rnd.uniform(6.4, 6.6), "longitude": rnd.uniform(3.3, 3.5),
+            "created_at": now - timedelta(minutes=i), "updated_at": now,
+        } for i in range(n_crimes)])
+
+
+async def measure(headers, repeat):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get("/crime/crime", headers=headers)
+            latencies.append(time.perf_counter() - started)
+        wire = len(response.content) if response.status_code == 304 else int(response.headers["content-length"])
+        return statistics.median(latencies), wire, response.status_code, response.headers.get("etag")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    populate(args.crimes)
+
+    print(f"GET /crime/crime over {args.crimes} crimes, median of {args.repeat}")
+    print(f"{'request':<14} {'status':>6} {'latency':>9} {'on the wire':>12}")
+    etag = None
+    for encoding in ["identity"] + compression.available():
+        latency, wire, status, etag = asyncio.run(measure({"Accept-Encoding": encoding}, args.repeat))
+        print(f"{encoding:<14} {status:6d} {latency * 1e3:7.0f}ms {wire / 1024:9.0f}KiB")
+    latency, wire, status, _ = asyncio.run(measure({"If-None-Match": etag}, args.repeat))
+    print(f"{'If-None-Match':<14} {status:6d} {latency * 1e3:7.0f}ms {wire / 1024:9.0f}KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Per-insert cost of the ingest dedup stage, for reports spread over a city
+and for a single hotspot (the worst case, bounded by the per-cell cap),
+plus how well it separates rephrased duplicates from unrelated reports.
+
+    python benchmarks/bench_dedup.py --reports 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from app.dedup import DedupIndex, simhash
+
+TYPES = ["Theft", "Burglary", "Assault", "Robbery", "Vandalism"]
+PLACES = ["market", "bus stop", "school gate", "filling station", "bank", "church", "junction", "estate"]
+DETAILS = ["armed men", "two boys on a bike", "a man in black", "a gang", "unknown persons", "a woman"]
+ITEMS = ["phone", "bag", "car", "laptop", "money", "generator"]
+
+
+def report(rnd):
+    return (f"{rnd.choice(DETAILS)} took a {rnd.choice(ITEMS)} near the "
+            f"{rnd.choice(PLACES)} around {rnd.randint(1, 12)} o'clock")
+
+
+def rephrase(rnd, text):
+    words = text.split()
+    i = rnd.randrange(len(words))
+    return " ".join(words[:i] + words[i + 1:]) + rnd.choice(["", " please help", " just now", " today"])
+
+
+def ingest(index, reports):
+    start = time.perf_counter()
+    for i, (kind, lat, lng, text, ts) in enumerate(reports, 1):
+        signature = simhash(text)
+        canonical = index.find_duplicate(kind, lat, lng, text, ts, signature)
+        index.add(SimpleNamespace(crime_id=i, canonical_id=canonical, crime_type=kind,
+                                  latitude=lat, longitude=lng, description=text, created_at=ts), signature)
+    return (time.perf_counter() - start) / len(reports) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=50_000)
+    args = parser.parse_args()
+    rnd = random.Random(7)
+    now = datetime.now(UTC)
+
+    spread = [(rnd.choice(TYPES), 6.4 + rnd.random() * 0.3, 3.2 + rnd.random() * 0.4, report(rnd),
+               now + timedelta(seconds=i)) for i in range(args.reports)]
+    hotspot = [(rnd.choice(TYPES), 6.5244 + rnd.random() * 0.001, 3.3792 + rnd.random() * 0.001, report(rnd),
+                now + timedelta(seconds=i)) for i in range(args.reports)]
+
+    print(f"spread over a city:   {ingest(DedupIndex(), spread):8.1f} us/insert")
+    print(f"single hotspot:       {ingest(DedupIndex(), hotspot):8.1f} us/insert "
+          f"(cap {DedupIndex().max_per_cell} reports per cell)")
+
+    # quality: a rephrased repeat should match, a different report at the same spot should not
+    index = DedupIndex()
+    hits = false_hits = 0
+    trials = 2000
+    for i in range(trials):
+        kind = rnd.choice(TYPES)
+        lat, lng = rnd.uniform(-60, 60), rnd.uniform(-170, 170)
+        text = report(rnd)
+        index.add(SimpleNamespace(crime_id=i, canonical_id=None, crime_type=kind, latitude=lat,
+                                  longitude=lng, description=text, created_at=now))
+        if index.find_duplicate(kind, lat + 0.001, lng, rephrase(rnd, text), now) == i:
+            hits += 1
+        other = report(rnd)
+        if other != text and index.find_duplicate(kind, lat, lng, other, now) is not None:
+            false_hits += 1
+    print(f"rephrased duplicates matched: {hits / trials:.1%}, unrelated reports matched: {false_hits / trials:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Danger-zone build time and per-ping lookup latency, with crimes clustered
+around a few dozen cities and pings spread over the same areas.
+
+    python benchmarks/bench_geofence.py --crimes 1000000 --pings 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from app.geofence import AlertState, DangerZones, check_pings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=1_000_000)
+    parser.add_argument("--pings", type=int, default=200_000)
+    parser.add_argument("--min-crimes", type=int, default=5)
+    args = parser.parse_args()
+    rnd = random.Random(7)
+
+    centres = [(rnd.uniform(-40, 60), rnd.uniform(-120, 150)) for _ in range(50)]
+
+    def point(spread):
+        lat, lng = rnd.choice(centres)
+        return lat + rnd.gauss(0, spread), lng + rnd.gauss(0, spread)
+
+    crimes = [point(0.3) for _ in range(args.crimes)]
+    pings = [point(0.5) for _ in range(args.pings)]
+
+    zones = DangerZones(min_crimes=args.min_crimes)
+    started = time.perf_counter()
+    zones.load((lat for lat, _ in crimes), (lng for _, lng in crimes))
+    print(f"build: {len(zones)} zones from {args.crimes} crimes in {time.perf_counter() - started:.2f} s")
+
+    started = time.perf_counter()
+    hits = sum(zones.lookup(lat, lng) is not None for lat, lng in pings)
+    elapsed = time.perf_counter() - started
+    print(f"lookup: {elapsed / len(pings) * 1e6:.2f} us per ping ({hits / len(pings):.0%} in a zone)")
+
+    state = AlertState()
+    started = time.perf_counter()
+    alerts = 0
+    for start in range(0, len(pings), 100):
+        alerts += len(check_pings(start // 100 % 5000, pings[start:start + 100], zones, state))
+    elapsed = time.perf_counter() - started
+    print(f"batches of 100 with dedup: {elapsed / len(pings) * 1e6:.2f} us per ping, "
+          f"{alerts} alerts, {len(state)} state entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Query plans and timings for the hot predicates, before and after the
+``2b9a1e33f9ff`` index migration, on a synthetic SQLite dataset.
+
+    python benchmarks/bench_indexes.py --crimes 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+
+from app.database import Base
+from app import models  # noqa: F401
+
+CRIME_TYPES = ["Theft", "Burglary", "Assault", "Vandalism", "Robbery", "Fraud", "Arson", "Kidnapping"]
+
+# (name, index DDL) for the state before the migration
+OLD_INDEXES = [
+    ("ix_users_user_id", "CREATE UNIQUE INDEX ix_users_user_id ON users (user_id)"),
+    ("ix_crimes_crime_id", "CREATE UNIQUE INDEX ix_crimes_crime_id ON crimes (crime_id)"),
+    ("ix_votes_vote_id", "CREATE UNIQUE INDEX ix_votes_vote_id ON votes (vote_id)"),
+    ("ix_subscriptions_id", "CREATE UNIQUE INDEX ix_subscriptions_id ON subscriptions (id)"),
+    ("ix_flagged_crimes_id", "CREATE INDEX ix_flagged_crimes_id ON flagged_crimes (id)"),
+    ("ix_sos_alerts_id", "CREATE INDEX ix_sos_alerts_id ON sos_alerts (id)"),
+]
+
+NEW_INDEXES = [
+    "ix_users_username",
+    "ix_crimes_created_at",
+    "ix_crimes_crime_type_created_at",
+    "ix_votes_crime_id_vote_type",
+    "ix_anonymous_votes_crime_id_vote_type",
+    "ix_subscriptions_user_id",
+    "ix_flagged_crimes_crime_id",
+    "ix_sos_alerts_created_at",
+]
+
+QUERIES = [
+    ("check_user(username)", "SELECT * FROM users WHERE username = :username LIMIT 1"),
+    ("get_votes (authenticated)",
+     "SELECT vote_type, count(vote_id) FROM votes WHERE crime_id = :crime_id GROUP BY vote_type"),
+    ("get_votes (anonymous)",
+     "SELECT vote_type, count(vote_id) FROM anonymous_votes WHERE crime_id = :crime_id GROUP BY vote_type"),
+    ("get_subscription_by_user", "SELECT * FROM subscriptions WHERE user_id = :user_id LIMIT 1"),
+    ("flags for crime", "SELECT * FROM flagged_crimes WHERE crime_id = :crime_id"),
+    ("recent crimes",
+     "SELECT * FROM crimes WHERE created_at >= :since ORDER BY created_at DESC LIMIT 50"),
+    ("recent crimes by type",
+     "SELECT * FROM crimes WHERE crime_type = :crime_type AND created_at >= :since "
+     "ORDER BY created_at DESC LIMIT 50"),
+    ("top crime types",
+     "SELECT crime_type, count(crime_id) FROM crimes GROUP BY crime_type ORDER BY count(crime_id) DESC LIMIT 5"),
+    ("recent sos alerts", "SELECT * FROM sos_alerts WHERE created_at >= :since ORDER BY created_at DESC"),
+]
+
+
+def populate(conn, n_crimes, n_users, seed=42):
+    rnd = random.Random(seed)
+    now = datetime(2025, 9, 1)
+    conn.executemany(
+        "INSERT INTO users (user_id, fullname, username, email, role, hashed_password, created_at) "
+        "VALUES (?, ?, ?, ?, 'user', 'x', ?)",
+        ((i, f"User {i}", f"user{i}", f"user{i}@example.com", now) for i in range(1, n_users + 1)),
+    )
+
+    def crimes():
+        for i in range(1, n_crimes + 1):
+            ts = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+            yield (i, rnd.randint(1, n_users), rnd.choice(CRIME_TYPES), "synthetic report",
+                   rnd.uniform(-90, 90), rnd.uniform(-180, 180), ts, ts)
+
+    conn.executemany(
+        "INSERT INTO crimes (crime_id, user_id, crime_type, description, latitude, longitude, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        crimes(),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO votes (crime_id, user_id, vote_type, created_at) VALUES (?, ?, ?, ?)",
+        ((rnd.randint(1, n_crimes), rnd.randint(1, n_users), rnd.choice(["up", "down"]), now)
+         for _ in range(n_crimes * 3)),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO anonymous_votes (crime_id, ip_address, vote_type, created_at) VALUES (?, ?, ?, ?)",
+        ((rnd.randint(1, n_crimes), f"10.0.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}",
+          rnd.choice(["up", "down"]), now) for _ in range(n_crimes * 3)),
+    )
+    conn.executemany(
+        "INSERT INTO subscriptions (user_id, latitude, longitude, radius, is_active, created_at) "
+        "VALUES (?, 0, 0, 10, 1, ?)",
+        ((u, now) for u in range(1, n_users + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO flagged_crimes (crime_id, flagged_by, reason, is_flagged, created_at) VALUES (?, 1, 'spam', 1, ?)",
+        ((rnd.randint(1, n_crimes), now) for _ in range(n_crimes // 20)),
+    )
+    conn.executemany(
+        "INSERT INTO sos_alerts (user_id, message, latitude, longitude, created_at) VALUES (?, 'help', 0, 0, ?)",
+        ((rnd.randint(1, n_users), now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365)))
+         for _ in range(n_crimes)),
+    )
+    conn.commit()
+
+
+def run_queries(conn, params, repeat):
+    results = {}
+    for name, sql in QUERIES:
+        plan = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        results[name] = ((time.perf_counter() - start) / repeat * 1000, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+
+        conn = sqlite3.connect(path)
+        # start from the pre-migration index set
+        for name in NEW_INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        for _, ddl in OLD_INDEXES:
+            conn.execute(ddl)
+
+        start = time.perf_counter()
+        populate(conn, args.crimes, args.users)
+        print(f"populated {args.crimes} crimes in {time.perf_counter() - start:.1f}s")
+        conn.execute("ANALYZE")
+
+        params = {
+            "username": f"user{args.users // 2}",
+            "crime_id": args.crimes // 2,
+            "user_id": args.users // 2,
+            "since": datetime(2025, 8, 25),
+            "crime_type": "Theft",
+        }
+        before = run_queries(conn, params, args.repeat)
+
+        for name, _ in OLD_INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in NEW_INDEXES:
+                    cols = ", ".join(c.name for c in index.columns)
+                    conn.execute(f"CREATE INDEX {index.name} ON {table.name} ({cols})")
+        conn.execute("ANALYZE")
+        after = run_queries(conn, params, args.repeat)
+        conn.close()
+
+    for name, _ in QUERIES:
+        b_ms, b_plan = before[name]
+        a_ms, a_plan = after[name]
+        print(f"\n{name}: {b_ms:.3f} ms -> {a_ms:.3f} ms ({b_ms / max(a_ms, 1e-6):.1f}x)")
+        print(f"  before: {b_plan}")
+        print(f"  after:  {a_plan}")
+
+
+if __name__ == "__main__":
+    main()
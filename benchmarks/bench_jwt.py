@@ -0,0 +1,74 @@
+"""
+Token verifications per second: python-jose and PyJWT ``decode`` against
+the cached TokenVerifier (cold and warm), plus expired-token rejection.
+
+    python benchmarks/bench_jwt.py
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import jwt
+
+from app.token_verifier import TokenVerifier
+
+SECRET = "bench-secret"
+ALGORITHM = "HS256"
+
+
+def rate(fn, tokens, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for token in tokens:
+            fn(token)
+    return len(tokens) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    exp = datetime.now(timezone.utc) + timedelta(minutes=30)
+    tokens = [jwt.encode({"sub": f"user{i}", "exp": exp}, SECRET, algorithm=ALGORITHM) for i in range(args.tokens)]
+    expired = [jwt.encode({"sub": f"user{i}", "exp": 1}, SECRET, algorithm=ALGORITHM) for i in range(args.tokens)]
+
+    results = []
+    try:
+        from jose import jwt as jose_jwt
+        results.append(("python-jose decode", rate(
+            lambda t: jose_jwt.decode(t, SECRET, algorithms=[ALGORITHM]), tokens)))
+    except ImportError:
+        pass
+    results.append(("PyJWT decode", rate(lambda t: jwt.decode(t, SECRET, algorithms=[ALGORITHM]), tokens)))
+
+    verifier = TokenVerifier(SECRET, ALGORITHM, max_entries=0)
+    results.append(("TokenVerifier, no cache", rate(verifier.verify, tokens)))
+
+    verifier = TokenVerifier(SECRET, ALGORITHM, max_entries=args.tokens)
+    rate(verifier.verify, tokens)
+    results.append(("TokenVerifier, cached", rate(verifier.verify, tokens, args.repeat)))
+
+    def reject(fn):
+        def inner(token):
+            try:
+                fn(token)
+            except Exception:
+                pass
+        return inner
+
+    results.append(("PyJWT decode, expired", rate(
+        reject(lambda t: jwt.decode(t, SECRET, algorithms=[ALGORITHM])), expired)))
+    results.append(("TokenVerifier, expired", rate(reject(TokenVerifier(SECRET, ALGORITHM).verify), expired)))
+
+    for name, per_second in results:
+        print(f"{name:<26} {per_second:>12,.0f} verifications/s")
+
+
+if __name__ == "__main__":
+    main()
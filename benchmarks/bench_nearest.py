@@ -0,0 +1,82 @@
+"""
+Nearest-k query latency of the in-memory k-d tree against a brute-force
+numpy scan, with and without crime_type/recency filters.
+
+    python benchmarks/bench_nearest.py --crimes 1000000 --queries 2000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, UTC
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from app.nearest import NearestIndex, to_xyz
+
+TYPES = ["Theft", "Burglary", "Assault", "Robbery", "Vandalism"]
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1e3
+    return f"p50 {np.percentile(samples, 50):7.3f} ms  p99 {np.percentile(samples, 99):7.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    rnd = np.random.default_rng(7)
+
+    # most reports cluster around a handful of cities, the rest anywhere
+    centres = rnd.uniform([-40, -120], [60, 150], size=(50, 2))
+    pick = rnd.integers(0, len(centres), args.crimes)
+    lat = np.clip(centres[pick, 0] + rnd.normal(0, 0.3, args.crimes), -89, 89)
+    lng = np.clip(centres[pick, 1] + rnd.normal(0, 0.3, args.crimes), -179, 179)
+    types = rnd.choice(TYPES, args.crimes)
+    now = int(time.time())
+    created = now - rnd.integers(0, 365 * 86400, args.crimes)
+
+    index = NearestIndex()
+    start = time.perf_counter()
+    index.load(list(range(args.crimes)), list(types), lat, lng, created)
+    print(f"build {args.crimes:,} points: {time.perf_counter() - start:.2f} s")
+
+    qs = centres[rnd.integers(0, len(centres), args.queries)] + rnd.normal(0, 0.3, (args.queries, 2))
+    xyz = to_xyz(lat, lng)
+    week_ago = datetime.fromtimestamp(now - 7 * 86400, UTC)
+
+    cases = {
+        "k-d tree": lambda q: index.nearest(q[0], q[1], args.k),
+        "k-d tree, crime_type": lambda q: index.nearest(q[0], q[1], args.k, "robbery"),
+        "k-d tree, last 7 days": lambda q: index.nearest(q[0], q[1], args.k, since=week_ago),
+        "brute force": lambda q: np.argpartition(((xyz - to_xyz(q[0], q[1])) ** 2).sum(axis=1), args.k)[:args.k],
+    }
+    for name, run in cases.items():
+        samples = []
+        for q in qs[: args.queries if name != "brute force" else 50]:
+            start = time.perf_counter()
+            run(q)
+            samples.append(time.perf_counter() - start)
+        print(f"{name:24s} {percentiles(samples)}")
+
+    start = time.perf_counter()
+    for i in range(args.crimes, args.crimes + 10_000):
+        index.add(i, "Theft", float(lat[i % args.crimes]), float(lng[i % args.crimes]))
+        index.remove(i - args.crimes)
+    print(f"10,000 incremental add+remove: {(time.perf_counter() - start) / 10_000 * 1e6:.1f} us each")
+    samples = []
+    for q in qs[:500]:
+        start = time.perf_counter()
+        index.nearest(q[0], q[1], args.k)
+        samples.append(time.perf_counter() - start)
+    print(f"{'k-d tree after patches':24s} {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Thundering herd on GET /crime/crime: many clients ask for the same radius
+search at the same moment, with request coalescing (app/single_flight.py)
+off and on. Runs the whole app in-process over ASGI against a synthetic
+SQLite database; handlers run on the usual threadpool.
+
+    python benchmarks/bench_single_flight.py --crimes 10000 --clients 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_single_flight.db')}"
+for name, value in (("SECRET_KEY", "bench"), ("ALGORITHM", "HS256"), ("ACCESS_TOKEN_EXPIRE_MINUTES", "30")):
+    os.environ.setdefault(name, value)
+
+import httpx
+from sqlalchemy import insert
+
+from app import models, single_flight
+from app.database import Base, engine
+from app.main import app
+
+QUERY = {"lat": 6.5, "lng": 3.4, "radius": 5}
+
+
+def populate(n_crimes, seed=42):
+    rnd = random.Random(seed)
+    now = datetime(2025, 9, 1)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Users.__table__), [{
+            "user_id": 1, "fullname": "Bench", "username": "bench", "email": "bench@example.com",
+            "role": "user", "hashed_password": "x",
+        }])
+        conn.execute(insert(models.Crimes.__table__), [{
+            "user_id": 1, "crime_type": rnd.choice(["Theft", "Assault", "Robbery"]), "description": "synthetic report",
+            "latitude": rnd.uniform(6.4, 6.6), "longitude": rnd.uniform(3.3, 3.5),
+            "created_at": now - timedelta(minutes=i), "updated_at": now,
+        } for i in range(n_crimes)])
+
+
+async def herd(clients: int):
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            started = time.perf_counter()
+            response = await client.get("/crime/crime", params=QUERY)
+            return time.perf_counter() - started, response.status_code, len(response.content)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(clients)))
+        wall = time.perf_counter() - started
+        errors = sum(status != 200 for _, status, _ in results)
+        return wall, sorted(latency for latency, _, _ in results), errors, max(size for _, _, size in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=100)
+    args = parser.parse_args()
+    populate(args.crimes)
+    asyncio.run(herd(5))  # warm up
+
+    print(f"{args.clients} concurrent identical requests over {args.crimes} crimes")
+    print(f"{'single flight':<14} {'wall':>9} {'p50':>9} {'p99':>9} {'queries':>8} {'errors':>7}")
+    for enabled in (False, True):
+        single_flight.SINGLE_FLIGHT_ENABLED = enabled
+        single_flight.stats = single_flight.Stats()
+        wall, latencies, errors, size = asyncio.run(herd(args.clients))
+        queries = single_flight.stats.leaders if enabled else args.clients
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{'on' if enabled else 'off':<14} {wall * 1e3:7.0f}ms {statistics.median(latencies) * 1e3:7.0f}ms "
+              f"{p99 * 1e3:7.0f}ms {queries:8d} {errors:7d}")
+    print(f"response body {size / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
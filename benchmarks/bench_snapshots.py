@@ -0,0 +1,104 @@
+"""
+Memory per worker with the nearest-crime index built in every process
+versus mapped from one published snapshot (app/snapshots.py), and the
+time for a worker to get its index either way.
+
+Starts --workers processes that hold the index at the same time and
+reads each one's proportional set size (Pss, shared pages split between
+the processes mapping them) from /proc/<pid>/smaps_rollup, so Linux only.
+"none" is a worker without an index, for the baseline.
+
+    python benchmarks/bench_snapshots.py --crimes 1000000 --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+os.environ.setdefault("DB_URL", "sqlite://")
+
+CHILD = """
+import sys, time
+import numpy as np
+from app.nearest import NearestIndex
+from app.snapshots import SnapshotStore
+
+mode, crimes, root = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+index = NearestIndex()
+started = time.perf_counter()
+if mode == "local":
+    rnd = np.random.default_rng(1)
+    lat, lng = rnd.uniform(-60, 60, crimes), rnd.uniform(-180, 180, crimes)
+    index.load(np.arange(crimes), ["Theft"] * crimes, lat, lng, np.zeros(crimes, dtype=np.int64))
+elif mode == "shared":
+    store = SnapshotStore(root)
+    index.install(*store.load("nearest", store.current("nearest")))
+ready = time.perf_counter() - started
+if index.built:
+    # a worker that has served traffic for a while has touched all of it
+    for array in index._tree.arrays().values():
+        np.asarray(array).sum()
+    index.nearest(10, 10, 10)
+print(ready, flush=True)
+sys.stdin.readline()
+"""
+
+
+def pss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/smaps_rollup") as rollup:
+        for line in rollup:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    raise RuntimeError("no Pss in smaps_rollup")
+
+
+def publish(root: str, crimes: int):
+    from app.nearest import NearestIndex
+    from app.snapshots import SnapshotStore
+
+    rnd = np.random.default_rng(1)
+    lat, lng = rnd.uniform(-60, 60, crimes), rnd.uniform(-180, 180, crimes)
+    index = NearestIndex()
+    index.load(np.arange(crimes), ["Theft"] * crimes, lat, lng, np.zeros(crimes, dtype=np.int64))
+    started = time.perf_counter()
+    SnapshotStore(root).publish("nearest", *index.export())
+    return time.perf_counter() - started
+
+
+def run(mode: str, crimes: int, workers: int, root: str):
+    procs = [
+        subprocess.Popen([sys.executable, "-c", CHILD, mode, str(crimes), root], cwd=ROOT,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        ready = [float(proc.stdout.readline()) for proc in procs]
+        pss = [pss_kb(proc.pid) for proc in procs]
+    finally:
+        for proc in procs:
+            proc.communicate("\n")
+    return sum(ready) / workers, sum(pss) / workers / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    print(f"publish {args.crimes} crimes: {publish(root, args.crimes) * 1e3:.0f}ms")
+    print(f"{'mode':<8} {'ready':>10} {'Pss/worker':>12}   ({args.workers} workers)")
+    for mode in ("none", "local", "shared"):
+        ready, pss = run(mode, args.crimes, args.workers, root)
+        print(f"{mode:<8} {ready * 1e3:8.0f}ms {pss:10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Time for a fresh worker process to become ready (import app.main and run
+the lifespan startup), per SCHEMA_MODE, against an Alembic-migrated
+database. Each run is a new interpreter, as it would be for a uvicorn
+worker.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --db-url postgresql://user:pw@localhost/crime_db
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = """
+import asyncio, json, time
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        t2 = time.perf_counter()
+        from app.router import auth_utils
+        auth_utils.hash_password("warm")
+        t3 = time.perf_counter()
+        print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first_hash": t3 - t2}), flush=True)
+
+asyncio.run(boot())
+"""
+
+
+def migrate(db_url: str):
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    config.set_main_option("sqlalchemy.url", db_url)
+    command.upgrade(config, "head")
+
+
+def boot(db_url: str, mode: str) -> dict:
+    env = dict(os.environ, DB_URL=db_url, SCHEMA_MODE=mode, SCHEDULER_ENABLED="false")
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    # process spawn to ready, including interpreter start; the password hash comes after
+    timings["ready"] = time.perf_counter() - started - timings["first_hash"]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db-url", help="migrated database to boot against (default: a temporary SQLite file)")
+    parser.add_argument("--modes", nargs="+", default=["create", "verify", "skip"])
+    args = parser.parse_args()
+
+    db_url = args.db_url
+    if db_url is None:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}"
+        sys.path.append(ROOT)
+        os.environ.setdefault("DB_URL", db_url)
+        migrate(db_url)
+
+    boot(db_url, "verify")  # warm the OS file cache and bytecode
+    print(f"{'mode':<8} {'ready':>10} {'import':>10} {'startup':>10} {'1st hash':>10}   (medians of {args.runs})")
+    for mode in args.modes:
+        runs = [boot(db_url, mode) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) * 1e3 for key in runs[0]}
+        print(f"{mode:<8} {median['ready']:8.1f}ms {median['import']:8.1f}ms "
+              f"{median['startup']:8.1f}ms {median['first_hash']:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cluster query latency from the tile index against grouping every crime
+on each request, for a zoomed-out and a city-level view.
+
+    python benchmarks/bench_tiles.py --crimes 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from app.tiles import TileIndex, tile_xy
+
+TYPES = ["Theft", "Burglary", "Assault", "Robbery", "Vandalism"]
+
+
+def naive(points, bbox, zoom):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    cells = Counter()
+    for kind, lat, lng in points:
+        if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+            cells[(tile_xy(lat, lng, zoom + 3), kind)] += 1
+    return cells
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crimes", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    rnd = random.Random(3)
+
+    # half clustered around a few cities, half spread over a country
+    cities = [(6.52, 3.38), (9.07, 7.40), (12.0, 8.52), (4.82, 7.03)]
+    points = []
+    for i in range(args.crimes):
+        if i % 2:
+            lat, lng = rnd.choice(cities)
+            points.append((rnd.choice(TYPES), lat + rnd.gauss(0, 0.05), lng + rnd.gauss(0, 0.05)))
+        else:
+            points.append((rnd.choice(TYPES), rnd.uniform(4, 14), rnd.uniform(3, 14)))
+
+    index = TileIndex()
+    start = time.perf_counter()
+    for kind, lat, lng in points:
+        index.add(kind, lat, lng)
+    index._built = True
+    print(f"built index for {args.crimes} crimes in {time.perf_counter() - start:.1f}s")
+
+    views = [("country, zoom 5", (4.0, 3.0, 14.0, 14.0), 5), ("city, zoom 11", (6.4, 3.2, 6.65, 3.55), 11)]
+    for name, bbox, zoom in views:
+        cold = timed(lambda: (index._tile_cache.clear(), index.clusters(*bbox, zoom)), args.repeat)
+        warm = timed(lambda: index.clusters(*bbox, zoom), args.repeat)
+        scan = timed(lambda: naive(points, bbox, zoom), max(1, args.repeat // 10))
+        print(f"{name:<16} index cold {cold:8.2f} ms   warm {warm:8.2f} ms   full scan {scan:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,12 @@ def client():
     return TestClient(app)
 
 
+def login(client, username, password):
+    """Authorization header for a user created by the signup tests."""
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
 # --- Tests ---
 def test_root(client):
     response = client.get("/")
@@ -459,4 +465,1198 @@ def test_get_all_sos_alerts(client):
     assert len(data) > 0
     assert "message" in data[0]
     assert "latitude" in data[0]
-    assert "longitude" in data[0]
\ No newline at end of file
+    assert "longitude" in data[0]
+
+
+def test_anonymous_vote_rate_limited(client, monkeypatch):
+    from app import rate_limit
+    monkeypatch.setattr(rate_limit, "backend", rate_limit.InMemoryBackend())
+    monkeypatch.setitem(rate_limit.POLICIES, "anonymous_vote",
+                        rate_limit.RateLimitPolicy("anonymous_vote", capacity=1, refill_rate=0.01))
+
+    response = client.post("/vote/crimes/2/vote", json={"vote_type": "up"})
+    assert response.status_code == 200
+
+    response = client.post("/vote/crimes/2/vote", json={"vote_type": "up"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_sos_rate_limited(client, monkeypatch):
+    from app import rate_limit
+    monkeypatch.setattr(rate_limit, "backend", rate_limit.InMemoryBackend())
+    monkeypatch.setitem(rate_limit.POLICIES, "sos",
+                        rate_limit.RateLimitPolicy("sos", capacity=1, refill_rate=0.01))
+
+    headers = login(client, "sosuser", "password123")
+    sos = {"latitude": 40.7128, "longitude": -74.0060, "message": "Need help!"}
+
+    response = client.post("/sos/send_sos", json=sos, headers=headers)
+    assert response.status_code == 200
+
+    response = client.post("/sos/send_sos", json=sos, headers=headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+
+
+def test_invalid_tokens_rejected(client):
+    from datetime import timedelta
+    from app.router import auth_utils
+
+    expired = auth_utils.create_access_token(
+        data={"sub": "sosuser"}, expires_delta=timedelta(minutes=-1)
+    )
+    response = client.get("/auth/me/", headers={"Authorization": f"Bearer {expired}"})
+    assert response.status_code == 401
+
+    valid = auth_utils.create_access_token(data={"sub": "sosuser"})
+    header, payload, signature = valid.split(".")
+    tampered = ".".join([header, payload, signature[::-1]])
+    response = client.get("/auth/me/", headers={"Authorization": f"Bearer {tampered}"})
+    assert response.status_code == 401
+
+    # served from the verifier cache the second time
+    for _ in range(2):
+        response = client.get("/auth/me/", headers={"Authorization": f"Bearer {valid}"})
+        assert response.status_code == 200
+        assert response.json()["username"] == "sosuser"
+
+
+
+def test_refresh_token_rotation(client):
+    response = client.post("/auth/login", data={
+        "username": "subuser",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    first = response.json()
+    assert "refresh_token" in first
+
+    response = client.post("/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert response.status_code == 200
+    second = response.json()
+    assert second["refresh_token"] != first["refresh_token"]
+
+    response = client.get("/auth/me/", headers={"Authorization": f"Bearer {second['access_token']}"})
+    assert response.status_code == 200
+
+    # replaying the rotated token revokes the whole session
+    response = client.post("/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert response.status_code == 401
+    response = client.post("/auth/refresh", json={"refresh_token": second["refresh_token"]})
+    assert response.status_code == 401
+    response = client.get("/auth/me/", headers={"Authorization": f"Bearer {second['access_token']}"})
+    assert response.status_code == 401
+
+
+def test_logout_and_admin_revoke(client):
+    response = client.post("/auth/login", data={
+        "username": "subuser",
+        "password": "password123"
+    })
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.post("/auth/logout", headers=headers)
+    assert response.status_code == 200
+    response = client.get("/auth/me/", headers=headers)
+    assert response.status_code == 401
+
+    user_headers = login(client, "subuser", "password123")
+    user_id = client.get("/auth/me/", headers=user_headers).json()["user_id"]
+
+    admin_headers = login(client, "adminuser", "adminpassword")
+
+    response = client.post(f"/admin/users/{user_id}/sessions/revoke", headers=user_headers)
+    assert response.status_code == 403
+
+    response = client.post(f"/admin/users/{user_id}/sessions/revoke", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["revoked"] >= 1
+    response = client.get("/auth/me/", headers=user_headers)
+    assert response.status_code == 401
+
+
+
+def test_duplicate_reports_linked(client):
+    headers = login(client, "normaluser", "userpassword")
+
+    first = client.post("/crime/crimes", json={
+        "crime_type": "Robbery",
+        "description": "Armed robbery at the corner shop on Main street",
+        "latitude": 6.5244,
+        "longitude": 3.3792
+    }, headers=headers).json()["crime"][0]
+    assert first["canonical_id"] is None
+
+    second = client.post("/crime/crimes", json={
+        "crime_type": "robbery",
+        "description": "Armed robbery at the corner shop on Main street right now",
+        "latitude": 6.5250,
+        "longitude": 3.3795
+    }, headers=headers).json()["crime"][0]
+    assert second["canonical_id"] == first["crime_id"]
+
+    unrelated = client.post("/crime/crimes", json={
+        "crime_type": "Robbery",
+        "description": "Phone snatched from a passenger in a bus",
+        "latitude": 6.5244,
+        "longitude": 3.3792
+    }, headers=headers).json()["crime"][0]
+    assert unrelated["canonical_id"] is None
+
+    ids = {c["crime_id"] for c in client.get("/crime/crime", params={"collapse_duplicates": True}).json()}
+    assert first["crime_id"] in ids
+    assert second["crime_id"] not in ids
+    assert unrelated["crime_id"] in ids
+
+
+
+def test_crime_clusters(client):
+    world = {"min_lat": -85, "min_lng": -180, "max_lat": 85, "max_lng": 180, "zoom": 1}
+    response = client.get("/crime/clusters", params=world)
+    assert response.status_code == 200
+    before = sum(cell["count"] for cell in response.json()["cells"])
+    assert before == len(client.get("/crime/crime").json())
+
+    headers = login(client, "normaluser", "userpassword")
+    client.post("/crime/crimes", json={
+        "crime_type": "Arson",
+        "description": "Car set on fire",
+        "latitude": -33.8688,
+        "longitude": 151.2093
+    }, headers=headers)
+
+    cells = client.get("/crime/clusters", params=world).json()["cells"]
+    assert sum(cell["count"] for cell in cells) == before + 1
+
+    sydney = {"min_lat": -34.5, "min_lng": 150.5, "max_lat": -33.5, "max_lng": 151.5, "zoom": 9}
+    cells = client.get("/crime/clusters", params={**sydney, "crime_type": "arson"}).json()["cells"]
+    assert len(cells) == 1
+    assert cells[0]["by_type"] == {"Arson": 1}
+
+    response = client.get("/crime/clusters", params={**world, "zoom": 12})
+    assert response.status_code == 400
+
+
+def test_nearest_crimes(client):
+    headers = login(client, "normaluser", "userpassword")
+    sydney = {"lat": -33.8690, "lng": 151.2090}
+
+    # build the index first so the create below is applied incrementally
+    nearest = client.get("/crime/nearest", params={**sydney, "k": 1}).json()
+    assert nearest[0]["crime_type"] == "Arson"
+    assert nearest[0]["distance_km"] < 1
+
+    response = client.post("/crime/crimes", json={
+        "crime_type": "Theft",
+        "description": "Wallet snatched outside the opera house",
+        "latitude": -33.8568,
+        "longitude": 151.2153
+    }, headers=headers)
+    theft_id = response.json()["crime"][0]["crime_id"]
+
+    nearest = client.get("/crime/nearest", params={**sydney, "k": 3}).json()
+    assert [c["crime_type"] for c in nearest[:2]] == ["Arson", "Theft"]
+    assert nearest[0]["distance_km"] <= nearest[1]["distance_km"] <= nearest[2]["distance_km"]
+
+    nearest = client.get("/crime/nearest", params={**sydney, "crime_type": "theft", "since_hours": 1}).json()
+    assert [c["crime_id"] for c in nearest] == [theft_id]
+
+    client.delete(f"/crime/crime/{theft_id}", headers=headers)
+    nearest = client.get("/crime/nearest", params={**sydney, "k": 5}).json()
+    assert theft_id not in [c["crime_id"] for c in nearest]
+
+
+def test_nearest_index_matches_brute_force():
+    import numpy as np
+    from datetime import datetime, UTC
+    from app.nearest import NearestIndex, to_xyz
+
+    rnd = np.random.default_rng(3)
+    n = 5000
+    lat, lng = rnd.uniform(-80, 80, n), rnd.uniform(-180, 180, n)
+    types = rnd.choice(["Theft", "Assault"], n)
+    created = rnd.integers(0, 1000, n)
+    index = NearestIndex()
+    index.load(list(range(n)), list(types), lat, lng, created)
+    # incremental patches: moved points go through the pending list, deletes are tombstoned
+    for i in range(0, 300, 3):
+        lat[i], lng[i] = 10 + i / 1e3, 10
+        index.remove(i)
+        index.add(i, types[i], lat[i], lng[i], datetime.fromtimestamp(int(created[i]), UTC))
+    for i in range(1, 300, 3):
+        index.remove(i)
+    alive = np.ones(n, dtype=bool)
+    alive[1:300:3] = False
+
+    dist = ((to_xyz(lat, lng) - to_xyz(10, 10)) ** 2).sum(axis=1)
+    order = np.argsort(dist, kind="stable")
+    got = index.nearest(10, 10, 25)
+    assert [i for i, _ in got] == [int(i) for i in order if alive[i]][:25]
+
+    match = alive & (types == "Assault") & (created >= 500)
+    got = index.nearest(10, 10, 25, "assault", datetime.fromtimestamp(500, UTC))
+    assert [i for i, _ in got] == [int(i) for i in order if match[i]][:25]
+
+    # writes that land while a rebuild reads the database: a create the read already saw, an update
+    # and a delete it did not
+    now = datetime.now(UTC)
+    index = NearestIndex()
+    index.load([0, 1, 2], ["Theft"] * 3, [0, 0, 0], [0, 1, 2], [0, 0, 0])
+    index.add(3, "Theft", 0, 0.5, now)
+    index.remove(1)
+    index.add(1, "Theft", 0, 0.1, now)
+    index.remove(2)
+    index.load([0, 1, 2, 3], ["Theft"] * 4, [0, 0, 0, 0], [0, 1, 2, 0.5], [0, 0, 0, int(now.timestamp())],
+               source_time=now.timestamp() - 1)
+    assert [i for i, _ in index.nearest(0, 0, 10)] == [0, 1, 3]
+
+
+def test_trust_score(client):
+    user_headers = login(client, "normaluser", "userpassword")
+    ids = []
+    for description in ("Shop window smashed", "Bicycle stolen from rack"):
+        response = client.post("/crime/crimes", json={
+            "crime_type": "Vandalism",
+            "description": description,
+            "latitude": 48.8566 + len(ids),
+            "longitude": 2.3522
+        }, headers=user_headers)
+        ids.append(response.json()["crime"][0]["crime_id"])
+    trusted, flagged = ids
+
+    client.post(f"/vote/crimes/{trusted}/vote", json={"vote_type": "up"}, headers=login(client, "updateduser", "newpassword"))
+    admin_headers = login(client, "adminuser", "adminpassword")
+    client.post(f"/admin/crime/{flagged}/flag", json={"reason": "Spam"}, headers=admin_headers)
+
+    crimes = client.get("/crime/crime", params={"sort": "score"}).json()
+    scores = [c["trust_score"] for c in crimes]
+    assert scores == sorted(scores, reverse=True)
+    by_id = {c["crime_id"]: c["trust_score"] for c in crimes}
+    assert 0.9 < by_id[trusted] <= 1.0
+    assert -5.0 <= by_id[flagged] < -4.5
+    assert crimes[-1]["crime_id"] == flagged
+
+    above = [c["crime_id"] for c in client.get("/crime/crime", params={"min_score": 0.5}).json()]
+    assert trusted in above and flagged not in above
+
+    response = client.post("/admin/scores/recompute", headers=admin_headers)
+    assert response.status_code == 200
+    recomputed = {c["crime_id"]: c["trust_score"] for c in client.get("/crime/crime").json()}
+    assert recomputed[trusted] == pytest.approx(by_id[trusted])
+    assert recomputed[flagged] == pytest.approx(by_id[flagged])
+
+    assert client.post("/admin/scores/recompute", headers=user_headers).status_code == 403
+
+
+def test_batch_endpoints(client, monkeypatch):
+    crimes = client.get("/crime/crime").json()
+    first, second = crimes[0]["crime_id"], crimes[1]["crime_id"]
+    missing = max(c["crime_id"] for c in crimes) + 1000
+
+    response = client.get("/crime/batch", params={"ids": [second, first, second, missing], "include_votes": True})
+    assert response.status_code == 200
+    data = response.json()
+    assert [c["crime_id"] for c in data["crimes"]] == [second, first]
+    assert data["missing"] == [missing]
+    assert data["votes"][str(first)] == client.get(f"/vote/crimes/{first}/votes").json()
+
+    response = client.get("/vote/crimes/votes", params={"ids": [first, missing]})
+    assert response.status_code == 200
+    assert response.json()[str(missing)] == {"authenticated": {}, "anonymous": {}, "total": {}}
+
+    from app import loaders
+    monkeypatch.setattr(loaders, "BATCH_MAX_IDS", 2)
+    assert client.get("/crime/batch", params={"ids": [1, 2, 3]}).status_code == 400
+    assert client.get("/vote/crimes/votes", params={"ids": [1, 2, 3]}).status_code == 400
+
+
+def test_data_loader_deduplicates_and_chunks():
+    from app.loaders import DataLoader
+
+    calls = []
+    def fetch(keys):
+        calls.append(list(keys))
+        return {key: key * 10 for key in keys if key != 4}
+
+    loader = DataLoader(fetch, max_batch_size=2)
+    assert loader.load_many([1, 2, 1, 3, 4]) == {1: 10, 2: 20, 3: 30, 4: None}
+    assert calls == [[1, 2], [3, 4]]
+    assert loader.load(3) == 30 and loader.load(5) == 50
+    assert calls[-1] == [5]
+
+
+def test_change_feed(client, monkeypatch):
+    from datetime import datetime, UTC
+    headers = login(client, "normaluser", "userpassword")
+
+    cursor = client.get("/crime/changes").json()["cursor"]
+    cursor_taken_at = datetime.now(UTC)
+
+    ids = []
+    for description in ("Car broken into on Elm Street", "Fence spray painted"):
+        response = client.post("/crime/crimes", json={
+            "crime_type": "Vandalism",
+            "description": description,
+            "latitude": 40.7128 + len(ids),
+            "longitude": -74.0060
+        }, headers=headers)
+        ids.append(response.json()["crime"][0]["crime_id"])
+    kept, removed = ids
+    client.put(f"/crime/{kept}", json={"description": "Car broken into on Oak Street"}, headers=headers)
+    client.delete(f"/crime/crime/{removed}", headers=headers)
+
+    response = client.get("/crime/changes", params={"since": cursor})
+    assert response.status_code == 200
+    data = response.json()
+    assert not data["has_more"]
+    assert [(c["crime_id"], c["op"]) for c in data["changes"]] == [(kept, "update"), (removed, "delete")]
+    assert data["changes"][0]["crime"]["description"] == "Car broken into on Oak Street"
+    assert data["changes"][1]["crime"] is None
+
+    page = client.get("/crime/changes", params={"since": cursor, "limit": 2}).json()
+    assert page["has_more"]
+    assert [(c["crime_id"], c["op"]) for c in page["changes"]] == [(kept, "create"), (removed, "delete")]
+    rest = client.get("/crime/changes", params={"since": page["cursor"]}).json()
+    assert [(c["crime_id"], c["op"]) for c in rest["changes"]] == [(kept, "update"), (removed, "delete")]
+
+    assert client.get("/crime/changes", params={"since": data["cursor"]}).json()["changes"] == []
+    assert client.get("/crime/changes", params={"since": data["cursor"] + 10}).status_code == 410
+
+    # with concurrent writers, changes are held back until they have settled
+    from app import change_log
+    monkeypatch.setattr(change_log, "_settled", lambda db: cursor_taken_at)
+    held = client.get("/crime/changes", params={"since": cursor}).json()
+    assert held["changes"] == [] and held["cursor"] == cursor
+    assert client.get("/crime/changes").json()["cursor"] == cursor
+
+
+def test_moderation_queue(client):
+    user_headers = login(client, "normaluser", "userpassword")
+    admin_headers = login(client, "adminuser", "adminpassword")
+
+    ids = []
+    for description, lng in (("Fake charity collectors", 13.40), ("Card skimmer at ATM", 13.41), ("Phishing texts", 2.0)):
+        response = client.post("/crime/crimes", json={
+            "crime_type": "Fraud",
+            "description": description,
+            "latitude": 52.52,
+            "longitude": lng
+        }, headers=user_headers)
+        ids.append(response.json()["crime"][0]["crime_id"])
+    worst, berlin, elsewhere = ids
+    for crime_id in (worst, worst, berlin, elsewhere):
+        client.post(f"/admin/crime/{crime_id}/flag", json={"reason": "Fake report"}, headers=admin_headers)
+
+    queue = client.get("/admin/moderation/queue", params={"crime_type": "fraud"}, headers=admin_headers).json()
+    assert queue["total"] == 3
+    # ties go to the most recently flagged
+    assert [(i["crime_id"], i["flag_count"]) for i in queue["items"]] == [(worst, 2), (elsewhere, 1), (berlin, 1)]
+    berlin_box = {"crime_type": "fraud", "min_lat": 52, "min_lng": 13, "max_lat": 53, "max_lng": 14}
+    queue = client.get("/admin/moderation/queue", params={**berlin_box, "limit": 1}, headers=admin_headers).json()
+    assert queue["total"] == 2 and [i["crime_id"] for i in queue["items"]] == [worst]
+
+    response = client.post("/admin/moderation/actions", json={"action": "hide", "crime_ids": [worst, worst]},
+                           headers=admin_headers)
+    assert response.json() == {"action": "hide", "crime_ids": [worst], "flags_resolved": 2}
+    assert worst not in [c["crime_id"] for c in client.get("/crime/crime").json()]
+    assert client.get(f"/crime/crime/{worst}").status_code == 404
+    queue = client.get("/admin/moderation/queue", params=berlin_box, headers=admin_headers).json()
+    assert [i["crime_id"] for i in queue["items"]] == [berlin]
+    resolved = client.get("/admin/moderation/queue", params={**berlin_box, "status": "resolved"}, headers=admin_headers)
+    assert resolved.json()["items"][0]["is_hidden"]
+
+    client.post("/admin/moderation/actions", json={"action": "unhide", "crime_ids": [worst]}, headers=admin_headers)
+    assert client.get(f"/crime/crime/{worst}").status_code == 200
+
+    response = client.post("/admin/moderation/actions", json={"action": "delete", "crime_ids": [berlin, elsewhere]},
+                           headers=admin_headers)
+    assert sorted(response.json()["crime_ids"]) == sorted([berlin, elsewhere])
+    assert client.get(f"/crime/crime/{berlin}").status_code == 404
+    queue = client.get("/admin/moderation/queue", params={"crime_type": "fraud"}, headers=admin_headers).json()
+    assert not {berlin, elsewhere} & {i["crime_id"] for i in queue["items"]}
+
+    response = client.post("/admin/moderation/actions", json={"action": "resolve", "crime_ids": [worst]},
+                           headers=user_headers)
+    assert response.status_code == 403
+
+
+def test_soft_delete_and_archive(client):
+    from datetime import datetime, timedelta, UTC
+    from app import models
+
+    user_headers = login(client, "normaluser", "userpassword")
+    admin_headers = login(client, "adminuser", "adminpassword")
+
+    ids = []
+    for description in ("Old mugging by the river", "Stolen scooter", "Broken shop sign"):
+        response = client.post("/crime/crimes", json={
+            "crime_type": "Robbery",
+            "description": description,
+            "latitude": -1.2921 + len(ids),
+            "longitude": 36.8219
+        }, headers=user_headers)
+        ids.append(response.json()["crime"][0]["crime_id"])
+    old, deleted, recent = ids
+    client.post(f"/vote/crimes/{old}/vote", json={"vote_type": "up"}, headers=login(client, "updateduser", "newpassword"))
+
+    assert client.delete(f"/crime/crime/{deleted}", headers=user_headers).status_code == 200
+    assert client.get(f"/crime/crime/{deleted}").status_code == 404
+    assert client.delete(f"/crime/crime/{deleted}", headers=user_headers).status_code == 404
+    assert deleted not in [c["crime_id"] for c in client.get("/crime/crime").json()]
+
+    db = TestingSessionLocal()
+    long_ago = datetime.now(UTC) - timedelta(days=400)
+    db.query(models.Crimes).filter(models.Crimes.crime_id.in_([old, deleted])) \
+        .update({models.Crimes.created_at: long_ago}, synchronize_session=False)
+    db.commit()
+    stats = client.get("/admin/statistics", headers=admin_headers).json()
+
+    response = client.post("/admin/archive/run", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["archived"] == 2
+
+    live = [c["crime_id"] for c in client.get("/crime/crime").json()]
+    assert old not in live and recent in live
+    everything = client.get("/crime/crime", params={"include_archived": True, "sort": "newest"}).json()
+    assert old in [c["crime_id"] for c in everything] and deleted not in [c["crime_id"] for c in everything]
+    assert everything[-1]["crime_id"] == old
+
+    assert client.get("/admin/statistics", headers=admin_headers).json()["total_reports"] == stats["total_reports"] - 1
+    stats = client.get("/admin/statistics", params={"include_archived": True}, headers=admin_headers).json()
+    assert stats["total_reports"] == client.get("/admin/statistics", headers=admin_headers).json()["total_reports"] + 1
+
+    assert db.query(models.Votes).filter_by(crime_id=old).count() == 0
+    assert db.query(models.VoteArchive).filter_by(crime_id=old).count() == 1
+    assert db.query(models.CrimeArchive).filter_by(crime_id=deleted).one().deleted_at is not None
+    db.close()
+
+
+def test_created_at_range_filters(client):
+    from datetime import datetime, timedelta, UTC
+    from app import models, partitions
+    from app.database import engine
+
+    user_headers = login(client, "normaluser", "userpassword")
+    admin_headers = login(client, "adminuser", "adminpassword")
+
+    ids = []
+    for description in ("Last month's break-in", "Today's break-in"):
+        response = client.post("/crime/crimes", json={
+            "crime_type": "Burglary",
+            "description": description,
+            "latitude": 48.8566 + len(ids),
+            "longitude": 2.3522
+        }, headers=user_headers)
+        ids.append(response.json()["crime"][0]["crime_id"])
+    old, recent = ids
+
+    db = TestingSessionLocal()
+    db.query(models.Crimes).filter(models.Crimes.crime_id == old) \
+        .update({models.Crimes.created_at: datetime.now(UTC).replace(tzinfo=None) - timedelta(days=40)}, synchronize_session=False)
+    db.commit()
+    db.close()
+
+    cutoff = (datetime.now(UTC).replace(tzinfo=None) - timedelta(days=10)).isoformat()
+    newer = [c["crime_id"] for c in client.get("/crime/crime", params={"since": cutoff}).json()]
+    older = [c["crime_id"] for c in client.get("/crime/crime", params={"until": cutoff}).json()]
+    assert recent in newer and old not in newer
+    assert old in older and recent not in older
+
+    total = client.get("/admin/statistics", headers=admin_headers).json()["total_reports"]
+    since = client.get("/admin/statistics", params={"since": cutoff}, headers=admin_headers).json()["total_reports"]
+    until = client.get("/admin/statistics", params={"until": cutoff}, headers=admin_headers).json()["total_reports"]
+    assert since + until == total and until >= 1
+
+    future = (datetime.now(UTC).replace(tzinfo=None) + timedelta(days=1)).isoformat()
+    assert client.get("/sos/sos_alerts", params={"since": future}, headers=admin_headers).json() == []
+    assert client.get("/sos/sos_alerts", params={"until": future}, headers=admin_headers).json()
+
+    assert partitions.add_months(datetime(2025, 11, 1), 3) == datetime(2026, 2, 1)
+    assert partitions.add_months(datetime(2025, 1, 1), -1) == datetime(2024, 12, 1)
+    assert partitions.partition_name("crimes", datetime(2025, 3, 17)) == "crimes_p2025_03"
+    assert partitions.cutover_month(datetime(2025, 11, 30)) == datetime(2026, 1, 1)
+    # SQLite keeps plain tables; there is nothing to maintain
+    assert partitions.maintain(engine) == 0
+
+
+def test_read_replica_routing(client, monkeypatch, tmp_path):
+    import shutil
+    import time
+    from app import models, replicas
+
+    user_headers = login(client, "normaluser", "userpassword")
+
+    # a replica that stopped replicating right now
+    shutil.copy("test.db", tmp_path / "replica.db")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    broken = create_engine("sqlite:///file:/nonexistent/replica.db?mode=ro&uri=true")
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([replica], sticky_seconds=60))
+
+    response = client.post("/crime/crimes", json={
+        "crime_type": "Vandalism",
+        "description": "Graffiti on the station wall",
+        "latitude": 52.52,
+        "longitude": 13.405
+    }, headers=user_headers)
+    new = response.json()["crime"][0]["crime_id"]
+    marker = response.headers[replicas.WRITE_HEADER]
+    assert client.cookies[replicas.WRITE_COOKIE] == marker
+
+    # the writer reads their own write from the primary, even on a worker that did not take it
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([replica], sticky_seconds=60))
+    assert new in [c["crime_id"] for c in client.get("/crime/crime", headers=user_headers).json()]
+    client.cookies.clear()
+    assert new in [c["crime_id"] for c in client.get("/crime/crime", headers={replicas.WRITE_HEADER: marker}).json()]
+    # everyone else hits the stale replica, and a forged marker does not help
+    anonymous = [c["crime_id"] for c in client.get("/crime/crime").json()]
+    assert anonymous and new not in anonymous
+    forged = f"{time.time():.6f}:{marker.split(':')[1]}"
+    assert new not in [c["crime_id"] for c in client.get("/crime/crime", headers={replicas.WRITE_HEADER: forged}).json()]
+
+    router = replicas.ReplicaRouter([broken, replica])
+    monkeypatch.setattr(replicas, "router", router)
+    assert new not in [c["crime_id"] for c in client.get("/crime/crime").json()]
+    assert router.healthy() == [replica]
+
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([broken]))
+    assert new in [c["crime_id"] for c in client.get("/crime/crime").json()]
+
+    db = replicas.ReadOnlySession(bind=replica)
+    db.add(models.Subscription(user_id=1, latitude=0.0, longitude=0.0, radius=1.0))
+    with pytest.raises(RuntimeError):
+        db.flush()
+    db.close()
+    replica.dispose()
+    broken.dispose()
+
+
+def test_media_upload_and_thumbnail(client, monkeypatch, tmp_path):
+    import io
+    from PIL import Image
+    from app import media
+
+    user_headers = login(client, "normaluser", "userpassword")
+    monkeypatch.setattr(media, "storage", media.LocalStorage(str(tmp_path), "/media"))
+
+    response = client.post("/crime/crimes", json={
+        "crime_type": "Vandalism",
+        "description": "Smashed bus shelter",
+        "latitude": 51.5074,
+        "longitude": -0.1278
+    }, headers=user_headers)
+    crime_id = response.json()["crime"][0]["crime_id"]
+
+    photo = io.BytesIO()
+    Image.new("RGB", (1000, 600), "red").save(photo, "PNG")
+    response = client.post(f"/crime/{crime_id}/media", files={"file": ("shelter.png", photo.getvalue(), "image/png")},
+                           headers=user_headers)
+    assert response.status_code == 200
+    media_url = response.json()["media_url"]
+    assert media_url.startswith(f"/media/crimes/{crime_id}/") and media_url.endswith(".png")
+
+    media.drain(timeout=10)
+    crime = client.get(f"/crime/crime/{crime_id}").json()
+    assert crime["media_url"] == media_url
+    assert crime["thumbnail_url"] == media_url[:-len(".png")] + "_thumb.jpg"
+    with Image.open(tmp_path / crime["thumbnail_url"][len("/media/"):]) as thumb:
+        assert thumb.size == (320, 192)
+
+    files = sorted(p.name for p in tmp_path.rglob("*"))
+    response = client.post(f"/crime/{crime_id}/media", files={"file": ("notes.txt", b"hello", "text/plain")},
+                           headers=user_headers)
+    assert response.status_code == 415
+    monkeypatch.setattr(media, "MEDIA_MAX_BYTES", 1024)
+    response = client.post(f"/crime/{crime_id}/media", files={"file": ("big.jpg", b"x" * 5000, "image/jpeg")},
+                           headers=user_headers)
+    assert response.status_code == 413
+    assert sorted(p.name for p in tmp_path.rglob("*")) == files
+
+    response = client.post(f"/crime/{crime_id}/media", files={"file": ("shelter.png", photo.getvalue(), "image/png")},
+                           headers=login(client, "updateduser", "newpassword"))
+    assert response.status_code == 403
+
+
+def test_background_scheduler(client):
+    import threading
+    import time
+    from datetime import timedelta
+    from app import models, scheduler as scheduler_module
+    from app.revocation import utcnow
+
+    worker = scheduler_module.Scheduler(engine)
+    other = scheduler_module.Scheduler(engine)
+    calls = []
+    job = worker.register("count_crimes", lambda db: calls.append(db.query(models.Crimes).count()), 3600)
+    assert worker.run_job(job) == "ok" and len(calls) == 1
+    # another worker just ran it; it is not due anywhere until the interval passes
+    assert other.run_job(other.register("count_crimes", job.fn, 3600)) == "skipped"
+    assert worker.run_job(job, force=True) == "ok" and len(calls) == 2
+
+    db = TestingSessionLocal()
+    db.query(models.JobLock).filter_by(name="count_crimes").update(
+        {"owner": other.owner, "locked_until": utcnow() + timedelta(minutes=5)})
+    db.commit()
+    assert worker.run_job(job, force=True) == "skipped" and job.skipped == 1
+
+    release = threading.Event()
+    slow = worker.register("slow", lambda db: release.wait(5), 3600, timeout=0.05)
+    assert worker.run_job(slow) == "timeout" and slow.running
+    assert worker.run_job(slow, force=True) == "skipped"
+    release.set()
+    slow.thread.join(5)
+
+    def broken(db):
+        raise ValueError("no such table")
+
+    failing = worker.register("broken", broken, 3600)
+    assert worker.run_job(failing) == "failed" and "no such table" in failing.last_error
+    lease = db.query(models.JobLock).filter_by(name="broken").one()
+    assert lease.last_status == "failed" and lease.locked_until is None
+    db.close()
+
+    ticks = []
+    looping = scheduler_module.Scheduler(engine)
+    looping.register("tick", lambda db: ticks.append(1), 0.05, jitter=0, exclusive=False)
+    looping.start()
+    deadline = time.monotonic() + 5
+    while len(ticks) < 3 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    looping.stop()
+    assert len(ticks) >= 3
+
+    admin_headers = login(client, "adminuser", "adminpassword")
+    response = client.post("/admin/jobs/prune_changes/run", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["last_status"] == "ok" and response.json()["last_run_status"] == "ok"
+    jobs = {j["name"]: j for j in client.get("/admin/jobs", headers=admin_headers).json()}
+    assert {"archive", "prune_changes", "recompute_scores", "partitions", "warm_indexes", "prune_dedup"} <= set(jobs)
+    assert jobs["prune_changes"]["runs"] >= 1 and not jobs["warm_indexes"]["exclusive"]
+    assert not jobs["prune_dedup"]["exclusive"]
+    assert client.post("/admin/jobs/nope/run", headers=admin_headers).status_code == 404
+    assert client.get("/admin/jobs", headers=login(client, "normaluser", "userpassword")).status_code == 403
+
+
+def test_schema_verify_and_pool_warmup(monkeypatch, tmp_path):
+    from sqlalchemy import text
+    from app import database
+    from app.router import auth_utils
+
+    migrated = create_engine(f"sqlite:///{tmp_path / 'verify.db'}")
+    with pytest.raises(Exception):
+        database.verify_schema(migrated)  # never migrated: no alembic_version table
+
+    head, = database.expected_revisions()
+    with migrated.begin() as conn:
+        conn.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)"))
+        conn.execute(text("INSERT INTO alembic_version VALUES ('e7fe0007d4ea')"))
+    with pytest.raises(RuntimeError, match="alembic upgrade head"):
+        database.verify_schema(migrated)
+    with migrated.begin() as conn:
+        conn.execute(text("UPDATE alembic_version SET version_num = :head"), {"head": head})
+    database.verify_schema(migrated)
+
+    monkeypatch.setattr(database, "SCHEMA_REVISION", "somewhere_else")
+    with pytest.raises(RuntimeError):
+        database.verify_schema(migrated)
+
+    assert database.warm_pool(migrated, 3) == 3
+    assert migrated.pool.checkedin() == 3
+    migrated.dispose()
+
+    assert auth_utils.verify_password("secret", auth_utils.hash_password("secret"))
+    assert auth_utils.get_pwd_context() is auth_utils.get_pwd_context()
+
+
+def test_danger_zone_pings(client, monkeypatch):
+    from app import geofence
+
+    user_headers = login(client, "normaluser", "userpassword")
+    other_headers = login(client, "updateduser", "newpassword")
+    for i in range(5):
+        client.post("/crime/crimes", json={
+            "crime_type": "Assault",
+            "description": f"Assault near the harbour, report {i} with its own details",
+            "latitude": 64.1466 + i * 0.001,
+            "longitude": -21.9426
+        }, headers=user_headers)
+    monkeypatch.setattr(geofence, "zones", geofence.DangerZones(min_crimes=5))
+    monkeypatch.setattr(geofence, "alert_state", geofence.AlertState())
+
+    harbour = {"latitude": 64.148, "longitude": -21.9426}
+    pings = {"pings": [{"latitude": 64.5, "longitude": -20.0}, harbour, harbour]}
+    response = client.post("/alerts/pings", json=pings, headers=user_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["checked"] == 3 and [a["ping_index"] for a in body["alerts"]] == [1]
+    zone = body["alerts"][0]["zone"]
+    assert zone["crime_count"] >= 5
+    assert zone["min_lat"] <= harbour["latitude"] <= zone["max_lat"]
+    assert zone["min_lng"] <= harbour["longitude"] <= zone["max_lng"]
+
+    # already warned about this zone; someone else still is
+    assert client.post("/alerts/pings", json={"pings": [harbour]}, headers=user_headers).json()["alerts"] == []
+    assert len(client.post("/alerts/pings", json={"pings": [harbour]}, headers=other_headers).json()["alerts"]) == 1
+
+    monkeypatch.setattr(geofence, "GEOFENCE_MAX_PINGS", 2)
+    assert client.post("/alerts/pings", json={"pings": [harbour] * 3}, headers=user_headers).status_code == 400
+    assert client.post("/alerts/pings", json={"pings": [{"latitude": 91, "longitude": 0}]},
+                       headers=user_headers).status_code == 422
+    assert client.post("/alerts/pings", json={"pings": [harbour]}).status_code == 401
+
+    state = geofence.AlertState(capacity=2, cooldown=60)
+    assert state.should_alert(1, 10, now=0) and not state.should_alert(1, 10, now=30)
+    assert state.should_alert(1, 10, now=61)
+    assert state.should_alert(1, 11, now=62) and state.should_alert(1, 12, now=63)
+    assert len(state) == 2 and state.should_alert(1, 10, now=64)  # evicted, so alerted again
+
+
+def test_shared_index_snapshots(tmp_path):
+    import time
+    import numpy as np
+    from datetime import datetime, UTC
+    from app.geofence import DangerZones
+    from app.nearest import NearestIndex
+    from app.snapshots import Snapshots, SnapshotStore
+
+    rnd = np.random.default_rng(5)
+    n = 2000
+    lat, lng = rnd.uniform(-60, 60, n), rnd.uniform(-170, 170, n)
+    lat[:10], lng[:10] = 10 + np.arange(10) / 1e3, 10
+    types = list(rnd.choice(["Theft", "Assault"], n))
+    created = rnd.integers(0, 1000, n)
+    publisher, worker, reference = NearestIndex(), NearestIndex(), NearestIndex()
+    publisher.load(list(range(n)), types, lat, lng, created, source_time=time.time())
+    publisher.remove(0)  # folded into the published tree
+    reference.load(list(range(1, n)), types[1:], lat[1:], lng[1:], created[1:])
+    hot = DangerZones(min_crimes=3)
+    hot.load(lat, lng)
+
+    store = SnapshotStore(str(tmp_path), keep=2)
+    publishing, serving = Snapshots(store), Snapshots(store)
+    publishing.register("nearest", lambda db: None, publisher)
+    publishing.register("danger_zones", lambda db: None, hot)
+    zones = DangerZones(min_crimes=3)
+    serving.register("nearest", lambda db: None, worker)
+    serving.register("danger_zones", lambda db: None, zones)
+    assert serving.refresh() == 0  # nothing published yet
+
+    publishing.publish_all(None)
+    assert serving.refresh() == 2 and serving.refresh() == 0
+    assert isinstance(worker._tree.xyz, np.memmap) and isinstance(publisher._tree.xyz, np.memmap)
+    assert worker.nearest(10, 10, 20) == reference.nearest(10, 10, 20)
+    assert worker.nearest(10, 10, 5, "theft") == reference.nearest(10, 10, 5, "theft")
+    assert len(zones) == len(hot) > 0
+    assert zones.lookup(float(lat[1]), float(lng[1])) == hot.lookup(float(lat[1]), float(lng[1]))
+
+    # writes this worker saw survive a snapshot that was read before them...
+    worker.add(n, "Theft", 10, 10, datetime.now(UTC))
+    worker.remove(1)
+    publishing.publish_all(None)
+    assert serving.refresh() == 2
+    got = [crime_id for crime_id, _ in worker.nearest(10, 10, 3)]
+    assert got[0] == n and 1 not in got
+
+    # ...and are dropped once a snapshot is newer than them
+    publisher.load(list(range(n)), types, lat, lng, created, source_time=time.time() + 120)
+    publishing.publish_all(None)
+    assert serving.refresh() == 2
+    assert [crime_id for crime_id, _ in worker.nearest(10, 10, 2)] == [0, 1]
+    assert len([p for p in (tmp_path / "nearest").iterdir() if p.name != "CURRENT"]) == 2
+
+    # published with other settings: keep the local table
+    other = DangerZones(min_crimes=10)
+    other.install(*hot.export())
+    assert len(other) == 0
+
+
+def test_analytics_snapshot(client, monkeypatch):
+    from app import analytics
+
+    admin_headers = login(client, "adminuser", "adminpassword")
+    user_headers = login(client, "normaluser", "userpassword")
+    snapshot = analytics.AnalyticsSnapshot()
+    monkeypatch.setattr(analytics, "snapshot", snapshot)
+
+    def both(**params):
+        served = client.get("/admin/statistics", params=params, headers=admin_headers).json()
+        monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", False)
+        queried = client.get("/admin/statistics", params=params, headers=admin_headers).json()
+        monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", True)
+        return served, queried
+
+    def same(served, queried):
+        assert served["total_reports"] == queried["total_reports"]
+        # ties may come back in either order
+        assert [t["count"] for t in served["top_crime_types"]] == [t["count"] for t in queried["top_crime_types"]]
+        assert [h["crime_count"] for h in served["hotspots"]] == [h["crime_count"] for h in queried["hotspots"]]
+        top = served["hotspots"][0]["location"], queried["hotspots"][0]["location"]
+        if served["hotspots"][0]["crime_count"] > served["hotspots"][1]["crime_count"]:
+            assert top[0]["latitude"] == pytest.approx(top[1]["latitude"], abs=1e-5)
+
+    for i in range(3):
+        client.post("/crime/crimes", json={
+            "crime_type": "Pickpocketing",
+            "description": f"Wallet lifted on the tram, report {i} of the afternoon",
+            "latitude": -33.86882,
+            "longitude": 151.20929
+        }, headers=user_headers)
+    same(*both())
+    same(*both(collapse_duplicates=True))
+    same(*both(since="2000-01-01T00:00:00", until="2100-01-01T00:00:00"))
+    assert snapshot.rebuilds == 1
+
+    status = client.get("/admin/analytics", headers=admin_headers).json()
+    assert status["rows"] == both()[1]["total_reports"] and status["bytes_per_row"] == 30
+
+    # writes are patched in from the change log, not rebuilt
+    crime_id = client.post("/crime/crimes", json={
+        "crime_type": "Pickpocketing",
+        "description": "Phone taken from a back pocket at the station",
+        "latitude": -33.8831,
+        "longitude": 151.2065
+    }, headers=user_headers).json()["crime"][0]["crime_id"]
+    served, queried = both()
+    same(served, queried)
+    assert served["total_reports"] == status["rows"] + 1
+    client.delete(f"/crime/crime/{crime_id}", headers=user_headers)
+    same(*both())
+    assert snapshot.rebuilds == 1 and snapshot.refreshes == 2
+
+    # a cursor the log no longer covers means starting over
+    snapshot.cursor = -5
+    same(*both())
+    assert snapshot.rebuilds == 2
+    assert client.get("/admin/analytics", headers=user_headers).status_code == 403
+
+
+def test_crime_trends(client, monkeypatch):
+    from datetime import datetime, timedelta, UTC
+    from app import analytics, models, trends
+
+    now = datetime.now(UTC).replace(tzinfo=None)
+    db = TestingSessionLocal()
+    user_id = db.query(models.Users).filter(models.Users.username == "normaluser").first().user_id
+    for age, hidden in ((timedelta(hours=1), False), (timedelta(minutes=70), False), (timedelta(days=3), False),
+                        (timedelta(days=20), False), (timedelta(days=2), True), (timedelta(days=60), False)):
+        db.add(models.Crimes(user_id=user_id, crime_type="Carjacking", description="Car taken at a red light",
+                             latitude=-1.2921, longitude=36.8219, created_at=now - age, is_hidden=hidden))
+    db.commit()
+    db.close()
+    monkeypatch.setattr(analytics, "snapshot", analytics.AnalyticsSnapshot())
+
+    def series(**params):
+        response = client.get("/crime/trends", params={"crime_type": "Carjacking", **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    body = series()
+    assert body["source"] == "snapshot" and body["bucket"] == "day" and body["step_seconds"] == 86400
+    assert body["total"] == 4 and len(body["counts"]) in (30, 31) and sum(body["counts"][-2:]) >= 2
+    start = datetime.fromisoformat(body["start"])
+    assert start == trends.bucket_start(now - timedelta(days=30), "day")
+    assert body["counts"][(now - timedelta(days=20) - start) // timedelta(days=1)] == 1
+
+    # the database and the snapshot agree for every bucket width
+    windows = {"hour": timedelta(days=5), "day": timedelta(days=30), "week": timedelta(days=90)}
+    for bucket, window in windows.items():
+        params = {"bucket": bucket, "since": (now - window).isoformat()}
+        monkeypatch.setattr(trends, "TRENDS_SNAPSHOT_AFTER_DAYS", 0)
+        from_snapshot = series(**params)
+        monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", False)
+        from_database = series(**params)
+        monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", True)
+        assert (from_snapshot["source"], from_database["source"]) == ("snapshot", "database")
+        assert from_snapshot["counts"] == from_database["counts"] and from_snapshot["start"] == from_database["start"]
+    assert series(bucket="week", since=(now - timedelta(days=90)).isoformat())["total"] == 5
+    assert datetime.fromisoformat(series(bucket="week")["start"]).weekday() == 0
+
+    box = {"min_lat": -1.3, "min_lng": 36.8, "max_lat": -1.2, "max_lng": 36.9}
+    assert series(**box)["total"] == 4
+    assert series(**{**box, "min_lat": -1.25})["total"] == 0
+    assert client.get("/crime/trends", params={"min_lat": 1}).status_code == 400
+    assert client.get("/crime/trends", params={"bucket": "hour", "since": "2020-01-01T00:00:00"}).status_code == 400
+    assert client.get("/crime/trends", params={"bucket": "minute"}).status_code == 422
+
+
+def test_idempotency_keys(client, monkeypatch):
+    import asyncio
+    from starlette.requests import Request
+    from starlette.responses import StreamingResponse
+    from app import idempotency, models
+
+    monkeypatch.setattr(idempotency, "store", idempotency.IdempotencyStore(TestingSessionLocal))
+    headers = login(client, "normaluser", "userpassword")
+    report = {
+        "crime_type": "Burglary",
+        "description": "Side door forced overnight, tools missing from the shed",
+        "latitude": 45.4642,
+        "longitude": 9.19
+    }
+
+    first = client.post("/crime/crimes", json=report, headers={**headers, "Idempotency-Key": "report-1"})
+    retry = client.post("/crime/crimes", json=report, headers={**headers, "Idempotency-Key": "report-1"})
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() and retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    # a retry after a token refresh is the same caller
+    refreshed = login(client, "normaluser", "userpassword")
+    assert refreshed != headers
+    retry = client.post("/crime/crimes", json=report, headers={**refreshed, "Idempotency-Key": "report-1"})
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    db = TestingSessionLocal()
+    assert db.query(models.Crimes).filter(models.Crimes.description == report["description"]).count() == 1
+    db.close()
+    crime_id = first.json()["crime"][0]["crime_id"]
+
+    # same key, different request
+    changed = client.post("/crime/crimes", json={**report, "latitude": 45.0},
+                          headers={**headers, "Idempotency-Key": "report-1"})
+    assert changed.status_code == 422
+    assert client.post("/crime/crimes", json=report, headers={**headers, "Idempotency-Key": ""}).status_code == 400
+
+    # a retried vote replays the vote instead of failing the duplicate check
+    vote = f"/vote/crimes/{crime_id}/vote"
+    first = client.post(vote, json={"vote_type": "up"}, headers={**headers, "Idempotency-Key": "vote-1"})
+    retry = client.post(vote, json={"vote_type": "up"}, headers={**headers, "Idempotency-Key": "vote-1"})
+    assert first.status_code == retry.status_code == 200 and retry.json() == first.json()
+    assert client.post(vote, json={"vote_type": "up"}, headers=headers).status_code == 400
+
+    # concurrent duplicates on one worker run the handler once
+    calls = []
+
+    async def handler(request):
+        calls.append(await request.body())
+        await asyncio.sleep(0.05)
+        return StreamingResponse(iter([b'{"sent": true}']), media_type="application/json")
+
+    def request():
+        scope = {"type": "http", "method": "POST", "path": "/sos/send_sos", "query_string": b"",
+                 "headers": [(b"idempotency-key", b"sos-1"), (b"authorization", b"Bearer t")],
+                 "client": ("10.1.1.1", 5000)}
+
+        async def receive():
+            return {"type": "http.request", "body": b'{"message": "help"}', "more_body": False}
+        return Request(scope, receive)
+
+    async def burst():
+        return await asyncio.gather(*(idempotency.idempotency(request(), handler) for _ in range(5)))
+
+    responses = asyncio.run(burst())
+    assert len(calls) == 1 and calls[0] == b'{"message": "help"}'
+    assert all(r.status_code == 200 and r.body == b'{"sent": true}' for r in responses)
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 4
+
+    # across workers: a second claim waits on the row, and a stale claim is taken over
+    store = idempotency.IdempotencyStore(TestingSessionLocal, pending_timeout=60)
+    assert store.claim("k" * 64, "f") == ("new", None)
+    assert store.claim("k" * 64, "f") == ("pending", None)
+    assert store.claim("k" * 64, "g") == ("mismatch", None)
+    assert idempotency.IdempotencyStore(TestingSessionLocal, pending_timeout=-1).claim("k" * 64, "f") == ("new", None)
+    store.complete("k" * 64, idempotency.StoredResponse(201, "text/plain", b"made"))
+    assert store.claim("k" * 64, "f") == ("done", idempotency.StoredResponse(201, "text/plain", b"made"))
+    assert idempotency.IdempotencyStore(TestingSessionLocal, ttl=-1).claim("e" * 64, "f") == ("new", None)
+    db = TestingSessionLocal()
+    assert idempotency.prune(db) == 1
+    db.close()
+
+
+def test_single_flight_reads(client, monkeypatch):
+    import asyncio
+    from starlette.requests import Request
+    from starlette.responses import StreamingResponse
+    from app import replicas, single_flight
+
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.query)
+        await asyncio.sleep(0.05)
+        return StreamingResponse(iter([b"[", b"]"]), media_type="application/json", headers={"X-Rows": "0"})
+
+    def request(path, query, authorization=b"Bearer reader"):
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": query,
+                 "headers": [(b"authorization", authorization)], "client": ("10.2.2.2", 5000)}
+        return Request(scope)
+
+    async def burst(*requests):
+        return await asyncio.gather(*(single_flight.single_flight(r, handler) for r in requests))
+
+    # the same query spelled differently shares one flight; a different one gets its own
+    stats = single_flight.Stats()
+    monkeypatch.setattr(single_flight, "stats", stats)
+    same = [b"lat=6.5&lng=3.3&radius=2", b"lng=3.30&radius=2.0&lat=6.50", b"lat=6.5&lng=3.3&radius=2"]
+    responses = asyncio.run(burst(*(request("/crime/crime", q) for q in same + [b"lat=7&lng=3.3&radius=2"])))
+    assert len(calls) == 2 and (stats.leaders, stats.coalesced) == (2, 2)
+    assert all(r.status_code == 200 and r.body == b"[]" and r.headers["X-Rows"] == "0" for r in responses)
+
+    # a caller who just wrote reads from the primary and does not join a flight of replica reads
+    calls.clear()
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([]))
+    replicas.router.mark_write("Bearer writer")
+    asyncio.run(burst(request("/vote/crimes/1/votes", b""), request("/vote/crimes/1/votes", b"", b"Bearer writer"),
+                      request("/vote/crimes/1/votes", b"")))
+    assert len(calls) == 2
+    # nor a primary read that started before their write
+    calls.clear()
+
+    async def writes_then_reads():
+        await asyncio.sleep(0.01)
+        replicas.router.mark_write("Bearer late")
+        return await single_flight.single_flight(request("/vote/crimes/1/votes", b"", b"Bearer late"), handler)
+
+    async def racing():
+        return await asyncio.gather(single_flight.single_flight(request("/vote/crimes/1/votes", b"", b"Bearer writer"),
+                                                                handler), writes_then_reads())
+    asyncio.run(racing())
+    assert len(calls) == 2
+    # not covered: writes and other routes run every time
+    calls.clear()
+    asyncio.run(burst(request("/crime/batch", b"ids=1"), request("/crime/batch", b"ids=1")))
+    assert len(calls) == 2
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_ENABLED", False)
+    calls.clear()
+    asyncio.run(burst(request("/crime/crime", b""), request("/crime/crime", b"")))
+    assert len(calls) == 2
+
+    # through the app, responses come back whole
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_ENABLED", True)
+    response = client.get("/crime/crime", params={"crime_type": "Burglary"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    assert all("Burglary" in crime["crime_type"] for crime in response.json())
+
+
+def test_admission_control(client, monkeypatch):
+    import asyncio
+    from app import admission
+
+    assert admission.classify("POST", "/sos/send_sos") == "sos"
+    assert admission.classify("GET", "/sos/alerts") == "admin"
+    assert admission.classify("POST", "/auth/login") == "auth"
+    assert admission.classify("POST", "/crime/crimes") == "writes"
+    assert admission.classify("GET", "/crime/crime") == "reads"
+
+    async def overload():
+        ctl = admission.AdmissionController(initial=1, min_limit=1, max_limit=1, target_latency_ms=50,
+                                            target_queue_ms=50)
+        assert await ctl.acquire("reads")
+        waiting = {name: asyncio.ensure_future(ctl.acquire(name)) for name in ("admin", "reads", "sos")}
+        await asyncio.sleep(0.075)
+        # admin gives up first; the freed slot then goes to SOS although reads queued before it
+        assert waiting["admin"].done() and waiting["admin"].result() is False
+        ctl.release(0.01, saturated=True)
+        await asyncio.sleep(0)
+        assert waiting["sos"].result() is True and not waiting["reads"].done()
+        assert await waiting["reads"] is False
+        assert ctl.status()["shed"] == {"sos": 0, "auth": 0, "writes": 0, "reads": 1, "admin": 1}
+
+        # additive increase while saturated and fast, one multiplicative cut per target latency when slow
+        ctl = admission.AdmissionController(initial=4, min_limit=2, max_limit=8, target_latency_ms=50)
+        for _ in range(4):
+            assert await ctl.acquire("reads")
+        ctl.release(0.01, saturated=True, route="GET /crime/crime")
+        assert ctl.limit == 4.25
+        ctl.release(0.2, saturated=True, route="GET /crime/crime")
+        ctl.release(0.2, saturated=True, route="GET /crime/crime")
+        assert ctl.limit == 4.25 * 0.9
+        for _ in range(2):
+            assert await ctl.acquire("reads")
+        # slow with free slots is not contention; adapting waits for saturation
+        ctl._last_decrease = 0.0
+        ctl.release(0.2, saturated=False, route="GET /crime/crime")
+        assert ctl.limit == 4.25 * 0.9
+        # a route that is always slow is judged against its own baseline
+        ctl.release(0.3, saturated=True, route="POST /media/upload")
+        ctl.release(0.4, saturated=True, route="POST /media/upload")
+        assert ctl.limit > 4.25 * 0.9 and ctl.in_flight == 0
+
+    asyncio.run(overload())
+
+    response = client.get("/admin/admission", headers=login(client, "adminuser", "adminpassword"))
+    assert response.status_code == 200 and response.json()["in_flight"] == 1
+    assert "GET /admin/admission" in admission.controller._baselines
+    response = client.get("/admin/admission", headers=login(client, "normaluser", "userpassword"))
+    assert response.status_code == 403
+
+    # a burst of identical reads shares one flight, which takes the only slot
+    import httpx
+    monkeypatch.setattr(admission, "controller", admission.AdmissionController(initial=1, max_queue=0))
+
+    async def herd():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as herd_client:
+            return await asyncio.gather(*(herd_client.get("/crime/crime", params={"crime_type": "Theft"})
+                                          for _ in range(20)))
+
+    assert [r.status_code for r in asyncio.run(herd())] == [200] * 20
+    assert admission.controller.status()["shed"]["reads"] == 0
+
+    # no slots and no room to queue: shed with 503 before the app runs
+    monkeypatch.setattr(admission, "controller", admission.AdmissionController(initial=0, max_queue=0))
+    response = client.get("/crime/crime")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    assert admission.controller.status()["shed"]["reads"] == 1
+
+
+def test_compression_and_etags(client, monkeypatch):
+    from app import compression, crud
+
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("gzip;q=0, identity") is None
+    assert compression.negotiate("*;q=0.5") == compression.available()[0]
+    assert compression.negotiate("") is None
+
+    admin_headers = login(client, "adminuser", "adminpassword")
+    user_headers = login(client, "normaluser", "userpassword")
+
+    # lists over the threshold go out compressed, large ones compressed on the threadpool
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_BYTES", 64)
+    monkeypatch.setattr(compression, "COMPRESSION_THREADPOOL_BYTES", 256)
+    response = client.get("/crime/crime", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    crimes = response.json()
+    assert "content-encoding" not in client.get("/crime/crime", headers={"Accept-Encoding": "identity"}).headers
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_BYTES", 1 << 30)
+    assert "content-encoding" not in client.get("/crime/crime", headers={"Accept-Encoding": "gzip"}).headers
+
+    # the crime list revalidates until a report changes it
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert client.get("/crime/crime", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/crime/crimes", json={"crime_type": "Theft", "description": "Phone snatched",
+                                       "latitude": 6.45, "longitude": 3.39}, headers=user_headers)
+    response = client.get("/crime/crime", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.json()) == len(crimes) + 1
+    assert response.headers["etag"] != etag
+
+    # a vote moves scores without touching updated_at, and still changes the tag
+    etag = response.headers["etag"]
+    newest = max(crime["crime_id"] for crime in response.json())
+    response = client.post(f"/vote/crimes/{newest}/vote", json={"vote_type": "up"},
+                           headers=login(client, "updateduser", "newpassword"))
+    assert response.status_code == 200
+    assert client.get("/crime/crime", headers={"If-None-Match": etag}).status_code == 200
+
+    # strong tags name the encoding; the suffixed tag still matches
+    monkeypatch.setattr(compression, "COMPRESSION_MIN_BYTES", 64)
+    response = client.get("/admin/crimes/flagged", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    etag = response.headers["etag"]
+    assert etag.endswith('-gzip"') and not etag.startswith("W/")
+    assert response.headers["cache-control"] == "private, no-cache"
+    response = client.get("/admin/crimes/flagged", headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag and not response.content
+
+    # the SOS list answers a revalidation without running the list query
+    etag = client.get("/sos/sos_alerts", headers=admin_headers).headers["etag"]
+
+    def unexpected(*args):
+        raise AssertionError("list query ran")
+
+    monkeypatch.setattr(crud, "get_all_sos_alerts", unexpected)
+    assert client.get("/sos/sos_alerts", headers={**admin_headers, "If-None-Match": etag}).status_code == 304
+    monkeypatch.undo()
+    client.post("/sos/send_sos", json={"message": "Help", "latitude": 6.5, "longitude": 3.4}, headers=user_headers)
+    assert client.get("/sos/sos_alerts", headers={**admin_headers, "If-None-Match": etag}).status_code == 200